@@ -0,0 +1,404 @@
+""" Local stand-in for the HuggingFace Inference API, with configurable latency, token rate and error rate """
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator
+
+
+# Vocabulary of the generated responses, Markdown with code so rendering is realistic
+WORDS = (
+    "The function `parse` reads the input and returns a **list** of tokens. "
+    "Consider validating the arguments before use:\n\n```python\n"
+    "def parse(text: str) -> list:\n    return text.split()\n```\n\n"
+    "- Add type hints\n- Handle empty input\n- Document the return value\n\n"
+).split(" ")
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Server that speaks the subset of the TGI protocol used by CodeStar.
+
+    Serves `POST /v1/chat/completions` (chat, optionally streamed as server-sent
+    events), `POST /v1/completions` (OpenAI-style completions) and `POST /` (text
+    generation), and counts requests, errors and tokens.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.05,
+        token_rate: float = 200.0,
+        error_rate: float = 0.0,
+        tokens: int = 64,
+        seed: int = 0,
+        max_best_of: int = 2,
+    ) -> None:
+        """
+        Args:
+            port (int): Port to listen on, 0 picks a free one.
+            latency (float): Seconds before the first token.
+            token_rate (float): Generated tokens per second, 0 for instant responses.
+            error_rate (float): Fraction of requests answered with a 503.
+            tokens (int): Maximum number of tokens of a response.
+            seed (int): Seed of the error injection, for reproducible runs.
+            max_best_of (int): Maximum number of sequences of a request, like TGI.
+        """
+
+        super().__init__(("127.0.0.1", port), Handler)
+
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.tokens = tokens
+        self.max_best_of = max_best_of
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.generated = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def counters(self) -> Dict[str, int]:
+        """
+        Snapshot the counters.
+
+        Returns:
+            Dict[str, int]: Requests, injected errors and generated tokens.
+        """
+
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "tokens": self.generated,
+            }
+
+    def start(self) -> "MockServer":
+        """
+        Serve in a background thread.
+
+        Returns:
+            MockServer
+        """
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+        return self
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler of the mock server"""
+
+    server: MockServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_json(self, status: int, body: Any, **headers: str) -> None:
+        data = json.dumps(body).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(data)
+
+    def generate(self, limit: int, offset: int = 0) -> Iterator[str]:
+        """
+        Generate tokens at the configured rate.
+
+        Args:
+            limit (int): Maximum number of tokens requested by the client.
+            offset (int): Index of the first word, to vary sampled sequences.
+
+        Yields:
+            str: Tokens.
+        """
+
+        time.sleep(self.server.latency)
+
+        for index in range(min(limit, self.server.tokens)):
+            if index and self.server.token_rate > 0:
+                time.sleep(1 / self.server.token_rate)
+
+            with self.server.lock:
+                self.server.generated += 1
+
+            yield WORDS[(offset + index) % len(WORDS)] + " "
+
+    def do_POST(self) -> None:
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        with self.server.lock:
+            self.server.requests += 1
+            failed = self.server.random.random() < self.server.error_rate
+            self.server.errors += failed
+
+        if failed:
+            self.send_json(
+                503, {"error": "Model is overloaded"}, **{"Retry-After": "0"}
+            )
+            return
+
+        if self.path.rstrip("/").endswith("/v1/chat/completions"):
+            self.chat(payload)
+
+        elif self.path.rstrip("/").endswith("/v1/completions"):
+            self.completions(payload)
+
+        else:
+            self.text_generation(payload)
+
+    def chat(self, payload: Dict[str, Any]) -> None:
+        limit = payload.get("max_tokens") or self.server.tokens
+        prompt_tokens = sum(
+            len(str(message["content"])) // 4 for message in payload["messages"]
+        )
+        response = {
+            "id": "mock",
+            "created": int(time.time()),
+            "model": "mock",
+            "system_fingerprint": "mock",
+        }
+
+        if not payload.get("stream"):
+            text = "".join(self.generate(limit))
+            self.send_json(
+                200,
+                {
+                    **response,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "length",
+                            "logprobs": None,
+                            "message": {"role": "assistant", "content": text},
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": len(text.split(" ")) - 1,
+                        "total_tokens": prompt_tokens + len(text.split(" ")) - 1,
+                    },
+                },
+            )
+            return
+
+        self.start_events()
+
+        for token in self.generate(limit):
+            self.send_event(
+                {
+                    **response,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": None,
+                            "logprobs": None,
+                            "delta": {"role": "assistant", "content": token},
+                        }
+                    ],
+                }
+            )
+
+        self.send_event("[DONE]")
+        self.end_events()
+
+    def completions(self, payload: Dict[str, Any]) -> None:
+        limit = payload.get("max_tokens") or 16
+        response = {"id": "mock", "created": int(time.time()), "model": "mock"}
+
+        if not payload.get("stream"):
+            choices = []
+
+            for index in range(payload.get("n") or 1):
+                tokens = list(
+                    self.generate(limit, self.server.random.randrange(len(WORDS)))
+                )
+                logprobs = {
+                    "tokens": tokens,
+                    "token_logprobs": [-self.server.random.random() for _ in tokens],
+                }
+                choices.append(
+                    {
+                        "index": index,
+                        "text": "".join(tokens),
+                        "finish_reason": "length",
+                        "logprobs": logprobs if payload.get("logprobs") else None,
+                    }
+                )
+
+            self.send_json(200, {**response, "choices": choices})
+            return
+
+        self.start_events()
+
+        for token in self.generate(limit):
+            self.send_event(
+                {
+                    **response,
+                    "choices": [{"index": 0, "text": token, "finish_reason": None}],
+                }
+            )
+
+        self.send_event("[DONE]")
+        self.end_events()
+
+    def text_generation(self, payload: Dict[str, Any]) -> None:
+        parameters = payload.get("parameters", {})
+        limit = parameters.get("max_new_tokens") or 20
+        best_of = parameters.get("best_of") or 1
+
+        if best_of > self.server.max_best_of:
+            self.send_json(
+                422,
+                {
+                    "error": f"`best_of` must be <= {self.server.max_best_of}",
+                    "error_type": "validation",
+                },
+            )
+            return
+
+        if not payload.get("stream") and not parameters.get("details"):
+            self.send_json(200, [{"generated_text": "".join(self.generate(limit))}])
+            return
+
+        if not payload.get("stream"):
+            # Sequences are sampled in one batch, only the first one takes time
+            offset = self.server.random.randrange(len(WORDS))
+            first = list(self.generate(limit, offset))
+            sequences = [first] + [
+                [
+                    WORDS[(offset + 3 * index + position) % len(WORDS)] + " "
+                    for position in range(len(first))
+                ]
+                for index in range(1, best_of)
+            ]
+
+            with self.server.lock:
+                self.server.generated += len(first) * (best_of - 1)
+
+            details = [
+                {
+                    "finish_reason": "length",
+                    "generated_text": "".join(tokens),
+                    "generated_tokens": len(tokens),
+                    "prefill": [],
+                    "tokens": [
+                        {
+                            "id": position,
+                            "text": token,
+                            "logprob": -self.server.random.random(),
+                            "special": False,
+                        }
+                        for position, token in enumerate(tokens)
+                    ],
+                }
+                for tokens in sequences
+            ]
+            best = details[0]
+            self.send_json(
+                200,
+                [
+                    {
+                        "generated_text": best.pop("generated_text"),
+                        "details": {**best, "best_of_sequences": details[1:] or None},
+                    }
+                ],
+            )
+            return
+
+        self.start_events()
+
+        for index, token in enumerate(self.generate(limit)):
+            self.send_event(
+                {
+                    "index": index,
+                    "token": {
+                        "id": index,
+                        "text": token,
+                        "logprob": 0.0,
+                        "special": False,
+                    },
+                    "generated_text": None,
+                    "details": None,
+                }
+            )
+
+        self.end_events()
+
+    def start_events(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, data: Any) -> None:
+        event = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+        body = event.encode("utf-8")
+
+        self.wfile.write(f"{len(body):x}\r\n".encode("ascii") + body + b"\r\n")
+        self.wfile.flush()
+
+    def end_events(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def main() -> None:
+    """Run the mock server until interrupted."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds before the first token."
+    )
+    parser.add_argument(
+        "--token-rate", type=float, default=200.0, help="Generated tokens per second."
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of failed requests."
+    )
+    parser.add_argument(
+        "--tokens", type=int, default=64, help="Maximum tokens of a response."
+    )
+    parser.add_argument(
+        "--max-best-of", type=int, default=2, help="Maximum sequences of a request."
+    )
+    options = parser.parse_args()
+
+    server = MockServer(
+        options.port,
+        options.latency,
+        options.token_rate,
+        options.error_rate,
+        options.tokens,
+        max_best_of=options.max_best_of,
+    )
+    print(f"Mock inference server listening on {server.url}")
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
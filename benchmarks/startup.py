@@ -0,0 +1,126 @@
+""" Startup benchmark: wall time and import cost of the CLI """
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+
+def run(args: List[str]) -> float:
+    """
+    Run the CLI once.
+
+    Args:
+        args (List[str]): CLI arguments.
+
+    Returns:
+        float: Wall time, in milliseconds.
+    """
+
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "code_star_cli", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    return (time.perf_counter() - start) * 1000
+
+
+def import_times(args: List[str]) -> Dict[str, int]:
+    """
+    Collect the cumulative import time of every module with `python -X importtime`.
+
+    Args:
+        args (List[str]): CLI arguments.
+
+    Returns:
+        Dict[str, int]: Module name -> cumulative import time, in microseconds.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "code_star_cli", *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs.")
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of imports to list."
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    parser.add_argument(
+        "--max-ms", type=float, help="Fail if the median wall time exceeds this."
+    )
+    parser.add_argument(
+        "args", nargs="*", default=["--help"], help="CLI arguments to benchmark."
+    )
+    options = parser.parse_args()
+
+    # Warm up the bytecode cache
+    run(options.args)
+
+    timings = [run(options.args) for _ in range(options.runs)]
+    imports = import_times(options.args)
+    top = sorted(imports.items(), key=lambda item: item[1], reverse=True)[: options.top]
+    results = {
+        "args": options.args,
+        "runs": options.runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "max_ms": round(max(timings), 1),
+        "modules": len(imports),
+        "heavy_modules_loaded": sorted(
+            module
+            for module in ("huggingface_hub", "requests", "rich.live")
+            if module in imports
+        ),
+        "top_imports_us": dict(top),
+    }
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+
+    else:
+        print(f"code-star {' '.join(options.args)}")
+        print(
+            f"  wall time: median {results['median_ms']} ms, "
+            f"min {results['min_ms']} ms, max {results['max_ms']} ms"
+        )
+        print(f"  modules imported: {results['modules']}")
+        print(f"  heavy modules loaded: {results['heavy_modules_loaded'] or 'none'}")
+        print("  slowest imports (cumulative):")
+
+        for module, cumulative in top:
+            print(f"    {cumulative / 1000:8.1f} ms  {module}")
+
+    if options.max_ms is not None and results["median_ms"] > options.max_ms:
+        sys.exit(
+            f"Median startup time {results['median_ms']} ms exceeds {options.max_ms} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
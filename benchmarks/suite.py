@@ -0,0 +1,377 @@
+""" Offline benchmark suite: drives every command through a local mock inference server """
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from mock_server import MockServer
+
+
+# Invocations of each command, run inside the generated workspace
+COMMANDS: Dict[str, Tuple[List[str], Optional[str]]] = {
+    "ai": (["ai", "Explain this code", "-c", "src/module_0.py"], None),
+    "chat": (["chat", "-e", "chat.json"], "Explain recursion\nexit\n"),
+    "completions": (["completions", "def fibonacci(n):"], None),
+    "scan": (["scan", "src/module_0.py"], None),
+    "review": (["review", "src/module_0.py"], None),
+    "enhance": (["enhance", "src/module_0.py"], None),
+    "document": (["document", "src/module_0.py"], None),
+    "test": (["test", "src/module_0.py"], None),
+}
+
+# Template of the generated source files
+MODULE = """
+def parse_{index}(text):
+    tokens = []
+    for word in text.split():
+        if word:
+            tokens.append(word.strip())
+    return tokens
+
+
+class Store{index}:
+    def __init__(self, path):
+        self.path = path
+        self.items = {{}}
+
+    def add(self, key, value):
+        self.items[key] = value
+        return len(self.items)
+"""
+
+
+def run(
+    args: List[str],
+    cwd: Path,
+    env: Dict[str, str],
+    stdin: Optional[str],
+    server: Optional[MockServer] = None,
+) -> Tuple[float, float]:
+    """
+    Run the CLI once.
+
+    Commands report most failures, e.g. of a request, as an error message and exit
+    successfully, so a run only counts if it printed no error and, given the server,
+    sent it a request.
+
+    Args:
+        args (List[str]): CLI arguments.
+        cwd (Path): Working directory.
+        env (Dict[str, str]): Environment.
+        stdin (str, optional): Input of interactive commands.
+        server (MockServer, optional): Server the command is expected to query.
+
+    Returns:
+        Tuple[float, float]: Wall time in milliseconds, peak RSS in MiB.
+
+    Raises:
+        RuntimeError: The run failed.
+    """
+
+    requests = server.counters()["requests"] if server else 0
+
+    # Files instead of pipes, the output is read after the process is reaped by wait4
+    with tempfile.TemporaryFile() as output:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "code_star_cli", *args],
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+        )
+        process.stdin.write((stdin or "").encode("utf-8"))  # type: ignore[union-attr]
+        process.stdin.close()  # type: ignore[union-attr]
+
+        # wait4 reports the resource usage of this child only
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = (time.perf_counter() - start) * 1000
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        output.seek(0)
+        text = output.read().decode("utf-8", errors="replace")
+
+    command = f"code-star {' '.join(args)}"
+
+    if process.returncode:
+        raise RuntimeError(f"{command} exited with {process.returncode}")
+
+    errors = [line for line in text.splitlines() if line.lstrip().startswith("Error")]
+
+    if errors:
+        raise RuntimeError(f"{command} failed: {errors[0].strip()}")
+
+    if server and server.counters()["requests"] == requests:
+        raise RuntimeError(f"{command} sent no request to the server")
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    return elapsed, rss
+
+
+def latencies(timings: List[float]) -> Dict[str, float]:
+    """
+    Summarise wall times.
+
+    Args:
+        timings (List[float]): Wall times, in milliseconds.
+
+    Returns:
+        Dict[str, float]
+    """
+
+    ordered = sorted(timings)
+
+    return {
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, round(0.95 * len(ordered)))], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    """
+    Get the commit of the benchmarked tree.
+
+    Returns:
+        Optional[str]
+    """
+
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+
+    return result.stdout.strip() or None
+
+
+def benchmark(options: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the suite.
+
+    Args:
+        options (argparse.Namespace): Parsed arguments.
+
+    Returns:
+        Dict[str, Any]: The results.
+    """
+
+    server = MockServer(
+        latency=options.latency,
+        token_rate=options.token_rate,
+        error_rate=options.error_rate,
+        tokens=options.tokens,
+    ).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        workspace = Path(directory)
+        (workspace / "src").mkdir()
+
+        for index in range(options.files):
+            (workspace / "src" / f"module_{index}.py").write_text(
+                MODULE.format(index=index), encoding="utf-8"
+            )
+
+        # Isolate the runs from the user's configuration, cache and daemon
+        env = {
+            **os.environ,
+            "CODE_STAR_CONFIG": str(workspace / "config.toml"),
+            "CODE_STAR_ENDPOINT": server.url,
+            "CODE_STAR_CACHE_DIR": str(workspace / "cache"),
+            "CODE_STAR_NO_CACHE": "1",
+            "CODE_STAR_NO_DAEMON": "1",
+            "COLUMNS": "100",
+        }
+        results: Dict[str, Any] = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": sys.platform,
+            "server": {
+                "latency": options.latency,
+                "token_rate": options.token_rate,
+                "error_rate": options.error_rate,
+                "tokens": options.tokens,
+            },
+            "runs": options.runs,
+        }
+
+        # Warm up the bytecode cache
+        run(["--help"], workspace, env, None)
+
+        startup = [run(["--help"], workspace, env, None) for _ in range(options.runs)]
+        results["startup"] = {
+            **latencies([timing for timing, _ in startup]),
+            "peak_rss_mb": round(max(rss for _, rss in startup), 1),
+        }
+        results["commands"] = {}
+
+        for name in options.commands:
+            args, stdin = COMMANDS[name]
+            before = server.counters()
+            samples = [
+                run(args, workspace, env, stdin, server) for _ in range(options.runs)
+            ]
+            after = server.counters()
+
+            results["commands"][name] = {
+                **latencies([timing for timing, _ in samples]),
+                "peak_rss_mb": round(max(rss for _, rss in samples), 1),
+                "requests": after["requests"] - before["requests"],
+                "errors": after["errors"] - before["errors"],
+            }
+
+        results["throughput"] = {}
+
+        for concurrency in options.concurrency:
+            before = server.counters()
+            elapsed, rss = run(
+                ["scan", "src", "-d", f"reports-{concurrency}", "-j", str(concurrency)],
+                workspace,
+                env,
+                None,
+                server,
+            )
+            after = server.counters()
+
+            results["throughput"][str(concurrency)] = {
+                "seconds": round(elapsed / 1000, 2),
+                "files_per_second": round(options.files / elapsed * 1000, 2),
+                "tokens_per_second": round(
+                    (after["tokens"] - before["tokens"]) / elapsed * 1000, 1
+                ),
+                "peak_rss_mb": round(rss, 1),
+            }
+
+    server.shutdown()
+
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """
+    Compare the results to a baseline, e.g. of the previous commit.
+
+    Args:
+        results (Dict[str, Any]): Results of this run.
+        baseline (Dict[str, Any]): Results of the baseline run.
+
+    Returns:
+        List[str]: One line per metric, with the relative change.
+    """
+
+    if results["server"] != baseline.get("server"):
+        return ["Server settings differ from the baseline, results are not comparable"]
+
+    pairs = [("startup", "p50_ms", results["startup"], baseline["startup"])]
+    pairs += [
+        (name, "p50_ms", values, baseline["commands"][name])
+        for name, values in results["commands"].items()
+        if name in baseline.get("commands", {})
+    ]
+    pairs += [
+        (
+            f"throughput -j {level}",
+            "files_per_second",
+            values,
+            baseline["throughput"][level],
+        )
+        for level, values in results["throughput"].items()
+        if level in baseline.get("throughput", {})
+    ]
+
+    return [
+        f"  {name:<16} {metric:<16} {old[metric]:>10} -> {new[metric]:>10} "
+        f"({(new[metric] - old[metric]) / old[metric] * 100:+.1f}%)"
+        for name, metric, new, old in pairs
+        if old[metric]
+    ]
+
+
+def main() -> None:
+    """Run the suite and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command.")
+    parser.add_argument(
+        "--commands",
+        nargs="+",
+        choices=list(COMMANDS),
+        default=list(COMMANDS),
+        help="Commands to benchmark.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds before the first token."
+    )
+    parser.add_argument(
+        "--token-rate", type=float, default=200.0, help="Generated tokens per second."
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of failed requests."
+    )
+    parser.add_argument(
+        "--tokens", type=int, default=64, help="Maximum tokens of a response."
+    )
+    parser.add_argument(
+        "--files", type=int, default=16, help="Files scanned by the throughput runs."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 4, 8],
+        help="Concurrency levels of the throughput runs.",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    parser.add_argument("--output", type=Path, help="Save the results as JSON.")
+    parser.add_argument(
+        "--compare", type=Path, help="Compare to the results of a previous run."
+    )
+    options = parser.parse_args()
+
+    results = benchmark(options)
+
+    if options.output:
+        options.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+
+    else:
+        print(f"code-star benchmark suite, commit {results['commit']}")
+        print(
+            f"  startup: p50 {results['startup']['p50_ms']} ms, "
+            f"peak RSS {results['startup']['peak_rss_mb']} MiB"
+        )
+
+        for name, values in results["commands"].items():
+            print(
+                f"  {name:<12} p50 {values['p50_ms']:>7} ms  p95 {values['p95_ms']:>7} ms  "
+                f"max {values['max_ms']:>7} ms  peak RSS {values['peak_rss_mb']} MiB"
+            )
+
+        for level, values in results["throughput"].items():
+            print(
+                f"  scan -j {level:<4} {values['files_per_second']:>6} files/s  "
+                f"{values['tokens_per_second']:>7} tokens/s  {values['seconds']} s"
+            )
+
+    if options.compare:
+        print(f"Compared to {options.compare}:")
+        print("\n".join(compare(results, json.loads(options.compare.read_text()))))
+
+
+if __name__ == "__main__":
+    main()
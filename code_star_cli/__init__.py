@@ -1,13 +1,16 @@
 """ CodeStar CLI: CodeStar is an advanced coding assistant powered by StarCoder 2 """
 
-from typing import Optional
-from rich.markdown import Markdown
-from rich.panel import Panel
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from rich.panel import Panel
 
 
 # Constants
 CHAT_LLM = "HuggingFaceH4/starchat2-15b-v0.1"
 COMPLETION_LLM = "bigcode/starcoder2-15b"
+# Fill-in-the-middle prompt of StarCoder 2
+FIM_TEMPLATE = "<fim_prefix>{prefix}<fim_suffix>{suffix}<fim_middle>"
 SYSTEM_MESSAGE = {
     "role": "system",
     "content": "You are CodeStar, an advanced coding assistant powered by StarCoder 2, "
@@ -19,7 +22,7 @@ SYSTEM_MESSAGE = {
 }
 
 
-def create_panel(title: str, content: str, subtitle: Optional[str] = None) -> Panel:
+def create_panel(title: str, content: str, subtitle: Optional[str] = None) -> "Panel":
     """
     Highlight and print the provided code.
 
@@ -32,7 +35,13 @@ def create_panel(title: str, content: str, subtitle: Optional[str] = None) -> Pa
         Panel
     """
 
-    md = Markdown(content, code_theme="lightbulb")
+    # Rendering Markdown is expensive to import, only pay for it when printing
+    from rich.markdown import Markdown
+    from rich.panel import Panel
+    from code_star_cli.metrics import metrics
+
+    with metrics.span("render"):
+        md = Markdown(content, code_theme="lightbulb")
 
     return Panel(
         md,
@@ -1,11 +1,28 @@
 """ Allows to run the CLI using python -m """
 
-from code_star_cli.main import code_star
+import sys
+from code_star_cli.daemon import forward
 
 
 def main() -> None:
     """Entry point function for running the CLI."""
 
+    # Hand the invocation to a running daemon before paying for the CLI imports
+    exit_code = forward(sys.argv[1:])
+
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    from code_star_cli.config import load_error
+    from code_star_cli.main import code_star
+
+    # Before parsing, so that even `--help` does not run with settings it ignored
+    if load_error:
+        from rich import print
+
+        print(f"[bold red]Error[/bold red]: {load_error}")
+        sys.exit(1)
+
     # Run the cli
     code_star(prog_name="code-star")
 
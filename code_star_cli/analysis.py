@@ -0,0 +1,1473 @@
+""" Shared implementation of the file analysis commands """
+
+import asyncio
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
+from rich import print
+from code_star_cli import create_panel, instructions
+from code_star_cli.batch import iter_files, run_batch
+from code_star_cli.budget import Budget, BudgetExceeded, Estimate, budgeting
+from code_star_cli.budget import estimate_cost, estimate_size, schedule
+from code_star_cli.cache import cache_key
+from code_star_cli.chunking import Chunk, estimate_tokens, split_code
+from code_star_cli.coalesce import coalescing
+from code_star_cli.config import settings
+from code_star_cli.diffs import DIFF_INSTRUCTION, Excerpt, diff_changes, excerpts
+from code_star_cli.findings import (
+    FINDINGS_INSTRUCTION,
+    REPAIR_INSTRUCTION,
+    Finding,
+    OutputFormat,
+    dump_findings,
+    format_findings,
+    load_findings,
+    number_lines,
+    parse_findings,
+)
+from code_star_cli.index import CodeIndex, open_index
+from code_star_cli.inference import chat, chat_model
+from code_star_cli.manifest import Manifest, content_digest, git_changed_files
+from code_star_cli.metrics import metrics
+from code_star_cli.patches import FENCED, PATCH_INSTRUCTION
+from code_star_cli.patches import REPAIR_INSTRUCTION as FIX_EDITS
+from code_star_cli.patches import Edit, Patch, apply_edits, format_edit, full_code
+from code_star_cli.patches import parse_edits, unified_diff
+from code_star_cli.streaming import stream_response, sync_chunks
+
+
+# Maximum number of chunks of a single file analysed concurrently
+CHUNK_CONCURRENCY = 4
+
+MERGE_INSTRUCTION = (
+    "The following responses were produced for consecutive parts of the same file, "
+    "in answer to the request below. Merge them into a single coherent response to "
+    "the request, removing duplicates and keeping every distinct finding. Request:"
+)
+
+
+COMBINE_INSTRUCTION = (
+    "Perform each of the following analyses of the code below. Answer each one under "
+    "its own level-2 Markdown heading, written exactly as given, in the given order."
+)
+
+
+class Analysis(str, Enum):
+    """Analyses that `analyze` runs together, named after their commands"""
+
+    SCAN = "scan"
+    REVIEW = "review"
+    ENHANCE = "enhance"
+    DOCUMENT = "document"
+    TEST = "test"
+
+    @property
+    def title(self) -> str:
+        """Heading of the section of the analysis in a combined report"""
+
+        return TITLES[self]
+
+    @property
+    def instruction(self) -> str:
+        """Instruction of the analysis, shared with its command"""
+
+        return instructions.template(self.value)
+
+
+TITLES = {
+    Analysis.SCAN: "Security Scan",
+    Analysis.REVIEW: "Code Review",
+    Analysis.ENHANCE: "Enhancements",
+    Analysis.DOCUMENT: "Documentation",
+    Analysis.TEST: "Tests",
+}
+
+
+class FileReport(NamedTuple):
+    """Report of a file in a batch run"""
+
+    report: str
+    digest: str
+    reused: bool
+    # Edits of a patch that did not apply
+    failed: int = 0
+
+
+def build_messages(
+    instruction: str, code: str, fence: bool = False, context: str = ""
+) -> List[Dict[str, str]]:
+    """
+    Build the chat messages for analysing a piece of code.
+
+    The system message and the instruction come first, and are the same for every
+    file of a batch, so servers with prefix caching process them once.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        fence (bool): Wrap the code in a Markdown code block.
+        context (str): Related code of the repository, placed after the instruction.
+
+    Returns:
+        List[Dict[str, str]]
+    """
+
+    code = f"```\n{code}\n```" if fence else code
+    content = f"{instruction}\n{code}"
+
+    if context:
+        content = f"{instruction}\n\n{context}\n\nCode:\n{code}"
+
+    return [instructions.system_message(), {"role": "user", "content": content}]
+
+
+def chunk_budget(instruction: str, max_tokens: Optional[int]) -> int:
+    """
+    Compute the number of code tokens that fit into a request next to the instruction.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+    Returns:
+        int
+    """
+
+    overhead = estimate_tokens(instructions.template("system") + instruction) + 64
+
+    return max(256, settings.context_tokens - (max_tokens or 0) - overhead)
+
+
+def merge_messages(
+    instruction: str, responses: List[str], max_tokens: Optional[int]
+) -> List[Dict[str, str]]:
+    """
+    Build the reduce request that merges the responses of the chunks of a file.
+
+    If the responses do not fit into a single request, they are merged in groups
+    first, until they do.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        responses (List[str]): Responses of the chunks, in order.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+    Returns:
+        List[Dict[str, str]]
+    """
+
+    budget = chunk_budget(f"{MERGE_INSTRUCTION}\n{instruction}", max_tokens)
+
+    def messages(group: List[str]) -> List[Dict[str, str]]:
+        parts = "\n\n".join(
+            f"### Part {i}\n{response}" for i, response in enumerate(group, 1)
+        )
+
+        return build_messages(f"{MERGE_INSTRUCTION}\n{instruction}\n", parts)
+
+    while True:
+        groups: List[List[str]] = [[]]
+
+        for response in responses:
+            tokens = sum(estimate_tokens(item) for item in groups[-1])
+
+            # Groups take at least two responses so every round makes progress
+            if len(groups[-1]) >= 2 and tokens + estimate_tokens(response) > budget:
+                groups.append([])
+
+            groups[-1].append(response)
+
+        if len(groups) == 1:
+            return messages(groups[0])
+
+        with ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY) as executor:
+            responses = list(
+                executor.map(lambda group: chat(messages(group), max_tokens), groups)
+            )
+
+
+def prepare_messages(
+    instruction: str,
+    code: str,
+    max_tokens: Optional[int],
+    filename: str = "",
+    fence: bool = False,
+    context: str = "",
+) -> List[Dict[str, str]]:
+    """
+    Build the messages for analysing code of any size.
+
+    Code that does not fit into the context window is split into chunks at function
+    and class boundaries, the chunks are analysed concurrently (map) and the returned
+    messages merge their responses (reduce).
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        filename (str): Name of the file, used to detect the language.
+        fence (bool): Wrap the code in a Markdown code block.
+        context (str): Related code of the repository, sent with every chunk.
+
+    Returns:
+        List[Dict[str, str]]
+    """
+
+    with metrics.span("build"):
+        chunks = split_code(
+            code, chunk_budget(f"{context}\n\n{instruction}", max_tokens), filename
+        )
+
+    if len(chunks) == 1:
+        return build_messages(instruction, code, fence, context)
+
+    def analyse_chunk(chunk: Chunk) -> str:
+        return chat(
+            build_messages(
+                f"{instruction}\n(Part of {filename or 'the file'}, "
+                f"lines {chunk.start}-{chunk.end})",
+                chunk.text,
+                fence,
+                context,
+            ),
+            max_tokens,
+        )
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(chunks), CHUNK_CONCURRENCY)
+    ) as executor:
+        responses = list(executor.map(analyse_chunk, chunks))
+
+    return merge_messages(instruction, responses, max_tokens)
+
+
+def find_issues(
+    instruction: str,
+    code: str,
+    path: str,
+    max_tokens: Optional[int],
+    context: str = "",
+) -> List[Finding]:
+    """
+    Analyse code for structured findings.
+
+    Large files are split into chunks like in `prepare_messages`, but no merge request
+    is needed: the findings of each chunk point at their own line numbers, so they are
+    concatenated. A response that is not valid JSON, even after repairs, is sent back
+    to the model once.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        path (str): Path of the file, reported with the findings.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        context (str): Related code of the repository, sent with every chunk.
+
+    Returns:
+        List[Finding]
+
+    Raises:
+        ValueError: If a response does not contain findings after the retry.
+    """
+
+    if not code.strip():
+        return []
+
+    instruction = f"{instruction}\n{FINDINGS_INSTRUCTION}"
+
+    with metrics.span("build"):
+        # Line numbers make the code about a fifth longer
+        budget = chunk_budget(f"{context}\n\n{instruction}", max_tokens) * 4 // 5
+        chunks = split_code(code, budget, path)
+
+    def analyse_chunk(chunk: Chunk) -> List[Finding]:
+        messages = build_messages(
+            instruction, number_lines(chunk.text, chunk.start), True, context
+        )
+
+        return request_findings(messages, path, chunk.start, chunk.end, max_tokens)
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(chunks), CHUNK_CONCURRENCY)
+    ) as executor:
+        results = list(executor.map(analyse_chunk, chunks))
+
+    return [finding for findings in results for finding in findings]
+
+
+def request_findings(
+    messages: List[Dict[str, str]],
+    path: str,
+    first: int,
+    last: int,
+    max_tokens: Optional[int],
+) -> List[Finding]:
+    """
+    Request the findings of numbered lines, sending an invalid response back once.
+
+    Args:
+        messages (List[Dict[str, str]]): Messages of the request.
+        path (str): Path of the file, reported with the findings.
+        first (int): First line sent.
+        last (int): Last line sent.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+
+    Returns:
+        List[Finding]
+
+    Raises:
+        ValueError: If the response does not contain findings after the retry.
+    """
+
+    response = chat(messages, max_tokens)
+
+    try:
+        return parse_findings(response, path, first, last)
+
+    except ValueError as error:
+        repair = [
+            {"role": "assistant", "content": response},
+            {"role": "user", "content": REPAIR_INSTRUCTION.format(error=error)},
+        ]
+
+        return parse_findings(chat(messages + repair, max_tokens), path, first, last)
+
+
+def find_changed_issues(
+    instruction: str,
+    code: str,
+    path: str,
+    changed: Set[int],
+    max_tokens: Optional[int],
+    context: str = "",
+    context_lines: int = 3,
+) -> List[Finding]:
+    """
+    Analyse the changed lines of a file for structured findings.
+
+    Only the changed lines and some lines around them are sent, as numbered excerpts,
+    so the findings point at the lines of the file. Excerpts are packed into as few
+    requests as the context window allows.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code of the file.
+        path (str): Path of the file, reported with the findings.
+        changed (Set[int]): Changed lines, see `diff_changes`.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        context (str): Related code of the repository, sent with every excerpt.
+        context_lines (int): Number of unchanged lines sent around each change.
+
+    Returns:
+        List[Finding]
+
+    Raises:
+        ValueError: If a response does not contain findings after the retry.
+    """
+
+    instruction = f"{instruction}\n{DIFF_INSTRUCTION}\n{FINDINGS_INSTRUCTION}"
+
+    with metrics.span("build"):
+        budget = chunk_budget(f"{context}\n\n{instruction}", max_tokens)
+        parts = excerpts(code, changed, context_lines, budget)
+
+    def analyse_excerpt(excerpt: Excerpt) -> List[Finding]:
+        messages = build_messages(instruction, excerpt.text, True, context)
+
+        return request_findings(messages, path, excerpt.start, excerpt.end, max_tokens)
+
+    if not parts:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(len(parts), CHUNK_CONCURRENCY)) as executor:
+        results = list(executor.map(analyse_excerpt, parts))
+
+    return [finding for findings in results for finding in findings]
+
+
+def review_changes(
+    instruction: str,
+    code: str,
+    path: str,
+    changed: Set[int],
+    max_tokens: Optional[int],
+    context: str = "",
+    context_lines: int = 3,
+) -> str:
+    """
+    Analyse the changed lines of a file, like `find_changed_issues` but in Markdown.
+
+    The responses of several excerpts are merged like the chunks of a large file.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code of the file.
+        path (str): Path of the file.
+        changed (Set[int]): Changed lines, see `diff_changes`.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        context (str): Related code of the repository, sent with every excerpt.
+        context_lines (int): Number of unchanged lines sent around each change.
+
+    Returns:
+        str
+    """
+
+    instruction = f"{instruction}\n{DIFF_INSTRUCTION}"
+
+    with metrics.span("build"):
+        budget = chunk_budget(f"{context}\n\n{instruction}", max_tokens)
+        parts = excerpts(code, changed, context_lines, budget)
+
+    def analyse_excerpt(excerpt: Excerpt) -> str:
+        return chat(
+            build_messages(
+                f"{instruction}\n(Part of {path}, lines {excerpt.start}-{excerpt.end})",
+                excerpt.text,
+                True,
+                context,
+            ),
+            max_tokens,
+        )
+
+    if not parts:
+        return "No changed lines."
+
+    if len(parts) == 1:
+        return chat(
+            build_messages(instruction, parts[0].text, True, context), max_tokens
+        )
+
+    with ThreadPoolExecutor(max_workers=min(len(parts), CHUNK_CONCURRENCY)) as executor:
+        responses = list(executor.map(analyse_excerpt, parts))
+
+    return chat(merge_messages(instruction, responses, max_tokens), max_tokens)
+
+
+def propose_patch(
+    instruction: str,
+    code: str,
+    path: str,
+    max_tokens: Optional[int],
+    context: str = "",
+) -> Patch:
+    """
+    Ask for the changes of an analysis as edits instead of the whole updated code, so
+    that the response grows with the size of the change rather than the size of the file.
+
+    Large files are split into chunks like in `prepare_messages`, the edits of each
+    chunk are applied to that chunk only, so that search lines that also occur in
+    another part of the file cannot change it. Edits whose search lines are not found,
+    or found more than once, are sent back to the model once, and a response that
+    repeats the whole chunk anyway replaces the chunk. Code that does not cover the
+    chunk, e.g. an example, counts as an edit that did not apply.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to change.
+        path (str): Path of the file, used to detect the language and in the diff.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        context (str): Related code of the repository, sent with every chunk.
+
+    Returns:
+        Patch
+    """
+
+    instruction = f"{instruction}\n{PATCH_INSTRUCTION}"
+
+    with metrics.span("build"):
+        chunks = split_code(
+            code, chunk_budget(f"{context}\n\n{instruction}", max_tokens), path
+        )
+
+    def edit_chunk(chunk: Chunk) -> Tuple[str, int, List[Edit]]:
+        messages = build_messages(instruction, chunk.text, True, context)
+        response = chat(messages, max_tokens)
+        edits = parse_edits(response)
+
+        if not edits:
+            updated = full_code(response, chunk.text)
+
+            # Code that does not cover the chunk is no applicable edit, not no change
+            if updated is None and FENCED.search(response):
+                return chunk.text, 0, [Edit(chunk.text, response)]
+
+            if updated is None:
+                return chunk.text, 0, []
+
+            # Keep the line ending of the chunk, the code block always ends with one
+            ending = chunk.text[len(chunk.text.rstrip("\n")) :]
+
+            return updated.rstrip("\n") + ending, 1, []
+
+        updated, failed = apply_edits(chunk.text, edits)
+
+        if not failed:
+            return updated, len(edits), []
+
+        blocks = "\n\n".join(format_edit(edit) for edit in failed)
+        repair = [
+            {"role": "assistant", "content": response},
+            {"role": "user", "content": FIX_EDITS.format(blocks=blocks)},
+        ]
+        repaired = parse_edits(chat(messages + repair, max_tokens))
+
+        if not repaired:
+            return updated, len(edits) - len(failed), failed
+
+        updated, still = apply_edits(updated, repaired)
+
+        return updated, len(edits) - len(failed) + len(repaired) - len(still), still
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(chunks), CHUNK_CONCURRENCY)
+    ) as executor:
+        results = list(executor.map(edit_chunk, chunks))
+
+    # Put the edited chunks back in place of the original lines
+    lines = code.splitlines(keepends=True)
+    parts, position = [], 0
+
+    for chunk, (text, _, _) in zip(chunks, results):
+        parts.append("".join(lines[position : chunk.start - 1]) + text)
+        position = chunk.end
+
+    updated = "".join(parts) + "".join(lines[position:])
+    failed = [edit for _, _, edits in results for edit in edits]
+
+    return Patch(
+        updated,
+        unified_diff(code, updated, path),
+        sum(applied for _, applied, _ in results),
+        failed,
+    )
+
+
+def combine_instructions(analyses: Sequence[Analysis]) -> str:
+    """
+    Build the instruction that asks for several analyses in one response.
+
+    Args:
+        analyses (Sequence[Analysis]): Analyses, in the order of the report.
+
+    Returns:
+        str
+    """
+
+    return COMBINE_INSTRUCTION + "".join(
+        f"\n\n## {analysis.title}\n{analysis.instruction}" for analysis in analyses
+    )
+
+
+def split_sections(text: str, analyses: Sequence[Analysis]) -> Dict[Analysis, str]:
+    """
+    Split a combined response into the sections of its analyses.
+
+    Args:
+        text (str): Combined response.
+        analyses (Sequence[Analysis]): Requested analyses.
+
+    Returns:
+        Dict[Analysis, str]: The non-empty sections, analyses without one are missing.
+    """
+
+    titles = {analysis.title.lower(): analysis for analysis in analyses}
+    heading = re.compile(
+        r"^#{1,6}\s*(" + "|".join(re.escape(title) for title in titles) + r")\W*$",
+        re.IGNORECASE | re.MULTILINE,
+    )
+    matches = list(heading.finditer(text))
+    sections = {}
+
+    for match, following in zip(matches, matches[1:] + [None]):
+        section = text[match.end() : following.start() if following else len(text)]
+        analysis = titles[match.group(1).lower()]
+
+        if section.strip() and analysis not in sections:
+            sections[analysis] = section.strip()
+
+    return sections
+
+
+def analyse_all(
+    analyses: Sequence[Analysis],
+    code: str,
+    path: str,
+    max_tokens: Optional[int],
+    context: str = "",
+    parallel: bool = False,
+) -> str:
+    """
+    Run several analyses of a file, paying for its code once where possible.
+
+    When the code and every response fit into the context window, the analyses are
+    requested together and the response is split at their headings. Otherwise, or for
+    sections missing from the combined response, each analysis is requested on its
+    own, concurrently, with the code before the instruction: the requests share the
+    system message and the code as a prompt prefix that servers can cache.
+
+    Args:
+        analyses (Sequence[Analysis]): Analyses, in the order of the report.
+        code (str): Code to analyse.
+        path (str): Path of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response
+            of each analysis.
+        context (str): Related code of the repository.
+        parallel (bool): Always send one request per analysis.
+
+    Returns:
+        str: The report, with a section per analysis.
+    """
+
+    combined = combine_instructions(analyses)
+    sections: Dict[Analysis, str] = {}
+
+    with metrics.span("build"):
+        tokens = estimate_tokens(f"{context}\n\n{combined}\n{code}")
+        fits = tokens + (max_tokens or 0) * len(analyses) <= chunk_budget("", None)
+        shared = len(split_code(code, chunk_budget(context, max_tokens), path)) == 1
+
+    if len(analyses) > 1 and fits and not parallel:
+        sections = split_sections(
+            chat(
+                build_messages(combined, code, True, context),
+                max_tokens * len(analyses) if max_tokens else None,
+            ),
+            analyses,
+        )
+
+    def analyse_one(analysis: Analysis) -> str:
+        if not shared:
+            return chat(
+                prepare_messages(
+                    analysis.instruction, code, max_tokens, path, context=context
+                ),
+                max_tokens,
+            )
+
+        prefix = f"```\n{code}\n```"
+        prefix = f"{context}\n\n{prefix}" if context else prefix
+
+        return chat(
+            [
+                instructions.system_message(),
+                {"role": "user", "content": f"{prefix}\n\n{analysis.instruction}"},
+            ],
+            max_tokens,
+        )
+
+    missing = [analysis for analysis in analyses if analysis not in sections]
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            sections.update(zip(missing, executor.map(analyse_one, missing)))
+
+    return "\n\n".join(
+        f"### {analysis.title}\n\n{sections[analysis].strip()}" for analysis in analyses
+    )
+
+
+def report_path(output_dir: Path, path: Path, suffix: str = ".md") -> Path:
+    """
+    Map a source file to its report file inside the output directory.
+
+    Args:
+        output_dir (Path): Directory to write the reports to.
+        path (Path): Analysed source file.
+        suffix (str): Extension of the report file.
+
+    Returns:
+        Path
+    """
+
+    parts = [part for part in path.parts if part not in (path.anchor, "..", ".")]
+
+    return output_dir.joinpath(*parts).with_name(f"{path.name}{suffix}")
+
+
+def analyse_file(
+    instruction: str,
+    path: str,
+    output: Optional[TextIO] = None,
+    max_tokens: Optional[int] = 2048,
+    stream: bool = False,
+    related: Optional[int] = None,
+    analyses: Optional[Sequence[Analysis]] = None,
+    parallel: bool = False,
+) -> None:
+    """
+    Analyse a single file, printing the response in a panel or writing it to `output`.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        path (str): File to analyse.
+        output (TextIO, optional): File to write the response to.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        stream (bool): Render the response incrementally.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+        analyses (Sequence[Analysis], optional): Run these analyses together instead,
+            see `analyse_all`.
+        parallel (bool): Send one request per analysis.
+    """
+
+    # Imported here, the API builds on this module
+    from code_star_cli import api
+
+    try:
+        with open(path, encoding="utf-8") as file:
+            code = file.read()
+
+        if analyses:
+            report = asyncio.run(
+                api.analyse_all(analyses, code, path, max_tokens, related, parallel)
+            )
+
+        elif stream:
+            chunks = sync_chunks(
+                api.analyse_stream(instruction, code, path, max_tokens, related)
+            )
+
+            if output:
+                with output as file:
+                    stream_response(chunks, file)
+
+                print(f"Output [bold green]saved[/bold green] to {output.name}.")
+
+            else:
+                stream_response(chunks)
+
+            return
+
+        else:
+            report = asyncio.run(
+                api.analyse(instruction, code, path, max_tokens, related)
+            )
+
+        if output:
+            with output as file:
+                file.write(report)
+
+            print(f"Output [bold green]saved[/bold green] to {output.name}.")
+
+        else:
+            print(create_panel("CodeStar", report))
+
+    except Exception as error:
+        print(f"[bold red]Error[/bold red]: {error}")
+
+
+@dataclass
+class Batch:
+    """
+    A batch run of `analyse`, with the settings and the state its files share.
+
+    Files are discovered, ordered and dispatched through a bounded worker pool. Each
+    file is analysed by `analyse_path`, which picks the mode of the run: changed lines
+    of a diff, structured findings, combined analyses, patches or a free-form report.
+    The results are written by `collect` as they complete, and summarised by `finish`.
+    """
+
+    instruction: str
+    output: Optional[TextIO] = None
+    output_dir: Optional[Path] = None
+    concurrency: int = 4
+    max_tokens: Optional[int] = 2048
+    incremental: bool = False
+    since: Optional[str] = None
+    related: Optional[int] = None
+    format: OutputFormat = OutputFormat.MARKDOWN
+    analyses: Optional[Sequence[Analysis]] = None
+    parallel: bool = False
+    patch: bool = False
+    apply: bool = False
+    diff: Optional[str] = None
+    context_lines: int = 3
+    budget: Budget = field(default_factory=Budget)
+    priorities: Sequence[str] = ()
+
+    # Loaded by `prepare`
+    manifest: Optional[Manifest] = field(default=None, init=False)
+    changed: Optional[Set[Path]] = field(default=None, init=False)
+    changes: Dict[Path, Optional[Set[int]]] = field(default_factory=dict, init=False)
+    index: Optional[CodeIndex] = field(default=None, init=False)
+
+    # Collected by `collect`
+    findings: List[Finding] = field(default_factory=list, init=False)
+    over: List[Path] = field(default_factory=list, init=False)
+    succeeded: int = field(default=0, init=False)
+    failed: int = field(default=0, init=False)
+    reused: int = field(default=0, init=False)
+    skipped: int = field(default=0, init=False)
+    patched: int = field(default=0, init=False)
+    unapplied: int = field(default=0, init=False)
+
+    # Tokens of a request besides the code, and the code that fits into one
+    overhead: int = field(init=False)
+    code_budget: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        related = settings.index_tokens if self.related else 0
+        self.overhead = estimate_tokens(
+            instructions.template("system") + self.instruction
+        )
+        self.overhead += 64 + related
+        self.code_budget = max(
+            256, chunk_budget(self.instruction, self.max_tokens) - related
+        )
+
+        # Numbered lines take more tokens, see `find_issues`
+        if self.structured:
+            self.code_budget = self.code_budget * 4 // 5
+
+    @property
+    def structured(self) -> bool:
+        """Whether the run reports findings instead of free-form reports"""
+
+        return self.format != OutputFormat.MARKDOWN
+
+    @property
+    def limited(self) -> bool:
+        """Whether the run has a budget"""
+
+        return (
+            self.budget.max_tokens is not None or self.budget.max_requests is not None
+        )
+
+    def status(self, message: str) -> None:
+        """
+        Print a status message, on stderr if the findings document goes to stdout.
+
+        Args:
+            message (str): Message.
+        """
+
+        print(message, file=sys.stderr if self.structured else None)
+
+    def prepare(self) -> None:
+        """
+        Load what the files of the run share: the code index, the changed lines of
+        the diff or the manifest of an incremental run, and the files changed in git.
+        """
+
+        if self.related:
+            self.index = open_index()
+
+        if self.diff:
+            self.changes = diff_changes(self.diff)
+
+        # Reports of changed lines depend on the diff, they are not stored
+        elif self.incremental or self.since:
+            self.manifest = Manifest.for_analysis(
+                cache_key(
+                    model=chat_model(),
+                    instruction=self.instruction,
+                    max_tokens=self.max_tokens,
+                    related=self.related,
+                    format=self.format.value,
+                )
+            )
+
+        # With --diff too, only the files in both are analysed
+        if self.since:
+            self.changed = git_changed_files(self.since)
+
+    def files(self, paths: List[str]) -> Iterable[Path]:
+        """
+        Discover the files of the run.
+
+        With `priorities` or a budget, the files that match the first of the
+        `priorities` come first, then the largest files. Ordering needs every file up
+        front, unordered runs start with the first one found.
+
+        Args:
+            paths (List[str]): Files, directories or glob patterns.
+
+        Returns:
+            Iterable[Path]
+        """
+
+        files = iter_files(paths)
+
+        return (
+            schedule(files, self.priorities)
+            if self.limited or self.priorities
+            else files
+        )
+
+    def included(self, path: Path) -> bool:
+        """
+        Whether a file is analysed, instead of skipped or reused from the last run.
+
+        Args:
+            path (Path): File.
+
+        Returns:
+            bool
+        """
+
+        resolved = path.resolve()
+
+        if self.diff and resolved not in self.changes:
+            return False
+
+        return self.changed is None or resolved in self.changed
+
+    def estimate(self, path: Path, read: bool = True) -> Estimate:
+        """
+        Estimate the cost of analysing a file, see `estimate_cost`.
+
+        Args:
+            path (Path): File.
+            read (bool): Count the tokens and chunks of the code, instead of
+                estimating them from the size of the file.
+
+        Returns:
+            Estimate
+        """
+
+        if not self.included(path):
+            return Estimate(0, 0)
+
+        try:
+            if read:
+                code = path.read_text(encoding="utf-8")
+                tokens = estimate_tokens(code)
+                chunks = len(split_code(code, self.code_budget, str(path)))
+
+            else:
+                tokens, chunks = estimate_size(os.path.getsize(path), self.code_budget)
+
+        except (OSError, UnicodeDecodeError):
+            # Fails again when the file is analysed
+            return Estimate(0, 0)
+
+        completion = self.budget.completion(self.max_tokens or self.code_budget)
+        each = estimate_cost(tokens, chunks, self.overhead, completion)
+        # Analyses that do not fit into one combined request are sent one by one
+        runs = len(self.analyses or ()) or 1
+        combined = int(runs > 1 and not self.parallel)
+
+        return Estimate(
+            each.tokens * (runs + combined), each.requests * runs + combined
+        )
+
+    def preflight(self, files: List[Path]) -> None:
+        """
+        Print the estimated cost of the run against its budget.
+
+        Args:
+            files (List[Path]): Files of the run.
+        """
+
+        costs = [self.estimate(path, read=False) for path in files]
+        tokens = sum(cost.tokens for cost in costs)
+        requests = sum(cost.requests for cost in costs)
+        limits = self.budget
+
+        self.status(
+            f"Estimated up to {tokens} token(s) in {requests} request(s) for "
+            f"{len(files)} file(s), budget of {limits.describe()}."
+            + (
+                " Files that do not fit are not analysed."
+                if (limits.max_tokens is not None and tokens > limits.max_tokens)
+                or (limits.max_requests is not None and requests > limits.max_requests)
+                else ""
+            )
+        )
+
+    def admit(self, path: Path) -> bool:
+        """
+        Reserve the estimated cost of a file, see `Budget.admit`.
+
+        Args:
+            path (Path): File about to be analysed.
+
+        Returns:
+            bool: Whether the file fits into the rest of the budget.
+        """
+
+        return self.budget.admit(path, self.estimate(path))
+
+    def reuse(self, path: Path, digest: str) -> Optional[FileReport]:
+        """
+        Look up the report of an unchanged file in the manifest of the last run.
+
+        Args:
+            path (Path): File.
+            digest (str): Digest of its code.
+
+        Returns:
+            Optional[FileReport]: The stored report, None if the file is analysed.
+        """
+
+        if self.manifest is None:
+            return None
+
+        if self.changed is not None:
+            # Changed according to git, analysed even if the digest matches
+            if path.resolve() in self.changed:
+                return None
+
+            report = self.manifest.lookup(path)
+
+        else:
+            report = self.manifest.lookup(path, digest)
+
+        return FileReport(report, digest, True) if report else None
+
+    def analyse_path(self, path: Path) -> Optional[FileReport]:
+        """
+        Analyse a file, the task of the worker pool.
+
+        Args:
+            path (Path): File.
+
+        Returns:
+            Optional[FileReport]: None for unchanged files without a stored report,
+            and files outside of the diff.
+        """
+
+        if self.diff and path.resolve() not in self.changes:
+            return None
+
+        code = path.read_text(encoding="utf-8")
+        digest = content_digest(code)
+        stored = self.reuse(path, digest)
+
+        if stored is not None or not self.included(path):
+            return stored
+
+        context = (
+            self.index.context(code, self.related or 0, settings.index_tokens, path)
+            if self.index
+            else ""
+        )
+        lines = self.changes.get(path.resolve())
+        name = path.as_posix()
+
+        if self.structured:
+            findings = (
+                find_changed_issues(
+                    self.instruction,
+                    code,
+                    name,
+                    lines,
+                    self.max_tokens,
+                    context,
+                    self.context_lines,
+                )
+                if lines
+                else find_issues(self.instruction, code, name, self.max_tokens, context)
+            )
+
+            # Stored in the manifest like a report
+            return FileReport(dump_findings(findings), digest, False)
+
+        if lines:
+            report = review_changes(
+                self.instruction,
+                code,
+                name,
+                lines,
+                self.max_tokens,
+                context,
+                self.context_lines,
+            )
+
+        elif self.analyses:
+            report = analyse_all(
+                self.analyses, code, str(path), self.max_tokens, context, self.parallel
+            )
+
+        elif self.patch:
+            result = propose_patch(
+                self.instruction, code, name, self.max_tokens, context
+            )
+
+            if self.apply and result.code != code:
+                path.write_text(result.code, encoding="utf-8")
+
+            return FileReport(result.diff, digest, False, len(result.failed))
+
+        else:
+            report = chat(
+                prepare_messages(
+                    self.instruction, code, self.max_tokens, str(path), context=context
+                ),
+                self.max_tokens,
+            )
+
+        return FileReport(report, digest, False)
+
+    def collect(
+        self,
+        path: Path,
+        result: Optional[FileReport],
+        error: Optional[BaseException],
+    ) -> None:
+        """
+        Record the result of a file and write its report.
+
+        Args:
+            path (Path): File.
+            result (FileReport, optional): Its report, None if it was skipped.
+            error (BaseException, optional): Why it failed.
+        """
+
+        if isinstance(error, BudgetExceeded):
+            self.over.append(path)
+            return
+
+        if error is not None:
+            self.failed += 1
+            self.status(f"[bold red]Error[/bold red]: {path}: {error}")
+            return
+
+        if result is None:
+            self.skipped += 1
+            return
+
+        if result.reused:
+            self.reused += 1
+
+        elif self.manifest is not None:
+            self.manifest.update(path, result.digest, result.report)
+
+        self.succeeded += 1
+
+        if self.structured:
+            self.write_findings(path, load_findings(result.report))
+
+        elif self.patch:
+            self.write_patch(path, result)
+
+        else:
+            self.write_report(path, result.report)
+
+    def write_findings(self, path: Path, findings: List[Finding]) -> None:
+        """
+        Keep the findings of a file for the document of the run, and write them to
+        the output directory.
+
+        Args:
+            path (Path): File.
+            findings (List[Finding]): Its findings.
+        """
+
+        self.findings.extend(findings)
+
+        if self.output_dir:
+            target = report_path(self.output_dir, path, f".{self.format.value}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(format_findings(findings, self.format), encoding="utf-8")
+
+    def write_patch(self, path: Path, result: FileReport) -> None:
+        """
+        Write the diff of a file, to the output directory, the patch or a panel.
+
+        Args:
+            path (Path): File.
+            result (FileReport): Its diff and number of edits that did not apply.
+        """
+
+        self.patched += bool(result.report)
+        self.unapplied += result.failed
+
+        if result.failed:
+            self.status(
+                f"[bold red]Error[/bold red]: {path}: "
+                + (
+                    f"{result.failed} edit(s) did not apply"
+                    if result.report
+                    else "no applicable edit, the file was left unchanged"
+                )
+            )
+
+        if self.output_dir and result.report:
+            target = report_path(self.output_dir, path, ".diff")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(result.report, encoding="utf-8")
+
+        if self.output:
+            # Concatenated diffs are a valid patch
+            self.output.write(result.report)
+            self.output.flush()
+
+        if not self.output and not self.output_dir:
+            print(
+                create_panel(
+                    "CodeStar",
+                    (
+                        f"```diff\n{result.report}```"
+                        if result.report
+                        else "No changes."
+                    ),
+                    str(path),
+                )
+            )
+
+    def write_report(self, path: Path, report: str) -> None:
+        """
+        Write the report of a file, to the output directory, the aggregated report
+        or a panel.
+
+        Args:
+            path (Path): File.
+            report (str): Its report.
+        """
+
+        if self.output_dir:
+            target = report_path(self.output_dir, path)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(report, encoding="utf-8")
+
+        if self.output:
+            self.output.write(f"## {path}\n\n{report}\n\n")
+            self.output.flush()
+
+        if not self.output and not self.output_dir:
+            print(create_panel("CodeStar", report, str(path)))
+
+    def finish(self, saved: int) -> None:
+        """
+        Write the findings document, close the output and summarise the run.
+
+        Args:
+            saved (int): Number of duplicate requests that were saved.
+        """
+
+        output = self.output
+
+        if self.structured and (output or not self.output_dir):
+            document = format_findings(self.findings, self.format)
+
+            if output:
+                output.write(document)
+
+            else:
+                sys.stdout.write(document + "\n")
+
+        if output and self.over and not self.structured and not self.patch:
+            # The files left out, so a partial report says it is partial
+            output.write(
+                "## Not analysed\n\n"
+                + "".join(f"- {path}\n" for path in self.over)
+                + "\nThe budget ran out before these files were analysed.\n"
+            )
+
+        if output:
+            output.close()
+
+        if self.manifest is not None:
+            self.manifest.save()
+
+        if self.succeeded + self.failed + self.skipped + len(self.over) == 0:
+            self.status(
+                "[bold red]Error[/bold red]: No files matched the provided paths."
+            )
+            return
+
+        self.status(
+            f"Analysed [bold green]{self.succeeded - self.reused}[/bold green] file(s)"
+            + (f", reused {self.reused} unchanged" if self.reused else "")
+            + (f", skipped {self.skipped} unchanged" if self.skipped else "")
+            + (f", [bold red]{self.failed}[/bold red] failed" if self.failed else "")
+            + (f", {len(self.findings)} finding(s)" if self.structured else "")
+            + (f", {self.patched} with changes" if self.patch else "")
+            + (
+                f", [bold red]{self.unapplied}[/bold red] edit(s) not applied"
+                if self.unapplied
+                else ""
+            )
+            + (f", {saved} duplicate request(s) saved" if saved else "")
+            + (
+                f", [bold red]{len(self.over)}[/bold red] not analysed"
+                if self.over
+                else ""
+            )
+            + "."
+        )
+
+        if self.limited:
+            self.status(
+                f"Used {self.budget.tokens} token(s) in {self.budget.requests} "
+                f"request(s) of the budget of {self.budget.describe()}."
+                + (" The budget ran out, the report is partial." if self.over else "")
+            )
+
+        if output:
+            self.status(f"Report [bold green]saved[/bold green] to {output.name}.")
+
+        if self.output_dir:
+            self.status(f"Reports [bold green]saved[/bold green] to {self.output_dir}.")
+
+        if self.apply and self.patched:
+            self.status(
+                f"Changes [bold green]applied[/bold green] to {self.patched} file(s)."
+            )
+
+    def run(self, paths: List[str]) -> None:
+        """
+        Analyse the files.
+
+        Args:
+            paths (List[str]): Files, directories or glob patterns.
+        """
+
+        try:
+            self.prepare()
+
+        except Exception as error:
+            self.status(f"[bold red]Error[/bold red]: {error}")
+            return
+
+        files = self.files(paths)
+
+        if self.limited:
+            files = list(files)
+            self.preflight(files)
+
+        limited = self.budget if self.limited else None
+
+        with coalescing() as coalescer, budgeting(limited):
+            for path, result, error in run_batch(
+                files,
+                self.analyse_path,
+                self.concurrency,
+                self.admit if limited else None,
+            ):
+                # Its requests were charged, the next files may use the rest
+                self.budget.release(path)
+                self.collect(path, result, error)
+
+        self.finish(coalescer.saved)
+
+
+def analyse(
+    instruction: str,
+    paths: List[str],
+    output: Optional[TextIO] = None,
+    output_dir: Optional[Path] = None,
+    concurrency: int = 4,
+    max_tokens: Optional[int] = 2048,
+    stream: bool = False,
+    incremental: bool = False,
+    since: Optional[str] = None,
+    related: Optional[int] = None,
+    format: OutputFormat = OutputFormat.MARKDOWN,
+    analyses: Optional[Sequence[Analysis]] = None,
+    parallel: bool = False,
+    patch: bool = False,
+    apply: bool = False,
+    diff: Optional[str] = None,
+    context_lines: int = 3,
+    token_budget: Optional[int] = None,
+    max_requests: Optional[int] = None,
+    priorities: Sequence[str] = (),
+) -> None:
+    """
+    Analyse one file, or a batch of files, with the provided instruction.
+
+    A single file is handled by `analyse_file`: the response is printed in a panel
+    or written to `output`. Anything else is run as a `Batch`.
+
+    Structured formats are always run as a batch. The findings of all files are
+    written as a single document to `output`, or to stdout, with the status messages
+    on stderr so the document can be piped.
+
+    Patches are run as a batch too. The unified diffs of all files are written to
+    `output` as a single patch, or printed, and applied to the files with `apply`.
+
+    With `priorities` or a budget, batches start with the files that match the first
+    of the `priorities`, then the largest files. With a budget, a file only starts if
+    its estimated cost fits into the rest of the budget, so the run stops with a
+    partial report instead of going over it.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        paths (List[str]): Files, directories or glob patterns.
+        output (TextIO, optional): File to write the (aggregated) report to.
+        output_dir (Path, optional): Directory to write a report per file to.
+        concurrency (int): Maximum number of concurrent requests.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        stream (bool): Render the response incrementally, single file only.
+        incremental (bool): Only analyse files that changed since the last run,
+            reuse the stored reports of the others.
+        since (str, optional): Only analyse files that changed since this git ref.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to each prompt.
+        format (OutputFormat): Free-form Markdown, or structured findings as JSON or SARIF.
+        analyses (Sequence[Analysis], optional): Run these analyses together instead,
+            see `analyse_all`. The instruction is their combined instruction.
+        parallel (bool): Send one request per analysis.
+        patch (bool): Ask for the changes as edits and report them as unified diffs,
+            see `propose_patch`.
+        apply (bool): Write the changes of the patches to the files.
+        diff (str, optional): Only analyse the changed lines, and files, of the diff
+            against this git ref, or of the unified diff on stdin if `-`.
+        context_lines (int): Number of unchanged lines sent around each change.
+        token_budget (int, optional): Maximum number of prompt and completion tokens
+            of the batch.
+        max_requests (int, optional): Maximum number of requests of the batch.
+        priorities (Sequence[str]): Glob patterns of the files to analyse first, most
+            important first.
+    """
+
+    batch = Batch(
+        instruction,
+        output=output,
+        output_dir=output_dir,
+        concurrency=concurrency,
+        max_tokens=max_tokens,
+        incremental=incremental,
+        since=since,
+        related=related,
+        format=format,
+        analyses=analyses,
+        parallel=parallel,
+        patch=patch,
+        apply=apply,
+        diff=diff,
+        context_lines=context_lines,
+        budget=Budget(token_budget, max_requests),
+        priorities=priorities,
+    )
+    single = len(paths) == 1 and os.path.isfile(paths[0])
+
+    if single and not (
+        output_dir
+        or incremental
+        or since
+        or batch.structured
+        or patch
+        or diff
+        or batch.limited
+    ):
+        analyse_file(
+            instruction,
+            paths[0],
+            output,
+            max_tokens,
+            stream,
+            related,
+            analyses,
+            parallel,
+        )
+        return
+
+    batch.run(paths)
@@ -0,0 +1,655 @@
+""" Async Python API of CodeStar, the CLI commands are thin wrappers over it """
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Dict, Iterable, List, Optional
+from typing import Sequence, Tuple, TypeVar
+from code_star_cli import FIM_TEMPLATE
+from code_star_cli import analysis, inference, instructions
+from code_star_cli.backends import Candidate, capabilities
+from code_star_cli.config import settings
+from code_star_cli.findings import Finding
+from code_star_cli.index import open_index
+from code_star_cli.patches import Patch
+
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    """
+    Get the thread pool the requests are sent from.
+
+    Requests go through the shared, pooled clients with their retries, rate limit,
+    response cache and coalescing, so the pool is as large as the connection pool.
+
+    Returns:
+        ThreadPoolExecutor
+    """
+
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.pool_size, thread_name_prefix="code-star"
+            )
+
+        return _executor
+
+
+async def run(function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run blocking work without blocking the event loop.
+
+    Args:
+        function (Callable[..., T]): Function to call.
+        *args (Any): Positional arguments.
+        **kwargs (Any): Keyword arguments.
+
+    Returns:
+        T: The result of the function.
+    """
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executor(), partial(function, *args, **kwargs)
+    )
+
+
+async def iterate(factory: Callable[[], Iterable[T]]) -> AsyncGenerator[T, None]:
+    """
+    Consume a blocking iterator, e.g. a streamed response, without blocking the event loop.
+
+    Args:
+        factory (Callable[[], Iterable[T]]): Creates the iterator.
+
+    Yields:
+        T: The items of the iterator.
+    """
+
+    iterator = iter(await run(factory))
+    done = object()
+
+    while True:
+        item = await run(next, iterator, done)
+
+        if item is done:
+            return
+
+        yield item  # type: ignore[misc]
+
+
+def related_context(
+    query: str, related: Optional[int], exclude: Optional[Path] = None
+) -> str:
+    """
+    Retrieve related code from the index of the working directory.
+
+    Args:
+        query (str): Code or natural language.
+        related (int, optional): Maximum number of snippets, None for no context.
+        exclude (Path, optional): File to leave out, e.g. the file being analysed.
+
+    Returns:
+        str
+
+    Raises:
+        FileNotFoundError: If neither the working directory nor its parents are indexed.
+    """
+
+    if not related:
+        return ""
+
+    return open_index().context(query, related, settings.index_tokens, exclude)
+
+
+async def chat(
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = 2048,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    Request a chat completion.
+
+    Args:
+        messages (List[Dict[str, Any]]): Chat messages.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the response in the response cache.
+
+    Returns:
+        str: The response.
+    """
+
+    return await run(inference.chat, messages, max_tokens, model, use_cache)
+
+
+def chat_stream(
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = 2048,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> AsyncGenerator[str, None]:
+    """
+    Request a chat completion, streamed as it is generated.
+
+    Args:
+        messages (List[Dict[str, Any]]): Chat messages.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the response in the response cache.
+
+    Returns:
+        AsyncGenerator[str, None]: Text deltas.
+    """
+
+    return iterate(
+        lambda: inference.chat_stream(messages, max_tokens, model, use_cache)
+    )
+
+
+def ai_messages(
+    prompt: str,
+    code: Optional[str] = None,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """
+    Build the messages of a natural language request.
+
+    Args:
+        prompt (str): Natural language prompt.
+        code (str, optional): Code to include in the prompt.
+        filename (str): Name of the code file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        List[Dict[str, str]]
+    """
+
+    context = related_context(
+        f"{prompt}\n{code or ''}", related, Path(filename) if filename else None
+    )
+
+    if code is not None:
+        return analysis.prepare_messages(
+            f"{prompt}:", code, max_tokens, filename, fence=True, context=context
+        )
+
+    if context:
+        return [
+            instructions.system_message(),
+            {"role": "user", "content": f"{context}\n\n{prompt}"},
+        ]
+
+    return [instructions.system_message(), {"role": "user", "content": prompt}]
+
+
+async def ai(
+    prompt: str,
+    code: Optional[str] = None,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> str:
+    """
+    Interact with CodeStar using natural language.
+
+    Args:
+        prompt (str): Natural language prompt.
+        code (str, optional): Code to include in the prompt.
+        filename (str): Name of the code file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        str: The response.
+    """
+
+    messages = await run(ai_messages, prompt, code, filename, max_tokens, related)
+
+    return await chat(messages, max_tokens)
+
+
+async def ai_stream(
+    prompt: str,
+    code: Optional[str] = None,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Interact with CodeStar using natural language, streaming the response.
+
+    Args:
+        prompt (str): Natural language prompt.
+        code (str, optional): Code to include in the prompt.
+        filename (str): Name of the code file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Yields:
+        str: Text deltas.
+    """
+
+    messages = await run(ai_messages, prompt, code, filename, max_tokens, related)
+
+    async for chunk in chat_stream(messages, max_tokens):
+        yield chunk
+
+
+def completion_prompt(
+    code: str, suffix: Optional[str] = None, language: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Build the prompt of a completion.
+
+    Args:
+        code (str): Code before the cursor.
+        suffix (str, optional): Code after the cursor, to fill in the middle.
+        language (str, optional): Language of the code.
+
+    Returns:
+        Tuple[str, str]: The prompt, and the text the completion continues, empty when
+        filling in the middle.
+
+    Raises:
+        ValueError: If there is a suffix and the backend cannot fill in the middle.
+    """
+
+    if suffix and not capabilities().fim:
+        raise ValueError("The backend cannot fill in the middle, remove the suffix")
+
+    if suffix:
+        return FIM_TEMPLATE.format(prefix=code, suffix=suffix), ""
+
+    prompt = f"```{language or ''}\n{code}"
+
+    return prompt, prompt
+
+
+async def complete(
+    code: str,
+    suffix: Optional[str] = None,
+    language: Optional[str] = None,
+    max_new_tokens: Optional[int] = 128,
+    model: Optional[str] = None,
+) -> str:
+    """
+    Complete code, or fill in the middle when there is code after the cursor.
+
+    Args:
+        code (str): Code before the cursor.
+        suffix (str, optional): Code after the cursor.
+        language (str, optional): Language of the code.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+
+    Returns:
+        str: The generated code.
+    """
+
+    prompt, _ = completion_prompt(code, suffix, language)
+
+    return await run(inference.generate, prompt, max_new_tokens, model)
+
+
+def complete_stream(
+    code: str,
+    suffix: Optional[str] = None,
+    language: Optional[str] = None,
+    max_new_tokens: Optional[int] = 128,
+    model: Optional[str] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Complete code, streaming the generated code.
+
+    Args:
+        code (str): Code before the cursor.
+        suffix (str, optional): Code after the cursor.
+        language (str, optional): Language of the code.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+
+    Returns:
+        AsyncGenerator[str, None]: Generated tokens.
+    """
+
+    prompt, _ = completion_prompt(code, suffix, language)
+
+    return iterate(lambda: inference.generate_stream(prompt, max_new_tokens, model))
+
+
+async def complete_candidates(
+    code: str,
+    n: int = 3,
+    suffix: Optional[str] = None,
+    language: Optional[str] = None,
+    max_new_tokens: Optional[int] = 128,
+    model: Optional[str] = None,
+) -> List[Candidate]:
+    """
+    Sample alternative completions, ranked best first and deduplicated.
+
+    Args:
+        code (str): Code before the cursor.
+        n (int): Number of candidates to sample.
+        suffix (str, optional): Code after the cursor.
+        language (str, optional): Language of the code.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+
+    Returns:
+        List[Candidate]
+    """
+
+    prompt, _ = completion_prompt(code, suffix, language)
+
+    return await run(inference.generate_candidates, prompt, n, max_new_tokens, model)
+
+
+def analysis_messages(
+    instruction: str,
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """
+    Build the messages of an analysis, see `analysis.prepare_messages`.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        List[Dict[str, str]]
+    """
+
+    context = related_context(code, related, Path(filename) if filename else None)
+
+    return analysis.prepare_messages(
+        instruction, code, max_tokens, filename, context=context
+    )
+
+
+async def analyse(
+    instruction: str,
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> str:
+    """
+    Analyse code of any size with an instruction.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        str: The report.
+    """
+
+    messages = await run(
+        analysis_messages, instruction, code, filename, max_tokens, related
+    )
+
+    return await chat(messages, max_tokens)
+
+
+async def analyse_stream(
+    instruction: str,
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Analyse code of any size with an instruction, streaming the report.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Yields:
+        str: Text deltas.
+    """
+
+    messages = await run(
+        analysis_messages, instruction, code, filename, max_tokens, related
+    )
+
+    async for chunk in chat_stream(messages, max_tokens):
+        yield chunk
+
+
+async def find_issues(
+    instruction: str,
+    code: str,
+    filename: str,
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> List[Finding]:
+    """
+    Analyse code for structured findings with file and line locations.
+
+    Args:
+        instruction (str): Instruction that describes the analysis.
+        code (str): Code to analyse.
+        filename (str): Path of the file, reported with the findings.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        List[Finding]
+    """
+
+    context = await run(
+        related_context, code, related, Path(filename) if filename else None
+    )
+
+    return await run(
+        analysis.find_issues, instruction, code, filename, max_tokens, context
+    )
+
+
+async def analyse_all(
+    analyses: Sequence[analysis.Analysis],
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+    parallel: bool = False,
+) -> str:
+    """
+    Run several analyses of code in one report, see `analysis.analyse_all`.
+
+    Args:
+        analyses (Sequence[Analysis]): Analyses, in the order of the report.
+        code (str): Code to analyse.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response
+            of each analysis.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+        parallel (bool): Send one request per analysis.
+
+    Returns:
+        str: The report, with a section per analysis.
+    """
+
+    context = await run(
+        related_context, code, related, Path(filename) if filename else None
+    )
+
+    return await run(
+        analysis.analyse_all, analyses, code, filename, max_tokens, context, parallel
+    )
+
+
+async def patch(
+    instruction: str,
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> Patch:
+    """
+    Ask for the changes of an analysis as edits, see `analysis.propose_patch`.
+
+    Args:
+        instruction (str): Instruction that describes the changes, e.g.
+            `instructions.template("enhance")`.
+        code (str): Code to change.
+        filename (str): Path of the file, used to detect the language and in the diff.
+        max_tokens (int, optional): Maximum number of tokens allowed in a response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        Patch: The updated code, its unified diff and the edits that did not apply.
+    """
+
+    context = await run(
+        related_context, code, related, Path(filename) if filename else None
+    )
+
+    return await run(
+        analysis.propose_patch, instruction, code, filename, max_tokens, context
+    )
+
+
+async def scan(
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> str:
+    """
+    Scan code for security vulnerabilities.
+
+    Args:
+        code (str): Code to scan.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        str: The report.
+    """
+
+    return await analyse(
+        instructions.template("scan"), code, filename, max_tokens, related
+    )
+
+
+async def review(
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+    related: Optional[int] = None,
+) -> str:
+    """
+    Review code quality and adherence to best practices.
+
+    Args:
+        code (str): Code to review.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        related (int, optional): Add up to this many related snippets of the indexed
+            repository to the prompt.
+
+    Returns:
+        str: The report.
+    """
+
+    return await analyse(
+        instructions.template("review"), code, filename, max_tokens, related
+    )
+
+
+async def enhance(
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+) -> str:
+    """
+    Improve code by applying best practices.
+
+    Args:
+        code (str): Code to enhance.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+    Returns:
+        str: The enhanced code and its explanation.
+    """
+
+    return await analyse(instructions.template("enhance"), code, filename, max_tokens)
+
+
+async def document(
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+) -> str:
+    """
+    Add documentation to code.
+
+    Args:
+        code (str): Code to document.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+    Returns:
+        str: The documented code.
+    """
+
+    return await analyse(instructions.template("document"), code, filename, max_tokens)
+
+
+async def test(
+    code: str,
+    filename: str = "",
+    max_tokens: Optional[int] = 2048,
+) -> str:
+    """
+    Generate tests for code.
+
+    Args:
+        code (str): Code to test.
+        filename (str): Name of the file, used to detect the language.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+    Returns:
+        str: The tests.
+    """
+
+    return await analyse(instructions.template("test"), code, filename, max_tokens)
@@ -0,0 +1,633 @@
+""" Model backends: the Inference API, OpenAI-compatible servers and local models """
+
+import json
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, NamedTuple
+from typing import Optional, Tuple, Type
+from code_star_cli.config import settings
+
+if TYPE_CHECKING:
+    import requests
+    from huggingface_hub import InferenceClient
+
+
+class Capabilities(NamedTuple):
+    """Features a backend supports"""
+
+    # Responses can be streamed as they are generated
+    streaming: bool
+    # Fill-in-the-middle prompts are passed to the model as is
+    fim: bool
+    # Alternative completions are sampled in a single request
+    batching: bool
+
+
+class Reply(NamedTuple):
+    """A chat completion"""
+
+    text: str
+    # Token counts reported by the backend, with `prompt_tokens` and `completion_tokens`
+    usage: Any = None
+
+
+class Candidate(NamedTuple):
+    """An alternative completion"""
+
+    text: str
+    score: float
+
+
+class Usage(NamedTuple):
+    """Token counts of an OpenAI-style response"""
+
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+
+
+def mean_logprob(logprobs: Iterable[Optional[float]]) -> float:
+    """
+    Score generated tokens by their mean log-probability, normalising for length.
+
+    Args:
+        logprobs (Iterable[Optional[float]]): Log-probabilities of the generated tokens.
+
+    Returns:
+        float: The mean log-probability, -inf without tokens.
+    """
+
+    values = [logprob for logprob in logprobs if logprob is not None]
+
+    return sum(values) / len(values) if values else float("-inf")
+
+
+class Backend:
+    """
+    Runs chat and text generation requests against a model.
+
+    Requests are sent eagerly: streaming methods return once the request is accepted,
+    so that failures before the first token can be retried.
+    """
+
+    name = ""
+    capabilities = Capabilities(streaming=True, fim=True, batching=False)
+
+    def __init__(self, model: str, endpoint: Optional[str] = None) -> None:
+        """
+        Args:
+            model (str): Model ID, or path of the model for local backends.
+            endpoint (str, optional): URL of the server.
+        """
+
+        self.model = model
+        self.endpoint = endpoint
+
+    def chat(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> Reply:
+        """
+        Request a chat completion.
+
+        Args:
+            messages (List[Dict[str, Any]]): Chat messages.
+            max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+        Returns:
+            Reply
+        """
+
+        raise NotImplementedError
+
+    def chat_stream(
+        self, messages: List[Dict[str, Any]], max_tokens: Optional[int]
+    ) -> Iterator[str]:
+        """
+        Request a streamed chat completion.
+
+        Args:
+            messages (List[Dict[str, Any]]): Chat messages.
+            max_tokens (int, optional): Maximum number of tokens allowed in the response.
+
+        Returns:
+            Iterator[str]: Text deltas.
+        """
+
+        raise NotImplementedError
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int]) -> str:
+        """
+        Request a text generation.
+
+        Args:
+            prompt (str): Prompt to complete.
+            max_new_tokens (int, optional): Maximum number of generated tokens.
+
+        Returns:
+            str: The generated text.
+        """
+
+        raise NotImplementedError
+
+    def generate_stream(
+        self, prompt: str, max_new_tokens: Optional[int]
+    ) -> Iterator[str]:
+        """
+        Request a streamed text generation.
+
+        Args:
+            prompt (str): Prompt to complete.
+            max_new_tokens (int, optional): Maximum number of generated tokens.
+
+        Returns:
+            Iterator[str]: Generated tokens.
+        """
+
+        raise NotImplementedError
+
+    def sample(
+        self,
+        prompt: str,
+        n: int,
+        max_new_tokens: Optional[int],
+        temperature: float,
+        seed: Optional[int] = None,
+    ) -> List[Candidate]:
+        """
+        Sample completions of a prompt, scored by their mean log-probability.
+
+        Args:
+            prompt (str): Prompt to complete.
+            n (int): Number of sequences, only backends with batching sample more than one.
+            max_new_tokens (int, optional): Maximum number of generated tokens.
+            temperature (float): Sampling temperature.
+            seed (int, optional): Random seed, so concurrent requests sample differently.
+
+        Returns:
+            List[Candidate]: The sampled completions, unranked.
+        """
+
+        raise NotImplementedError
+
+
+class HuggingFaceBackend(Backend):
+    """Hugging Face Inference API, or a TGI server at the endpoint"""
+
+    name = "hf"
+    capabilities = Capabilities(streaming=True, fim=True, batching=True)
+
+    @property
+    def client(self) -> "InferenceClient":
+        """Shared client of the model, with the timeout and headers of the settings"""
+
+        # huggingface_hub is slow to import, it is only imported once a backend is used
+        from code_star_cli.client import get_client
+
+        return get_client(self.endpoint or self.model)
+
+    def chat(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> Reply:
+        response = self.client.chat_completion(messages=messages, max_tokens=max_tokens)
+
+        return Reply(
+            str(response.choices[0].message.content), getattr(response, "usage", None)
+        )
+
+    def chat_stream(
+        self, messages: List[Dict[str, Any]], max_tokens: Optional[int]
+    ) -> Iterator[str]:
+        from code_star_cli.streaming import chat_chunks
+
+        return chat_chunks(
+            self.client.chat_completion(
+                messages=messages, max_tokens=max_tokens, stream=True
+            )
+        )
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int]) -> str:
+        return self.client.text_generation(prompt, max_new_tokens=max_new_tokens)
+
+    def generate_stream(
+        self, prompt: str, max_new_tokens: Optional[int]
+    ) -> Iterator[str]:
+        return self.client.text_generation(
+            prompt, max_new_tokens=max_new_tokens, stream=True
+        )
+
+    def sample(
+        self,
+        prompt: str,
+        n: int,
+        max_new_tokens: Optional[int],
+        temperature: float,
+        seed: Optional[int] = None,
+    ) -> List[Candidate]:
+        # TGI samples the `best_of` sequences in one batch
+        output = self.client.text_generation(
+            prompt,
+            max_new_tokens=max_new_tokens,
+            details=True,
+            do_sample=True,
+            temperature=temperature,
+            seed=seed,
+            **({"best_of": n} if n > 1 else {}),
+        )
+        details = getattr(output, "details", None)
+        outputs = [output, *(getattr(details, "best_of_sequences", None) or [])]
+
+        return [self.to_candidate(output) for output in outputs]
+
+    @staticmethod
+    def to_candidate(output: Any) -> Candidate:
+        """
+        Score a generated sequence.
+
+        Args:
+            output (Any): Text generation output or best-of sequence, plain text from
+                servers that do not return details.
+
+        Returns:
+            Candidate
+        """
+
+        if isinstance(output, str):
+            return Candidate(output, float("-inf"))
+
+        # Best-of sequences carry their tokens, the main output carries them in its details
+        details = output.details if hasattr(output, "details") else output
+        tokens = details.tokens if details else []
+
+        return Candidate(
+            output.generated_text, mean_logprob(token.logprob for token in tokens)
+        )
+
+
+def usage(response: Dict[str, Any]) -> Optional[Usage]:
+    """
+    Read the token counts of an OpenAI-style response.
+
+    Args:
+        response (Dict[str, Any]): Decoded response.
+
+    Returns:
+        Optional[Usage]: None if the response does not report them.
+    """
+
+    counts = response.get("usage") or {}
+
+    if not counts:
+        return None
+
+    return Usage(counts.get("prompt_tokens"), counts.get("completion_tokens"))
+
+
+def deltas(chunks: Iterable[Dict[str, Any]], key: str) -> Iterator[str]:
+    """
+    Extract the text deltas of a streamed OpenAI-style response.
+
+    Args:
+        chunks (Iterable[Dict[str, Any]]): Decoded chunks.
+        key (str): `delta` for chat completions, `text` for completions.
+
+    Yields:
+        str: Text deltas.
+    """
+
+    for chunk in chunks:
+        for choice in chunk.get("choices") or []:
+            text = choice.get(key)
+
+            if isinstance(text, dict):
+                text = text.get("content")
+
+            if text:
+                yield text
+
+
+def to_candidates(response: Dict[str, Any]) -> List[Candidate]:
+    """
+    Score the choices of an OpenAI-style completion.
+
+    Args:
+        response (Dict[str, Any]): Decoded response.
+
+    Returns:
+        List[Candidate]
+    """
+
+    return [
+        Candidate(
+            choice.get("text") or "",
+            mean_logprob((choice.get("logprobs") or {}).get("token_logprobs") or []),
+        )
+        for choice in response.get("choices") or []
+    ]
+
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI-compatible server, e.g. llama.cpp, vLLM, Ollama or LM Studio.
+
+    Chat requests go to `/v1/chat/completions` and completions, including
+    fill-in-the-middle prompts, to `/v1/completions`. Alternative completions are
+    sampled in one request with `n`.
+    """
+
+    name = "openai"
+    capabilities = Capabilities(streaming=True, fim=True, batching=True)
+
+    def __init__(self, model: str, endpoint: Optional[str] = None) -> None:
+        if not endpoint:
+            raise ValueError(
+                "The openai backend needs an endpoint, "
+                "e.g. --endpoint http://localhost:8080/v1"
+            )
+
+        from code_star_cli.client import session_factory
+
+        super().__init__(model, endpoint)
+        self.url = endpoint.rstrip("/")
+        self.session = session_factory()
+
+        if not self.url.endswith("/v1"):
+            self.url += "/v1"
+
+    def post(
+        self, path: str, payload: Dict[str, Any], stream: bool = False
+    ) -> "requests.Response":
+        """
+        Send a request to the server.
+
+        Args:
+            path (str): Path of the route, relative to `/v1`.
+            payload (Dict[str, Any]): Request body, without the model.
+            stream (bool): Stream the response as server-sent events.
+
+        Returns:
+            requests.Response
+
+        Raises:
+            requests.HTTPError: If the server rejects the request.
+        """
+
+        response = self.session.post(
+            f"{self.url}/{path}",
+            json={"model": self.model, "stream": stream, **payload},
+            headers=settings.headers or None,
+            timeout=settings.timeout,
+            stream=stream,
+        )
+        response.raise_for_status()
+
+        return response
+
+    @staticmethod
+    def events(response: "requests.Response") -> Iterator[Dict[str, Any]]:
+        """
+        Decode the server-sent events of a streamed response.
+
+        Args:
+            response (requests.Response): Streamed response.
+
+        Yields:
+            Dict[str, Any]: Decoded chunks.
+        """
+
+        response.encoding = "utf-8"
+
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+
+                data = line[len("data:") :].strip()
+
+                if data == "[DONE]":
+                    return
+
+                yield json.loads(data)
+
+    def chat(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> Reply:
+        response = self.post(
+            "chat/completions", {"messages": messages, "max_tokens": max_tokens}
+        ).json()
+
+        return Reply(
+            response["choices"][0]["message"].get("content") or "", usage(response)
+        )
+
+    def chat_stream(
+        self, messages: List[Dict[str, Any]], max_tokens: Optional[int]
+    ) -> Iterator[str]:
+        response = self.post(
+            "chat/completions",
+            {"messages": messages, "max_tokens": max_tokens},
+            stream=True,
+        )
+
+        return deltas(self.events(response), "delta")
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int]) -> str:
+        response = self.post(
+            "completions", {"prompt": prompt, "max_tokens": max_new_tokens}
+        ).json()
+
+        return response["choices"][0].get("text") or ""
+
+    def generate_stream(
+        self, prompt: str, max_new_tokens: Optional[int]
+    ) -> Iterator[str]:
+        response = self.post(
+            "completions", {"prompt": prompt, "max_tokens": max_new_tokens}, stream=True
+        )
+
+        return deltas(self.events(response), "text")
+
+    def sample(
+        self,
+        prompt: str,
+        n: int,
+        max_new_tokens: Optional[int],
+        temperature: float,
+        seed: Optional[int] = None,
+    ) -> List[Candidate]:
+        payload = {
+            "prompt": prompt,
+            "max_tokens": max_new_tokens,
+            "n": n,
+            "temperature": temperature,
+            "logprobs": 1,
+        }
+
+        if seed is not None:
+            payload["seed"] = seed
+
+        return to_candidates(self.post("completions", payload).json())
+
+
+class LocalBackend(Backend):
+    """
+    In-process llama.cpp runner for small quantised models in the GGUF format, e.g.
+    StarCoder 2 3B, on the CPU. No request leaves the machine.
+
+    The model is loaded once per process, keep it warm with `code-star serve`. It
+    generates one sequence at a time, requests of concurrent threads take turns.
+    """
+
+    name = "local"
+    capabilities = Capabilities(streaming=True, fim=True, batching=False)
+
+    def __init__(self, model: str, endpoint: Optional[str] = None) -> None:
+        try:
+            from llama_cpp import Llama
+
+        except ImportError as error:
+            raise ImportError(
+                "The local backend needs llama-cpp-python: pip install llama-cpp-python"
+            ) from error
+
+        path = Path(model).expanduser()
+
+        if not path.is_file():
+            raise FileNotFoundError(
+                f"No model file at {path}, the local backend runs GGUF files, "
+                "e.g. starcoder2-3b-Q4_K_M.gguf"
+            )
+
+        super().__init__(str(path), endpoint)
+        self.llama = Llama(
+            model_path=str(path),
+            n_ctx=settings.context_tokens,
+            n_threads=settings.option("local_threads") or None,
+            verbose=False,
+        )
+        self._lock = threading.Lock()
+
+    def locked(self, chunks: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Hold the model while a response is streamed.
+
+        Args:
+            chunks (Iterator[Dict[str, Any]]): Streamed response, generated lazily.
+
+        Yields:
+            Dict[str, Any]: Decoded chunks.
+        """
+
+        with self._lock:
+            yield from chunks
+
+    def chat(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> Reply:
+        with self._lock:
+            response = self.llama.create_chat_completion(
+                messages=messages, max_tokens=max_tokens
+            )
+
+        return Reply(
+            response["choices"][0]["message"].get("content") or "", usage(response)
+        )
+
+    def chat_stream(
+        self, messages: List[Dict[str, Any]], max_tokens: Optional[int]
+    ) -> Iterator[str]:
+        chunks = self.llama.create_chat_completion(
+            messages=messages, max_tokens=max_tokens, stream=True
+        )
+
+        return deltas(self.locked(chunks), "delta")
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int]) -> str:
+        with self._lock:
+            response = self.llama.create_completion(prompt, max_tokens=max_new_tokens)
+
+        return response["choices"][0].get("text") or ""
+
+    def generate_stream(
+        self, prompt: str, max_new_tokens: Optional[int]
+    ) -> Iterator[str]:
+        chunks = self.llama.create_completion(
+            prompt, max_tokens=max_new_tokens, stream=True
+        )
+
+        return deltas(self.locked(chunks), "text")
+
+    def sample(
+        self,
+        prompt: str,
+        n: int,
+        max_new_tokens: Optional[int],
+        temperature: float,
+        seed: Optional[int] = None,
+    ) -> List[Candidate]:
+        # Log-probabilities need the logits of every token, the candidates are unscored
+        with self._lock:
+            response = self.llama.create_completion(
+                prompt,
+                max_tokens=max_new_tokens,
+                temperature=temperature,
+                seed=seed,
+            )
+
+        return to_candidates(response)
+
+
+BACKENDS: Dict[str, Type[Backend]] = {
+    backend.name: backend
+    for backend in (HuggingFaceBackend, OpenAIBackend, LocalBackend)
+}
+
+_backends: Dict[Tuple[str, str, Optional[str]], Backend] = {}
+_lock = threading.Lock()
+
+
+def backend_class() -> Type[Backend]:
+    """
+    Get the backend configured for the running command.
+
+    Returns:
+        Type[Backend]
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+
+    name = settings.option("backend")
+
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown backend {name!r}, expected one of: {', '.join(BACKENDS)}"
+        )
+
+    return BACKENDS[name]
+
+
+def capabilities() -> Capabilities:
+    """
+    Get the features of the backend of the running command, without loading it.
+
+    Returns:
+        Capabilities
+    """
+
+    return backend_class().capabilities
+
+
+def get_backend(model: str) -> Backend:
+    """
+    Get the shared backend of a model, as configured for the running command.
+
+    Backends are created once per process, so clients, connections and local models
+    stay warm between the requests of a batch run or a daemon.
+
+    Args:
+        model (str): Model ID, or path of the model for the local backend.
+
+    Returns:
+        Backend
+    """
+
+    backend = backend_class()
+    endpoint = settings.option("endpoint")
+    key = (backend.name, model, endpoint)
+
+    with _lock:
+        if key not in _backends:
+            _backends[key] = backend(model, endpoint)
+
+        return _backends[key]
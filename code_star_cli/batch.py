@@ -0,0 +1,146 @@
+""" Lazy file discovery and a bounded worker pool for batch runs """
+
+import glob
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from code_star_cli.budget import BudgetExceeded
+
+
+T = TypeVar("T")
+
+# Directories that never contain code worth sending to the model
+IGNORED_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".venv",
+    "venv",
+    "node_modules",
+    "__pycache__",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    ".tox",
+    ".nox",
+    "dist",
+    "build",
+}
+
+
+def iter_files(paths: Iterable[str]) -> Iterator[Path]:
+    """
+    Lazily expand files, directories and glob patterns into files.
+
+    Args:
+        paths (Iterable[str]): Files, directories or glob patterns.
+
+    Yields:
+        Path: Each matched file, once.
+    """
+
+    seen = set()
+
+    def walk(directory: str) -> Iterator[str]:
+        for root, dirs, files in os.walk(directory):
+            # Prune in place so os.walk does not descend into ignored directories
+            dirs[:] = sorted(
+                d for d in dirs if d not in IGNORED_DIRS and not d.startswith(".")
+            )
+
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+    for pattern in paths:
+        matches = (
+            iter([pattern])
+            if os.path.exists(pattern)
+            else glob.iglob(pattern, recursive=True)
+        )
+
+        for match in matches:
+            for file in walk(match) if os.path.isdir(match) else iter([match]):
+                path = Path(file)
+
+                if path.resolve() not in seen:
+                    seen.add(path.resolve())
+                    yield path
+
+
+def run_batch(
+    items: Iterable[Path],
+    task: Callable[[Path], T],
+    concurrency: int = 4,
+    admit: Optional[Callable[[Path], bool]] = None,
+) -> Iterator[Tuple[Path, Optional[T], Optional[BaseException]]]:
+    """
+    Run a task over the items with a bounded number of concurrent workers.
+
+    The items are consumed lazily, at most `concurrency` tasks are in flight at a time.
+
+    An item that `admit` refuses waits for the running tasks, which may free what it
+    needs, and is skipped with `BudgetExceeded` if it is still refused once none are
+    left. The following items are tried, they may need less.
+
+    Args:
+        items (Iterable[Path]): Items to process.
+        task (Callable[[Path], T]): Function to run for each item.
+        concurrency (int): Maximum number of concurrent tasks.
+        admit (Callable[[Path], bool], optional): Whether an item can start now.
+
+    Yields:
+        Tuple[Path, Optional[T], Optional[BaseException]]: The item, the result and the error,
+        in completion order.
+    """
+
+    concurrency = max(1, concurrency)
+    iterator = iter(items)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: Dict[Future, Path] = {}
+        # Item waiting for running tasks, and items that never fit
+        waiting: List[Path] = []
+        refused: List[Path] = []
+
+        def submit() -> None:
+            while len(pending) < concurrency:
+                item = waiting.pop() if waiting else next(iterator, None)
+
+                if item is None:
+                    return
+
+                if admit is None or admit(item):
+                    pending[executor.submit(task, item)] = item
+
+                elif pending:
+                    waiting.append(item)
+                    return
+
+                else:
+                    refused.append(item)
+
+        submit()
+
+        while pending or refused:
+            for item in refused:
+                yield item, None, BudgetExceeded("Not analysed, the budget ran out")
+
+            refused.clear()
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+
+                if error is None:
+                    yield item, future.result(), None
+
+                else:
+                    yield item, None, error
+
+            submit()
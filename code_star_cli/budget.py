@@ -0,0 +1,276 @@
+""" Token and request budgets of batch runs """
+
+import math
+import os
+import threading
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from typing import Tuple
+from code_star_cli.chunking import CHARS_PER_TOKEN
+from code_star_cli.metrics import count_tokens
+
+
+# Share of the maximum tokens of a response that it is assumed to take, until the
+# responses of the run show how long they are
+EXPECTED_COMPLETION = 0.25
+
+
+class BudgetExceeded(Exception):
+    """A file was not analysed because it does not fit into the rest of the budget"""
+
+
+class Estimate(NamedTuple):
+    """Expected cost of analysing a file"""
+
+    tokens: int
+    requests: int
+
+
+class Budget:
+    """
+    Limits of the tokens and requests of a batch run.
+
+    Requests charge the tokens they actually used. Files are admitted one at a time
+    against an estimate, which is reserved until the file is done, and no file starts
+    once the charged tokens reach the limit, so the run stops between files instead
+    of in the middle of one.
+    """
+
+    def __init__(
+        self, max_tokens: Optional[int] = None, max_requests: Optional[int] = None
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.max_requests = max_requests
+        self.tokens = 0
+        self.requests = 0
+        self.completion_tokens = 0
+        self.reserved: Dict[Path, Estimate] = {}
+        self._lock = threading.Lock()
+
+    def charge(self, prompt_tokens: int, completion_tokens: int) -> None:
+        """
+        Account for a request that was sent.
+
+        Args:
+            prompt_tokens (int): Tokens of the prompt.
+            completion_tokens (int): Tokens of the response.
+        """
+
+        with self._lock:
+            self.tokens += prompt_tokens + completion_tokens
+            self.completion_tokens += completion_tokens
+            self.requests += 1
+
+    def completion(self, max_tokens: int) -> int:
+        """
+        Estimate the tokens of a response, from the responses of the run so far.
+
+        Args:
+            max_tokens (int): Maximum number of tokens of a response.
+
+        Returns:
+            int
+        """
+
+        with self._lock:
+            if self.requests:
+                return min(max_tokens, self.completion_tokens // self.requests + 1)
+
+        return max(1, int(max_tokens * EXPECTED_COMPLETION))
+
+    def admit(self, path: Path, estimate: Estimate) -> bool:
+        """
+        Reserve the estimated cost of a file, if it fits into the rest of the budget.
+
+        Args:
+            path (Path): File about to be analysed.
+            estimate (Estimate): Its estimated cost.
+
+        Returns:
+            bool: Whether the file can be analysed.
+        """
+
+        with self._lock:
+            tokens = self.tokens + estimate.tokens
+            requests = self.requests + estimate.requests
+
+            for reserved in self.reserved.values():
+                tokens += reserved.tokens
+                requests += reserved.requests
+
+            if self.max_tokens is not None and tokens > self.max_tokens:
+                return False
+
+            if self.max_requests is not None and requests > self.max_requests:
+                return False
+
+            self.reserved[path] = estimate
+
+            return True
+
+    def release(self, path: Path) -> None:
+        """
+        Drop the reservation of a file once it is done, its requests were charged.
+
+        Args:
+            path (Path): Analysed file.
+        """
+
+        with self._lock:
+            self.reserved.pop(path, None)
+
+    def describe(self) -> str:
+        """
+        Render the limits, e.g. for the pre-flight estimate.
+
+        Returns:
+            str
+        """
+
+        limits = []
+
+        if self.max_tokens is not None:
+            limits.append(f"{self.max_tokens} token(s)")
+
+        if self.max_requests is not None:
+            limits.append(f"{self.max_requests} request(s)")
+
+        return " and ".join(limits)
+
+
+# Budget of the running batch, None outside of batch runs or without limits
+active: Optional[Budget] = None
+
+
+@contextmanager
+def budgeting(budget: Optional[Budget]) -> Iterator[Optional[Budget]]:
+    """
+    Charge the requests sent until the block exits to a budget.
+
+    Args:
+        budget (Budget, optional): Budget, None for unlimited runs.
+
+    Yields:
+        Optional[Budget]
+    """
+
+    global active
+
+    previous, active = active, budget
+
+    try:
+        yield budget
+
+    finally:
+        active = previous
+
+
+def charge(prompt: Any, completion: str, usage: Any = None) -> None:
+    """
+    Charge a request to the active budget, if any.
+
+    Args:
+        prompt (Any): Prompt or chat messages.
+        completion (str): Response.
+        usage (Any, optional): Usage reported by the server.
+    """
+
+    if active is None:
+        return
+
+    active.charge(
+        getattr(usage, "prompt_tokens", None) or count_tokens(prompt),
+        getattr(usage, "completion_tokens", None) or count_tokens(completion),
+    )
+
+
+def estimate_cost(tokens: int, chunks: int, overhead: int, completion: int) -> Estimate:
+    """
+    Estimate the cost of analysing a file.
+
+    Files that do not fit into a request are analysed in chunks, whose responses are
+    merged by one more request. Every response is assumed to take `completion` tokens,
+    see `Budget.completion`.
+
+    Args:
+        tokens (int): Tokens of the code.
+        chunks (int): Number of chunks of the code.
+        overhead (int): Tokens of every request besides the code, e.g. the instruction.
+        completion (int): Expected number of tokens of a response.
+
+    Returns:
+        Estimate
+    """
+
+    requests = chunks + (chunks > 1)
+
+    # The merge request reads the responses of the chunks
+    merge = chunks * completion if chunks > 1 else 0
+
+    return Estimate(tokens + requests * (overhead + completion) + merge, requests)
+
+
+def estimate_size(size: int, budget: int) -> Tuple[int, int]:
+    """
+    Estimate the tokens and chunks of a file from its size, without reading it.
+
+    Args:
+        size (int): Size of the file, in bytes.
+        budget (int): Code tokens that fit into a request, see `chunk_budget`.
+
+    Returns:
+        Tuple[int, int]: Tokens and number of chunks.
+    """
+
+    tokens = size // CHARS_PER_TOKEN + 1
+
+    return tokens, max(1, math.ceil(tokens / budget))
+
+
+def priority(path: Path, patterns: Sequence[str]) -> int:
+    """
+    Rank a file by the first pattern it matches.
+
+    Args:
+        path (Path): File.
+        patterns (Sequence[str]): Glob patterns, most important first, e.g. `src/*`.
+
+    Returns:
+        int: Index of the first matching pattern, the number of patterns if none does.
+    """
+
+    name = path.as_posix()
+
+    for index, pattern in enumerate(patterns):
+        if fnmatch(name, pattern) or fnmatch(path.name, pattern):
+            return index
+
+    return len(patterns)
+
+
+def schedule(files: Iterable[Path], patterns: Sequence[str] = ()) -> List[Path]:
+    """
+    Order files by priority, then largest first.
+
+    Starting the longest analyses first keeps the workers busy until the end of the
+    run, instead of waiting for a large file that came last.
+
+    Args:
+        files (Iterable[Path]): Files to analyse.
+        patterns (Sequence[str]): Glob patterns of the files to analyse first, most
+            important first.
+
+    Returns:
+        List[Path]
+    """
+
+    def size(path: Path) -> int:
+        try:
+            return os.path.getsize(path)
+
+        except OSError:
+            return 0
+
+    return sorted(files, key=lambda path: (priority(path, patterns), -size(path)))
@@ -0,0 +1,326 @@
+""" Content-addressed on-disk cache for model responses """
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+from code_star_cli.config import settings
+
+
+# Number of completions kept per model for prefix lookups, each lookup scans them
+COMPLETION_ENTRIES = 256
+
+
+def cache_key(**params: Any) -> str:
+    """
+    Hash the request parameters into a cache key.
+
+    Args:
+        **params: Everything that determines the response, e.g. model, messages and max_tokens.
+
+    Returns:
+        str: Hex digest of the canonical JSON encoding of the parameters.
+    """
+
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache with a TTL, persisted in a SQLite database.
+
+    The database is opened lazily, so merely importing the module has no side effects.
+    Cache failures never fail a request, they are treated as misses.
+    """
+
+    def __init__(self, path: Path, max_size: int, ttl: float) -> None:
+        """
+        Args:
+            path (Path): SQLite database file.
+            max_size (int): Maximum total size of the cached responses, in bytes.
+            ttl (float): Number of seconds a response stays valid.
+        """
+
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Open the database on first use.
+
+        A cache that cannot be opened, e.g. in a read-only directory, is turned off
+        for the rest of the process, so every request does not try again.
+
+        Raises:
+            sqlite3.Error: The database could not be opened.
+        """
+
+        if self._connection is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(
+                    self.path, check_same_thread=False, timeout=30
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL, hits INTEGER DEFAULT 0)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    "scope TEXT NOT NULL, prompt TEXT NOT NULL, completion TEXT NOT NULL, "
+                    "created REAL NOT NULL, PRIMARY KEY (scope, prompt))"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS completions_created "
+                    "ON completions (scope, created)"
+                )
+                connection.commit()
+
+            except (OSError, sqlite3.Error) as error:
+                settings.cache_enabled = False
+                raise sqlite3.OperationalError(
+                    f"Cannot open the cache at {self.path}: {error}"
+                ) from error
+
+            self._connection = connection
+
+        return self._connection
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response, refreshing its LRU position on a hit.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Optional[str]: The cached response, None on a miss or if it expired.
+        """
+
+        try:
+            with self._lock:
+                row = self.connection.execute(
+                    "SELECT value FROM responses WHERE key = ? AND created >= ?",
+                    (key, time.time() - self.ttl),
+                ).fetchone()
+
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                self.connection.execute(
+                    "UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?",
+                    (time.time(), key),
+                )
+                self.connection.commit()
+                self.hits += 1
+
+                return row[0]
+
+        except sqlite3.Error:
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store a response, then evict expired and least recently used entries.
+
+        Args:
+            key (str): Cache key.
+            value (str): Response to cache.
+        """
+
+        now = time.time()
+        size = len(value.encode("utf-8"))
+
+        if size > self.max_size:
+            return
+
+        try:
+            with self._lock:
+                db = self.connection
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now),
+                )
+                db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses")
+                excess = total.fetchone()[0] - self.max_size
+
+                if excess > 0:
+                    evicted = []
+
+                    for old_key, old_size in db.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed"
+                    ):
+                        if excess <= 0:
+                            break
+
+                        evicted.append((old_key,))
+                        excess -= old_size
+
+                    db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+                db.commit()
+
+        except sqlite3.Error:
+            pass
+
+    def continuation(self, scope: str, prompt: str) -> Optional[str]:
+        """
+        Find a cached completion that the prompt extends, e.g. while the user types.
+
+        A completion of an earlier prompt still applies if the new prompt starts with
+        the earlier prompt and the text typed since then matches the start of its
+        completion. The rest of that completion is returned.
+
+        Args:
+            scope (str): Cache key of everything but the prompt, e.g. the model.
+            prompt (str): New prompt.
+
+        Returns:
+            Optional[str]: The rest of the longest matching completion, None on a miss.
+        """
+
+        try:
+            with self._lock:
+                row = self.connection.execute(
+                    "SELECT prompt, completion FROM completions "
+                    "WHERE scope = ?1 AND created >= ?2 "
+                    "AND length(prompt) <= length(?3) "
+                    "AND length(prompt) + length(completion) > length(?3) "
+                    "AND substr(?3, 1, length(prompt)) = prompt "
+                    "AND substr(prompt || completion, 1, length(?3)) = ?3 "
+                    "ORDER BY length(prompt) DESC LIMIT 1",
+                    (scope, time.time() - self.ttl, prompt),
+                ).fetchone()
+
+        except sqlite3.Error:
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        rest = row[1][len(prompt) - len(row[0]) :]
+
+        # A completion that was typed up to trailing whitespace is used up
+        if not rest.strip():
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return rest
+
+    def add_completion(self, scope: str, prompt: str, completion: str) -> None:
+        """
+        Remember a completion for prefix lookups, keeping the most recent ones.
+
+        Args:
+            scope (str): Cache key of everything but the prompt, e.g. the model.
+            prompt (str): Prompt.
+            completion (str): Generated text.
+        """
+
+        if not completion.strip():
+            return
+
+        try:
+            with self._lock:
+                db = self.connection
+                db.execute(
+                    "INSERT OR REPLACE INTO completions (scope, prompt, completion, created) "
+                    "VALUES (?, ?, ?, ?)",
+                    (scope, prompt, completion, time.time()),
+                )
+                db.execute(
+                    "DELETE FROM completions WHERE scope = ? AND created <= ("
+                    "SELECT created FROM completions WHERE scope = ? "
+                    "ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                    (scope, scope, COMPLETION_ENTRIES),
+                )
+                db.commit()
+
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict[str, Union[int, float, str]]:
+        """
+        Summarise the cache contents.
+
+        Returns:
+            Dict[str, Union[int, float, str]]
+        """
+
+        with self._lock:
+            entries, size, hits = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) "
+                "FROM responses"
+            ).fetchone()
+
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": hits,
+        }
+
+    def clear(self) -> int:
+        """
+        Remove every cached response.
+
+        Returns:
+            int: Number of removed entries.
+        """
+
+        with self._lock:
+            removed = self.connection.execute("DELETE FROM responses").rowcount
+            removed += self.connection.execute("DELETE FROM completions").rowcount
+            self.connection.commit()
+            self.connection.execute("VACUUM")
+
+        return removed
+
+
+# Caches by location and limits, a daemon serves invocations with different settings
+_caches: Dict[Tuple[Path, int, float], ResponseCache] = {}
+
+
+def get_cache() -> ResponseCache:
+    """
+    Get the process-wide response cache of the location and limits of the settings.
+
+    Returns:
+        ResponseCache
+    """
+
+    key = (
+        settings.cache_dir / "responses.sqlite3",
+        settings.cache_max_size,
+        settings.cache_ttl,
+    )
+
+    if key not in _caches:
+        _caches[key] = ResponseCache(*key)
+
+    return _caches[key]
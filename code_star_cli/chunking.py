@@ -0,0 +1,178 @@
+""" Token-aware splitting of source code into chunks """
+
+import ast
+from typing import List, NamedTuple, Optional
+
+
+# Conservative estimate, code tokenizes denser than prose
+CHARS_PER_TOKEN = 3
+
+
+class Chunk(NamedTuple):
+    """A contiguous range of lines of a source file"""
+
+    text: str
+    start: int
+    end: int
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without loading a tokenizer.
+
+    Args:
+        text (str): Text to estimate.
+
+    Returns:
+        int
+    """
+
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def python_boundaries(code: str) -> Optional[List[int]]:
+    """
+    Find the lines where top-level statements of Python code start.
+
+    Functions and classes keep their decorators and preceding comments.
+
+    Args:
+        code (str): Python source code.
+
+    Returns:
+        Optional[List[int]]: Zero-based line numbers, None if the code does not parse.
+    """
+
+    try:
+        tree = ast.parse(code)
+
+    except (SyntaxError, ValueError):
+        return None
+
+    lines = code.splitlines()
+    boundaries = []
+
+    for node in tree.body:
+        start = min(
+            [node.lineno]
+            + [decorator.lineno for decorator in getattr(node, "decorator_list", [])]
+        )
+        start -= 1
+
+        # Attach the comments right above the statement to it
+        while start > 0 and lines[start - 1].lstrip().startswith("#"):
+            start -= 1
+
+        boundaries.append(start)
+
+    return boundaries
+
+
+def split_lines(lines: List[str], offset: int, budget: int) -> List[Chunk]:
+    """
+    Split lines into windows under the token budget, preferring to cut at blank lines.
+
+    Args:
+        lines (List[str]): Lines, including their line endings.
+        offset (int): Zero-based line number of the first line.
+        budget (int): Maximum number of tokens per chunk.
+
+    Returns:
+        List[Chunk]
+    """
+
+    chunks: List[Chunk] = []
+    start = 0
+
+    while start < len(lines):
+        end, tokens, blank = start, 0, None
+
+        while end < len(lines) and (
+            end == start or tokens + estimate_tokens(lines[end]) <= budget
+        ):
+            tokens += estimate_tokens(lines[end])
+
+            if not lines[end].strip():
+                blank = end
+
+            end += 1
+
+        # Cut after the last blank line if it keeps at least half of the window
+        if (
+            end < len(lines)
+            and blank is not None
+            and blank + 1 - start > (end - start) // 2
+        ):
+            end = blank + 1
+
+        chunks.append(
+            Chunk("".join(lines[start:end]), offset + start + 1, offset + end)
+        )
+        start = end
+
+    return chunks
+
+
+def split_code(code: str, budget: int, filename: str = "") -> List[Chunk]:
+    """
+    Split source code into chunks under a token budget.
+
+    Python code is split at top-level function and class boundaries, other languages,
+    or definitions that are too large by themselves, fall back to line windows.
+
+    Args:
+        code (str): Source code.
+        budget (int): Maximum number of tokens per chunk.
+        filename (str): Name of the file, used to detect the language.
+
+    Returns:
+        List[Chunk]: The chunks, a single chunk if the code fits.
+    """
+
+    lines = code.splitlines(keepends=True)
+
+    if estimate_tokens(code) <= budget:
+        return [Chunk(code, 1, len(lines))]
+
+    boundaries = (
+        python_boundaries(code)
+        if filename.endswith((".py", ".pyi")) or not filename
+        else None
+    )
+
+    if not boundaries:
+        return split_lines(lines, 0, budget)
+
+    # Segments between boundaries, the first one holds the module header
+    starts = sorted({0, *boundaries})
+    segments = [
+        (start, end)
+        for start, end in zip(starts, starts[1:] + [len(lines)])
+        if start < end
+    ]
+
+    chunks: List[Chunk] = []
+    start, tokens = segments[0][0], 0
+
+    for segment_start, segment_end in segments:
+        size = estimate_tokens("".join(lines[segment_start:segment_end]))
+
+        if tokens and tokens + size > budget:
+            chunks.append(
+                Chunk("".join(lines[start:segment_start]), start + 1, segment_start)
+            )
+            start, tokens = segment_start, 0
+
+        if size > budget:
+            chunks.extend(
+                split_lines(lines[segment_start:segment_end], segment_start, budget)
+            )
+            start, tokens = segment_end, 0
+            continue
+
+        tokens += size
+
+    if start < len(lines):
+        chunks.append(Chunk("".join(lines[start:]), start + 1, len(lines)))
+
+    return chunks
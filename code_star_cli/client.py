@@ -0,0 +1,90 @@
+""" Shared, pooled inference clients """
+
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from code_star_cli.config import settings
+
+if TYPE_CHECKING:
+    from huggingface_hub import InferenceClient
+
+
+_adapter: Optional[HTTPAdapter] = None
+# Clients by target, timeout and headers, a daemon serves invocations with different
+# settings
+_clients: Dict[
+    Tuple[str, Optional[float], Tuple[Tuple[str, str], ...]], "InferenceClient"
+] = {}
+_lock = threading.Lock()
+
+
+def http_adapter() -> HTTPAdapter:
+    """
+    Get the HTTP adapter shared by every session.
+
+    huggingface_hub creates one `requests.Session` per thread, mounting the same adapter
+    in all of them makes the threads of a batch run share one keep-alive connection pool.
+    The sessions of OpenAI-compatible servers share it too.
+
+    Returns:
+        HTTPAdapter
+    """
+
+    global _adapter
+
+    if _adapter is None:
+        _adapter = HTTPAdapter(
+            pool_connections=settings.pool_size,
+            pool_maxsize=settings.pool_size,
+        )
+
+    return _adapter
+
+
+def session_factory() -> requests.Session:
+    """
+    Create a session that uses the shared connection pool.
+
+    Returns:
+        requests.Session
+    """
+
+    session = requests.Session()
+    session.mount("http://", http_adapter())
+    session.mount("https://", http_adapter())
+
+    return session
+
+
+def get_client(target: str) -> "InferenceClient":
+    """
+    Get the shared inference client of a model or an endpoint.
+
+    Clients are created once per process and configuration. When the target is an endpoint, requests
+    are sent to it instead of the Inference API, e.g. to a local TGI server.
+
+    Args:
+        target (str): Model ID or URL of the endpoint.
+
+    Returns:
+        InferenceClient
+    """
+
+    # huggingface_hub is slow to import, other backends do not pay for it
+    from huggingface_hub import InferenceClient, configure_http_backend
+
+    with _lock:
+        if not _clients:
+            configure_http_backend(backend_factory=session_factory)
+
+        key = (target, settings.timeout, tuple(sorted(settings.headers.items())))
+
+        if key not in _clients:
+            _clients[key] = InferenceClient(
+                target,
+                timeout=settings.timeout,
+                headers=settings.headers or None,
+            )
+
+        return _clients[key]
@@ -0,0 +1,112 @@
+""" Coalescing of identical requests in batch runs """
+
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Coalescer:
+    """
+    Single-flight table of requests, keyed by the hash of their prompt.
+
+    The first caller of a key sends the request, callers of the same key that arrive
+    while it is in flight, or after it completed, share its result. Vendored copies
+    and generated boilerplate then cost one request instead of one per file, even
+    when the response cache is disabled. Failed requests are not shared with later
+    callers, they try again.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, Future] = {}
+        self.sent = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+
+    def run(self, key: str, call: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Run a request, or wait for the identical request that is already running.
+
+        Args:
+            key (str): Hash of everything that determines the response.
+            call (Callable[[], T]): Sends the request.
+
+        Returns:
+            Tuple[T, bool]: The result, and whether it was shared with another caller.
+        """
+
+        with self._lock:
+            future = self.calls.get(key)
+            owner = future is None
+
+            if future is None:
+                future = self.calls[key] = Future()
+                self.sent += 1
+
+        if not owner:
+            result = future.result()
+
+            # Only a shared success saved a request, a shared failure saved nothing
+            with self._lock:
+                self.saved += 1
+
+            return result, True
+
+        try:
+            result = call()
+
+        except BaseException as error:
+            with self._lock:
+                del self.calls[key]
+
+            future.set_exception(error)
+            raise
+
+        future.set_result(result)
+
+        return result, False
+
+
+# Coalescer of the running batch, None outside of batch runs
+active: Optional[Coalescer] = None
+
+
+@contextmanager
+def coalescing() -> Iterator[Coalescer]:
+    """
+    Coalesce identical requests until the block exits.
+
+    Yields:
+        Coalescer: Counts the requests sent and saved.
+    """
+
+    global active
+
+    previous, active = active, Coalescer()
+
+    try:
+        yield active
+
+    finally:
+        active = previous
+
+
+def coalesce(key: str, call: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Run a request through the active coalescer, if any.
+
+    Args:
+        key (str): Hash of everything that determines the response.
+        call (Callable[[], Any]): Sends the request.
+
+    Returns:
+        Tuple[Any, bool]: The result, and whether it was shared with another caller.
+    """
+
+    if active is None:
+        return call(), False
+
+    return active.run(key, call)
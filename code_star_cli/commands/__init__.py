@@ -1,14 +1,55 @@
 """ CodeStar CLI commands """
 
-from code_star_cli.commands.ai import ai
-from code_star_cli.commands.chat import chat
-from code_star_cli.commands.completions import completions
-from code_star_cli.commands.document import document
-from code_star_cli.commands.enhance import enhance
-from code_star_cli.commands.review import review
-from code_star_cli.commands.scan import scan
-from code_star_cli.commands.test import test
-
-
-# Add your commands here
-command_list = [ai, chat, completions, document, enhance, review, scan, test]
+# Add your commands here: command name -> (module, short help).
+# Modules are only imported when their command runs, keep the help in sync with the docstring.
+command_list = {
+    "ai": (
+        "code_star_cli.commands.ai",
+        "Interact with CodeStar using natural language.",
+    ),
+    "analyze": (
+        "code_star_cli.commands.analyze",
+        "Scan, review, enhance, document and test the provided code in a single report.",
+    ),
+    "cache": (
+        "code_star_cli.commands.cache",
+        "Inspect or clear the on-disk response cache.",
+    ),
+    "chat": (
+        "code_star_cli.commands.chat",
+        "Engage in a chat session with CodeStar.",
+    ),
+    "completions": (
+        "code_star_cli.commands.completions",
+        "Generate code completions based on the provided code snippet.",
+    ),
+    "document": (
+        "code_star_cli.commands.document",
+        "Add documentation to the provided code.",
+    ),
+    "enhance": (
+        "code_star_cli.commands.enhance",
+        "Improve code quality by applying best practices and enhancements suggested by CodeStar.",
+    ),
+    "index": (
+        "code_star_cli.commands.index",
+        "Index a repository so that `ai`, `review` and `scan` can add related code to their prompts.",
+    ),
+    "review": (
+        "code_star_cli.commands.review",
+        "Perform code reviews to analyze code quality and adherence to best practices, "
+        "to provide developers with suggestions for improvement",
+    ),
+    "scan": (
+        "code_star_cli.commands.scan",
+        "Scan the provided code for security vulnerabilities to provide suggestions on how to improve it.",
+    ),
+    "serve": (
+        "code_star_cli.commands.serve",
+        "Serve CodeStar commands from a local daemon, skipping the startup cost of each run.",
+    ),
+    "test": (
+        "code_star_cli.commands.test",
+        "Generate tests for the provided code.",
+    ),
+}
@@ -1,10 +1,11 @@
 """ Natural language interactions like command generation """
 
+import asyncio
 from typing import Annotated, Optional
 import typer
-from huggingface_hub import InferenceClient
 from rich import print
-from code_star_cli import CHAT_LLM, SYSTEM_MESSAGE, create_panel
+from code_star_cli import api, create_panel
+from code_star_cli.streaming import stream_response, sync_chunks
 
 
 def ai(
@@ -36,6 +37,23 @@ def ai(
             help="Maximum number of tokens allowed in the response.",
         ),
     ] = 2048,
+    stream: Annotated[
+        bool,
+        typer.Option(
+            "--stream",
+            "-s",
+            help="Render the response incrementally as it is generated.",
+        ),
+    ] = False,
+    related: Annotated[
+        Optional[int],
+        typer.Option(
+            "--related",
+            "-r",
+            min=1,
+            help="Add up to this many related snippets of the indexed repository to the prompt, see `code-star index`.",
+        ),
+    ] = None,
 ) -> None:
     """
     Interact with CodeStar using natural language.
@@ -45,33 +63,49 @@ def ai(
     code-star ai "Generate a function to calculate the area of a circle"
     code-star ai -c code.py "Explain the code"
     code-star ai -o output.md "How to install HuggingFace Transformers?"
+    code-star ai -s "Write a binary search in Rust"
+    code-star ai -r 8 "Where are the retries configured?"
     ```
     """
 
-    client = InferenceClient(CHAT_LLM)
+    filename = code.name if code else ""
 
     try:
-        response = client.chat_completion(
-            messages=[
-                SYSTEM_MESSAGE,
-                {
-                    "role": "user",
-                    "content": (
-                        f"{prompt}:\n```\n{code.read()}\n```" if code else prompt
-                    ),
-                },
-            ],
-            max_tokens=max_tokens,
-        )
+        source = code.read() if code else None
 
         if output:
             with output as file:
-                file.write(str(response.choices[0].message.content))
+                if stream:
+                    stream_response(
+                        sync_chunks(
+                            api.ai_stream(prompt, source, filename, max_tokens, related)
+                        ),
+                        file,
+                    )
+
+                else:
+                    file.write(
+                        asyncio.run(
+                            api.ai(prompt, source, filename, max_tokens, related)
+                        )
+                    )
 
             print(f"Output [bold green]saved[/bold green] to {output.name}.")
 
+        elif stream:
+            stream_response(
+                sync_chunks(
+                    api.ai_stream(prompt, source, filename, max_tokens, related)
+                )
+            )
+
         else:
-            print(create_panel("CodeStar", str(response.choices[0].message.content)))
+            print(
+                create_panel(
+                    "CodeStar",
+                    asyncio.run(api.ai(prompt, source, filename, max_tokens, related)),
+                )
+            )
 
     except Exception as error:
         print(f"[bold red]Error[/bold red]: {error}")
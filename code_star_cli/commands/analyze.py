@@ -0,0 +1,85 @@
+""" Run several analyses of the provided code in one report """
+
+from typing import Annotated, List, Optional
+import typer
+from code_star_cli.analysis import Analysis, analyse, combine_instructions
+from code_star_cli.commands import options
+
+
+def analyze(
+    code: Annotated[
+        List[str],
+        typer.Argument(
+            help="Files, directories or glob patterns containing code to analyse."
+        ),
+    ],
+    analysis: Annotated[
+        Optional[List[Analysis]],
+        typer.Option(
+            "--analysis",
+            "-a",
+            help="Analysis to run, can be repeated. Defaults to all of them.",
+        ),
+    ] = None,
+    parallel: Annotated[
+        bool,
+        typer.Option(
+            "--parallel",
+            help="Send one request per analysis instead of combining them into one request.",
+        ),
+    ] = False,
+    output: options.Output = None,
+    output_dir: options.OutputDir = None,
+    concurrency: options.Concurrency = 4,
+    token_budget: options.TokenBudget = None,
+    max_requests: options.MaxRequests = None,
+    priority: options.Priority = None,
+    incremental: options.Incremental = False,
+    since: options.Since = None,
+    related: options.Related = None,
+    max_tokens: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-tokens",
+            "-t",
+            help="Maximum number of tokens allowed in the response of each analysis.",
+        ),
+    ] = 2048,
+) -> None:
+    """
+    Scan, review, enhance, document and test the provided code in a single report.
+
+    The analyses share one request when the code and their responses fit into the
+    context window, and parallel requests with a shared prompt prefix otherwise.
+
+    Examples:
+    ```shell
+    code-star analyze code.py
+    code-star analyze code.py -a scan -a review
+    code-star analyze src/ -j 8 -o audit.md
+    code-star analyze src/ --token-budget 500000 -P 'src/core/*' -o audit.md
+    code-star analyze 'src/**/*.py' -d reports/
+    code-star analyze --incremental src/ -o audit.md
+    code-star analyze --parallel code.py
+    ```
+    """
+
+    # Ordered like the sections of the report
+    analyses = [item for item in Analysis if item in (analysis or list(Analysis))]
+
+    analyse(
+        combine_instructions(analyses),
+        code,
+        output=output,
+        output_dir=output_dir,
+        concurrency=concurrency,
+        token_budget=token_budget,
+        max_requests=max_requests,
+        priorities=priority or (),
+        max_tokens=max_tokens,
+        incremental=incremental,
+        since=since,
+        related=related,
+        analyses=analyses,
+        parallel=parallel,
+    )
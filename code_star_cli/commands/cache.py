@@ -0,0 +1,59 @@
+""" Manage the response cache """
+
+from enum import Enum
+from typing import Annotated
+import typer
+from rich import print
+from code_star_cli import create_panel
+from code_star_cli.cache import get_cache
+
+
+class CacheAction(str, Enum):
+    """Actions supported by the cache command"""
+
+    STATS = "stats"
+    CLEAR = "clear"
+
+
+def cache(
+    action: Annotated[
+        CacheAction,
+        typer.Argument(help="Show cache statistics or clear the cache."),
+    ],
+) -> None:
+    """
+    Inspect or clear the on-disk response cache.
+
+    Examples:
+    ```shell
+    code-star cache stats
+    code-star cache clear
+    ```
+    """
+
+    response_cache = get_cache()
+
+    try:
+        if action == CacheAction.CLEAR:
+            removed = response_cache.clear()
+            print(
+                f"Cache [bold green]cleared[/bold green], {removed} response(s) removed."
+            )
+
+        else:
+            stats = response_cache.stats()
+            print(
+                create_panel(
+                    "Cache",
+                    "| Statistic | Value |\n| --- | --- |\n"
+                    f"| Location | `{stats['path']}` |\n"
+                    f"| Responses | {stats['entries']} |\n"
+                    f"| Size | {int(stats['size']) / 1024:.1f} KiB "
+                    f"of {int(stats['max_size']) / 1024 / 1024:.0f} MiB |\n"
+                    f"| TTL | {float(stats['ttl']) / 3600:.0f} hours |\n"
+                    f"| Hits | {stats['hits']} |",
+                )
+            )
+
+    except Exception as error:
+        print(f"[bold red]Error[/bold red]: {error}")
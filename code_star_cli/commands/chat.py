@@ -1,11 +1,17 @@
 """ Chat with CodeStar """
 
+import asyncio
 import json
+import time
 from typing import Annotated, Optional
 import typer
-from huggingface_hub import InferenceClient
 from rich import print
-from code_star_cli import CHAT_LLM, SYSTEM_MESSAGE, create_panel
+from code_star_cli import api, create_panel
+from code_star_cli.config import settings
+from code_star_cli.context import ContextWindow
+from code_star_cli.instructions import system_message
+from code_star_cli.sessions import Session, list_sessions
+from code_star_cli.streaming import stream_response, sync_chunks
 
 
 def chat(
@@ -35,6 +41,37 @@ def chat(
             help="Maximum number of tokens allowed in the response.",
         ),
     ] = 2048,
+    summarize: Annotated[
+        bool,
+        typer.Option(
+            "--summarize",
+            help="Summarise messages that no longer fit into the context window.",
+        ),
+    ] = False,
+    stream: Annotated[
+        bool,
+        typer.Option(
+            "--stream",
+            "-s",
+            help="Render the responses incrementally as they are generated.",
+        ),
+    ] = False,
+    resume: Annotated[
+        Optional[str],
+        typer.Option(
+            "--resume",
+            "-r",
+            help="Session to resume, 'last' for the most recent one.",
+        ),
+    ] = None,
+    list_all: Annotated[
+        bool,
+        typer.Option(
+            "--list",
+            "-l",
+            help="List the saved sessions and exit.",
+        ),
+    ] = False,
 ) -> None:
     """
     Engage in a chat session with CodeStar.
@@ -52,15 +89,62 @@ def chat(
 
     # Import chat history then export it after the chat session
     code-star chat -h chat_history.json -e chat_history.json
+
+    # Stream the responses as they are generated
+    code-star chat -s
+
+    # Keep a summary of the messages that no longer fit into the context window
+    code-star chat -h chat_history.json --summarize
+
+    # List the saved sessions, then resume one of them or the last one
+    code-star chat -l
+    code-star chat -r 20240501-093000-1a2b
+    code-star chat -r last
     ```
+
+    Every session is saved as it goes, turn by turn.
     """
 
-    client = InferenceClient(CHAT_LLM)
+    budget = settings.context_tokens - (max_tokens or 0)
+
+    try:
+        if list_all:
+            print(
+                create_panel(
+                    "Sessions",
+                    "| Session | Updated | Size | First message |\n"
+                    "| --- | --- | --- | --- |\n"
+                    + "\n".join(
+                        f"| {info.id} "
+                        f"| {time.strftime('%Y-%m-%d %H:%M', time.localtime(info.updated))} "
+                        f"| {info.size / 1024:.1f} KiB | {info.title} |"
+                        for info in list_sessions(settings.sessions_dir)
+                    ),
+                )
+            )
+            return
+
+        if resume:
+            # Only the end of the session that fits into the context window is loaded
+            session = Session.open(settings.sessions_dir, resume)
+            context = ContextWindow(
+                [
+                    session.head() or system_message(),
+                    *session.tail(budget, ContextWindow.count),
+                ],
+                budget,
+                summarize,
+            )
 
-    messages = [SYSTEM_MESSAGE]
+        else:
+            context = ContextWindow(
+                json.load(history) if history else [system_message()], budget, summarize
+            )
+            session = Session.create(settings.sessions_dir, context.messages)
 
-    if history:
-        messages = json.load(history)
+    except (OSError, ValueError) as error:
+        print(f"[bold red]Error[/bold red]: {error}")
+        return
 
     print(
         create_panel(
@@ -79,19 +163,41 @@ def chat(
         if message.lower() in ("exit", "quit"):
             break
 
-        messages.append({"role": "user", "content": message})
+        question = {"role": "user", "content": message}
+        context.append(question)
 
         try:
-            response = client.chat_completion(messages=messages, max_tokens=max_tokens)
-            llm_message = str(response.choices[0].message.content)
+            if stream:
+                llm_message = stream_response(
+                    sync_chunks(
+                        api.chat_stream(context.window(), max_tokens, use_cache=False)
+                    )
+                )
 
-            messages.append({"role": "assistant", "content": llm_message})
+            else:
+                llm_message = asyncio.run(
+                    api.chat(context.window(), max_tokens, use_cache=False)
+                )
 
-            print(create_panel("CodeStar", llm_message))
+                print(create_panel("CodeStar", llm_message))
+
+            # Stored first, a failed write leaves only the question to take back
+            answer = {"role": "assistant", "content": llm_message}
+            session.append(question, answer)
+            context.append(answer)
 
         except Exception as error:
+            # Keep the session going, the message can be sent again
+            context.pop()
             print(f"[bold red]Error[/bold red]: {error}")
-            break
+
+    session.close()
+
+    if session.saved:
+        print(
+            f"Session [bold green]saved[/bold green] as {session.id}, "
+            f"resume it with: code-star chat -r {session.id}"
+        )
 
     export_requested = False
 
@@ -117,7 +223,7 @@ def chat(
             )
 
             with open(file_name, "w", encoding="utf-8") as file:
-                json.dump(messages, file, indent=2)
+                json.dump(list(session.messages()), file, indent=2)
 
     if export:
-        json.dump(messages, export, indent=2)
+        json.dump(list(session.messages()), export, indent=2)
@@ -1,14 +1,43 @@
 """ Generate code completions """
 
+import asyncio
 from typing import Annotated, Optional
 import typer
-from huggingface_hub import InferenceClient
 from rich import print
-from code_star_cli import COMPLETION_LLM, create_panel
+from code_star_cli import api, create_panel
+from code_star_cli.prefetch import prefetch
+from code_star_cli.streaming import stream_response, sync_chunks
 
 
 def completions(
-    code: Annotated[str, typer.Argument(help="Code snippet to complete.")],
+    code: Annotated[
+        Optional[str],
+        typer.Argument(help="Code snippet to complete, the code before the cursor."),
+    ] = None,
+    suffix: Annotated[
+        Optional[str],
+        typer.Option(
+            "--suffix",
+            help="Code after the cursor, to fill in the middle.",
+        ),
+    ] = None,
+    source: Annotated[
+        Optional[typer.FileText],
+        typer.Option(
+            "--file",
+            "-f",
+            help="File to complete at the cursor, instead of a snippet.",
+            encoding="utf-8",
+        ),
+    ] = None,
+    cursor: Annotated[
+        Optional[int],
+        typer.Option(
+            "--cursor",
+            help="Offset of the cursor in the file, in characters. Defaults to the end.",
+            min=0,
+        ),
+    ] = None,
     language: Annotated[
         Optional[str],
         typer.Option(
@@ -34,6 +63,31 @@ def completions(
             help="Maximum number of tokens allowed in the response.",
         ),
     ] = 128,
+    stream: Annotated[
+        bool,
+        typer.Option(
+            "--stream",
+            "-s",
+            help="Render the completion incrementally as it is generated, single candidate only.",
+        ),
+    ] = False,
+    candidates: Annotated[
+        int,
+        typer.Option(
+            "--candidates",
+            "-n",
+            help="Number of alternative completions, sampled in one request.",
+            min=1,
+        ),
+    ] = 1,
+    prefetch_next: Annotated[
+        bool,
+        typer.Option(
+            "--prefetch",
+            "-p",
+            help="Complete the code followed by this completion in the background.",
+        ),
+    ] = False,
 ) -> None:
     """
     Generate code completions based on the provided code snippet.
@@ -43,28 +97,101 @@ def completions(
     code-star completions 'def hello_world():'
     code-star completions -l python 'def hello_world():'
     code-star completions -o code-completions.md 'def hello_world():'
+    code-star completions -s 'def hello_world():'
+
+    # Serve the next completion from the cache once this one is accepted
+    code-star completions -p 'def hello_world():'
+
+    # Fill in the middle
+    code-star completions 'def add(a, b):' --suffix 'print(add(1, 2))'
+    code-star completions -f main.py --cursor 120
+
+    # Rank and deduplicate three alternatives
+    code-star completions -n 3 'def hello_world():'
     ```
-    """
 
-    client = InferenceClient(COMPLETION_LLM)
+    Completions are cached by prefix: when the code extends code that was completed
+    before and matches its completion so far, the rest of it is served without a request.
+    """
 
     try:
-        response = client.text_generation(
-            f"```{language if language else ''}\n{code}",
-            max_new_tokens=max_tokens,
-        )
+        if source:
+            with source as file:
+                text = file.read()
+
+            offset = len(text) if cursor is None else min(cursor, len(text))
+            code = text[:offset]
+            suffix = text[offset:] if suffix is None else suffix
+
+        if code is None:
+            raise ValueError("Provide a code snippet or a file to complete.")
+
+        # Fill in the middle when there is code after the cursor
+        _, prefix = api.completion_prompt(code, suffix, language)
 
-        if output:
+        # Panels show the generated code in a code block, files get it as is
+        shown = prefix or f"```{language if language else ''}\n"
+
+        if candidates > 1:
+            alternatives = asyncio.run(
+                api.complete_candidates(code, candidates, suffix, language, max_tokens)
+            )
+            middle = alternatives[0].text if alternatives else ""
+
+            if output:
+                with output as file:
+                    file.write(
+                        "\n\n".join(
+                            f"## Candidate {index}\n\n{shown}{candidate.text}\n```"
+                            for index, candidate in enumerate(alternatives, 1)
+                        )
+                    )
+
+                print(f"Output [bold green]saved[/bold green] to {output.name}.")
+
+            else:
+                for index, candidate in enumerate(alternatives, 1):
+                    print(
+                        create_panel(
+                            f"Candidate {index}",
+                            shown + candidate.text,
+                            f"score {candidate.score:.2f}",
+                        )
+                    )
+
+        elif output:
             with output as file:
-                file.write(f"```{language if language else ''}\n{code + response}")
+                if stream:
+                    middle = stream_response(
+                        sync_chunks(
+                            api.complete_stream(code, suffix, language, max_tokens)
+                        ),
+                        file,
+                        prefix=prefix,
+                    )[len(prefix) :]
+
+                else:
+                    middle = asyncio.run(
+                        api.complete(code, suffix, language, max_tokens)
+                    )
+                    file.write(prefix + middle)
 
             print(f"Output [bold green]saved[/bold green] to {output.name}.")
 
+        elif stream:
+            middle = stream_response(
+                sync_chunks(api.complete_stream(code, suffix, language, max_tokens)),
+                prefix=shown,
+            )[len(shown) :]
+
         else:
-            print(
-                create_panel(
-                    "CodeStar", f"```{language if language else ''}\n{code + response}"
-                )
+            middle = asyncio.run(api.complete(code, suffix, language, max_tokens))
+            print(create_panel("CodeStar", shown + middle))
+
+        if prefetch_next and middle:
+            # The prompt of the next completion, once this one is accepted
+            prefetch(
+                api.completion_prompt(code + middle, suffix, language)[0], max_tokens
             )
 
     except Exception as error:
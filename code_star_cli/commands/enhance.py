@@ -1,36 +1,29 @@
 """ Improve code quality """
 
-from typing import Annotated, Optional
+from typing import Annotated, List
 import typer
-from huggingface_hub import InferenceClient
-from rich import print
-from code_star_cli import CHAT_LLM, SYSTEM_MESSAGE, create_panel
+from code_star_cli import instructions
+from code_star_cli.analysis import analyse
+from code_star_cli.commands import options
 
 
 def enhance(
     code: Annotated[
-        typer.FileText,
+        List[str],
         typer.Argument(
-            help="File containing code to enhance for quality improvements."
+            help="Files, directories or glob patterns containing code to enhance for quality improvements."
         ),
     ],
-    output: Annotated[
-        Optional[typer.FileTextWrite],
-        typer.Option(
-            "--output",
-            "-o",
-            help="Output file to write the response to.",
-            encoding="utf-8",
-        ),
-    ] = None,
-    max_tokens: Annotated[
-        Optional[int],
-        typer.Option(
-            "--max-tokens",
-            "-t",
-            help="Maximum number of tokens allowed in the response.",
-        ),
-    ] = 2048,
+    output: options.Output = None,
+    output_dir: options.OutputDir = None,
+    concurrency: options.Concurrency = 4,
+    token_budget: options.TokenBudget = None,
+    max_requests: options.MaxRequests = None,
+    priority: options.Priority = None,
+    max_tokens: options.MaxTokens = 2048,
+    stream: options.Stream = False,
+    patch: options.Patch = False,
+    apply: options.Apply = False,
 ) -> None:
     """
     Improve code quality by applying best practices and enhancements suggested by CodeStar.
@@ -39,36 +32,26 @@ def enhance(
     ```shell
     code-star enhance code.py
     code-star enhance code.py -o code-enhancements.md
+    code-star enhance code.py -s
+    code-star enhance src/ -j 8 -o code-enhancements.md
+    code-star enhance src/ --token-budget 500000 -P 'src/core/*' -o code-enhancements.md
+    code-star enhance 'src/**/*.py' -d reports/
+    code-star enhance code.py --patch -o code-enhancements.diff
+    code-star enhance src/ --apply
     ```
     """
 
-    client = InferenceClient(CHAT_LLM)
-
-    try:
-        response = client.chat_completion(
-            messages=[
-                SYSTEM_MESSAGE,
-                {
-                    "role": "user",
-                    "content": "As a an expert software engineer and site reliability engineer "
-                    "that puts code into production in large scale systems. Your job is to ensure "
-                    "that code runs effectively, quickly, at scale, and securely. Please profile it, "
-                    "and find any issues that need to be fixed or updated. Also apply best practices, "
-                    "enhancements, and industry standards to the provided code to make it more efficient, "
-                    f"secure, and maintainable:\n{code.read()}",
-                },
-            ],
-            max_tokens=max_tokens,
-        )
-
-        if output:
-            with output as file:
-                file.write(str(response.choices[0].message.content))
-
-            print(f"Output [bold green]saved[/bold green] to {output.name}.")
-
-        else:
-            print(create_panel("CodeStar", str(response.choices[0].message.content)))
-
-    except Exception as error:
-        print(f"[bold red]Error[/bold red]: {error}")
+    analyse(
+        instructions.template("enhance"),
+        code,
+        output=output,
+        output_dir=output_dir,
+        concurrency=concurrency,
+        token_budget=token_budget,
+        max_requests=max_requests,
+        priorities=priority or (),
+        max_tokens=max_tokens,
+        stream=stream,
+        patch=patch or apply,
+        apply=apply,
+    )
@@ -0,0 +1,87 @@
+""" Build and query the local code index """
+
+from pathlib import Path
+from typing import Annotated, Optional
+import typer
+from rich import print
+from code_star_cli import create_panel
+from code_star_cli.index import CodeIndex
+
+
+def index(
+    path: Annotated[
+        Path,
+        typer.Argument(
+            exists=True,
+            file_okay=False,
+            help="Root directory of the repository to index.",
+        ),
+    ],
+    query: Annotated[
+        Optional[str],
+        typer.Option(
+            "--query",
+            "-q",
+            help="Show the snippets that best match a query instead of updating the index.",
+        ),
+    ] = None,
+    top_k: Annotated[
+        int,
+        typer.Option(
+            "--top-k",
+            "-k",
+            min=1,
+            help="Number of snippets shown for a query.",
+        ),
+    ] = 8,
+    rebuild: Annotated[
+        bool,
+        typer.Option(
+            "--rebuild",
+            help="Re-index every file instead of only the changed ones.",
+        ),
+    ] = False,
+) -> None:
+    """
+    Index a repository so that `ai`, `review` and `scan` can add related code to their prompts.
+
+    Examples:
+    ```shell
+    code-star index .
+    code-star index ~/projects/app
+    code-star index . -q "retry backoff"
+    ```
+    """
+
+    code_index = CodeIndex(path)
+
+    try:
+        if query:
+            rows = []
+
+            for snippet in code_index.search(query, top_k):
+                name = snippet.name.replace("|", "\\|")
+                rows.append(
+                    f"| `{snippet.path}` | {snippet.start}-{snippet.end} "
+                    f"| `{name}` | {snippet.score:.2f} |"
+                )
+
+            print(
+                create_panel(
+                    "Index",
+                    "| File | Lines | Symbol | Score |\n| --- | --- | --- | --- |\n"
+                    + "\n".join(rows),
+                    query,
+                )
+            )
+            return
+
+        stats = code_index.update(rebuild)
+        print(
+            f"Index [bold green]updated[/bold green]: {stats.indexed} file(s) indexed, "
+            f"{stats.unchanged} unchanged, {stats.removed} removed, "
+            f"{stats.snippets} snippet(s) in total."
+        )
+
+    except Exception as error:
+        print(f"[bold red]Error[/bold red]: {error}")
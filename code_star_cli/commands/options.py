@@ -0,0 +1,153 @@
+""" Options shared by the file analysis commands """
+
+from pathlib import Path
+from typing import Annotated, List, Optional
+import typer
+from code_star_cli.findings import OutputFormat
+
+
+Output = Annotated[
+    Optional[typer.FileTextWrite],
+    typer.Option(
+        "--output",
+        "-o",
+        help="Output file to write the response to, aggregates the reports in batch mode.",
+        encoding="utf-8",
+    ),
+]
+
+OutputDir = Annotated[
+    Optional[Path],
+    typer.Option(
+        "--output-dir",
+        "-d",
+        file_okay=False,
+        help="Directory to write a report per file to.",
+    ),
+]
+
+Concurrency = Annotated[
+    int,
+    typer.Option(
+        "--concurrency",
+        "-j",
+        min=1,
+        help="Maximum number of concurrent requests in batch mode.",
+    ),
+]
+
+TokenBudget = Annotated[
+    Optional[int],
+    typer.Option(
+        "--token-budget",
+        min=1,
+        help="Maximum number of prompt and completion tokens of the batch, files that do not fit into the rest are not analysed.",
+    ),
+]
+
+MaxRequests = Annotated[
+    Optional[int],
+    typer.Option(
+        "--max-requests",
+        min=1,
+        help="Maximum number of requests of the batch, files that do not fit into the rest are not analysed.",
+    ),
+]
+
+Priority = Annotated[
+    Optional[List[str]],
+    typer.Option(
+        "--priority",
+        "-P",
+        help="Glob pattern of the files to analyse first, can be repeated, most important first.",
+    ),
+]
+
+Incremental = Annotated[
+    bool,
+    typer.Option(
+        "--incremental",
+        "-i",
+        help="Only analyse files that changed since the last run, reuse the reports of the others.",
+    ),
+]
+
+Since = Annotated[
+    Optional[str],
+    typer.Option(
+        "--since",
+        help="Only analyse files that changed since this git ref, combined with --diff only the changed lines of these files.",
+    ),
+]
+
+Diff = Annotated[
+    Optional[str],
+    typer.Option(
+        "--diff",
+        help="Only analyse the changed lines of the diff against this git ref, e.g. HEAD for the uncommitted changes, or of the unified diff on stdin if `-`.",
+    ),
+]
+
+ContextLines = Annotated[
+    int,
+    typer.Option(
+        "--context-lines",
+        "-U",
+        min=0,
+        help="Number of unchanged lines sent around each change with --diff.",
+    ),
+]
+
+Related = Annotated[
+    Optional[int],
+    typer.Option(
+        "--related",
+        "-r",
+        min=1,
+        help="Add up to this many related snippets of the indexed repository to the prompt, see `code-star index`.",
+    ),
+]
+
+MaxTokens = Annotated[
+    Optional[int],
+    typer.Option(
+        "--max-tokens",
+        "-t",
+        help="Maximum number of tokens allowed in the response.",
+    ),
+]
+
+Stream = Annotated[
+    bool,
+    typer.Option(
+        "--stream",
+        "-s",
+        help="Render the response incrementally as it is generated, single file only.",
+    ),
+]
+
+Format = Annotated[
+    OutputFormat,
+    typer.Option(
+        "--format",
+        "-f",
+        help="Report format: Markdown, or structured findings with file and line locations as JSON or SARIF.",
+    ),
+]
+
+Patch = Annotated[
+    bool,
+    typer.Option(
+        "--patch",
+        "-p",
+        help="Ask for the changes only and report them as unified diffs, instead of the whole updated code.",
+    ),
+]
+
+Apply = Annotated[
+    bool,
+    typer.Option(
+        "--apply",
+        help="Write the changes to the files, implies --patch.",
+    ),
+]
@@ -1,34 +1,34 @@
 """ Perform code reviews using CodeStar """
 
-from typing import Annotated, Optional
+from typing import Annotated, List
 import typer
-from huggingface_hub import InferenceClient
-from rich import print
-from code_star_cli import CHAT_LLM, SYSTEM_MESSAGE, create_panel
+from code_star_cli import instructions
+from code_star_cli.analysis import analyse
+from code_star_cli.commands import options
+from code_star_cli.findings import OutputFormat
 
 
 def review(
     code: Annotated[
-        typer.FileText,
-        typer.Argument(help="File containing code to review for quality improvements."),
-    ],
-    output: Annotated[
-        Optional[typer.FileTextWrite],
-        typer.Option(
-            "--output",
-            "-o",
-            help="Output file to write the response to.",
-            encoding="utf-8",
-        ),
-    ] = None,
-    max_tokens: Annotated[
-        Optional[int],
-        typer.Option(
-            "--max-tokens",
-            "-t",
-            help="Maximum number of tokens allowed in the response.",
+        List[str],
+        typer.Argument(
+            help="Files, directories or glob patterns containing code to review for quality improvements."
         ),
-    ] = 2048,
+    ],
+    output: options.Output = None,
+    output_dir: options.OutputDir = None,
+    concurrency: options.Concurrency = 4,
+    token_budget: options.TokenBudget = None,
+    max_requests: options.MaxRequests = None,
+    priority: options.Priority = None,
+    incremental: options.Incremental = False,
+    since: options.Since = None,
+    diff: options.Diff = None,
+    context_lines: options.ContextLines = 3,
+    related: options.Related = None,
+    max_tokens: options.MaxTokens = 2048,
+    stream: options.Stream = False,
+    format: options.Format = OutputFormat.MARKDOWN,
 ) -> None:
     """
     Perform code reviews to analyze code quality and adherence to best practices,
@@ -38,35 +38,34 @@ def review(
     ```shell
     code-star review code.py
     code-star review code.py -o code-review.md
+    code-star review code.py -s
+    code-star review src/ -j 8 -o code-review.md
+    code-star review src/ --token-budget 500000 -P 'src/core/*' -o code-review.md
+    code-star review 'src/**/*.py' -d reports/
+    code-star review --incremental src/ -o code-review.md
+    code-star review --since origin/main src/
+    code-star review -r 8 code.py
+    code-star review src/ -f sarif -o review.sarif
+    code-star review . --diff HEAD
+    code-star review src/ --diff origin/main -f sarif -o review.sarif
     ```
     """
 
-    client = InferenceClient(CHAT_LLM)
-
-    try:
-        response = client.chat_completion(
-            messages=[
-                SYSTEM_MESSAGE,
-                {
-                    "role": "user",
-                    "content": "As a an expert software engineer and site reliability engineer "
-                    "that puts code into production in large scale systems. Your job is to ensure "
-                    "that code runs effectively, quickly, at scale, and securely. Please review and "
-                    "analyze code quality and adherence to best practices, providing developers with "
-                    f"suggestions for improvement:\n{code.read()}",
-                },
-            ],
-            max_tokens=max_tokens,
-        )
-
-        if output:
-            with output as file:
-                file.write(str(response.choices[0].message.content))
-
-            print(f"Output [bold green]saved[/bold green] to {output.name}.")
-
-        else:
-            print(create_panel("CodeStar", str(response.choices[0].message.content)))
-
-    except Exception as error:
-        print(f"[bold red]Error[/bold red]: {error}")
+    analyse(
+        instructions.template("review"),
+        code,
+        output=output,
+        output_dir=output_dir,
+        concurrency=concurrency,
+        token_budget=token_budget,
+        max_requests=max_requests,
+        priorities=priority or (),
+        max_tokens=max_tokens,
+        stream=stream,
+        incremental=incremental,
+        since=since,
+        diff=diff,
+        context_lines=context_lines,
+        related=related,
+        format=format,
+    )
@@ -1,34 +1,34 @@
 """ Perform code scanning """
 
-from typing import Annotated, Optional
+from typing import Annotated, List
 import typer
-from huggingface_hub import InferenceClient
-from rich import print
-from code_star_cli import CHAT_LLM, SYSTEM_MESSAGE, create_panel
+from code_star_cli import instructions
+from code_star_cli.analysis import analyse
+from code_star_cli.commands import options
+from code_star_cli.findings import OutputFormat
 
 
 def scan(
     code: Annotated[
-        typer.FileText,
-        typer.Argument(help="File containing code to scan for vulnerabilities."),
-    ],
-    output: Annotated[
-        Optional[typer.FileTextWrite],
-        typer.Option(
-            "--output",
-            "-o",
-            help="Output file to write the response to.",
-            encoding="utf-8",
-        ),
-    ] = None,
-    max_tokens: Annotated[
-        Optional[int],
-        typer.Option(
-            "--max-tokens",
-            "-t",
-            help="Maximum number of tokens allowed in the response.",
+        List[str],
+        typer.Argument(
+            help="Files, directories or glob patterns containing code to scan for vulnerabilities."
         ),
-    ] = 2048,
+    ],
+    output: options.Output = None,
+    output_dir: options.OutputDir = None,
+    concurrency: options.Concurrency = 4,
+    token_budget: options.TokenBudget = None,
+    max_requests: options.MaxRequests = None,
+    priority: options.Priority = None,
+    incremental: options.Incremental = False,
+    since: options.Since = None,
+    diff: options.Diff = None,
+    context_lines: options.ContextLines = 3,
+    related: options.Related = None,
+    max_tokens: options.MaxTokens = 2048,
+    stream: options.Stream = False,
+    format: options.Format = OutputFormat.MARKDOWN,
 ) -> None:
     """
     Scan the provided code for security vulnerabilities to provide suggestions on how to improve it.
@@ -37,35 +37,34 @@ def scan(
     ```shell
     code-star scan code.py
     code-star scan code.py -o code-scan.md
+    code-star scan code.py -s
+    code-star scan src/ -j 8 -o code-scan.md
+    code-star scan src/ --token-budget 500000 -P 'src/core/*' -o code-scan.md
+    code-star scan 'src/**/*.py' -d reports/
+    code-star scan --incremental src/ -o code-scan.md
+    code-star scan --since origin/main src/
+    code-star scan -r 8 code.py
+    code-star scan src/ -f sarif -o scan.sarif
+    code-star scan . --diff HEAD
+    git diff --cached | code-star scan . --diff - -f json
     ```
     """
 
-    client = InferenceClient(CHAT_LLM)
-
-    try:
-        response = client.chat_completion(
-            messages=[
-                SYSTEM_MESSAGE,
-                {
-                    "role": "user",
-                    "content": "As a an expert software engineer and cybersecurity engineer "
-                    "that puts code into production in large scale systems. Your job is to ensure "
-                    "that code runs effectively, quickly, at scale, and securely. Please perform a "
-                    "code scan to identify potential security vulnerabilities in the provided code:"
-                    f"\n{code.read()}",
-                },
-            ],
-            max_tokens=max_tokens,
-        )
-
-        if output:
-            with output as file:
-                file.write(str(response.choices[0].message.content))
-
-            print(f"Output [bold green]saved[/bold green] to {output.name}.")
-
-        else:
-            print(create_panel("CodeStar", str(response.choices[0].message.content)))
-
-    except Exception as error:
-        print(f"[bold red]Error[/bold red]: {error}")
+    analyse(
+        instructions.template("scan"),
+        code,
+        output=output,
+        output_dir=output_dir,
+        concurrency=concurrency,
+        token_budget=token_budget,
+        max_requests=max_requests,
+        priorities=priority or (),
+        max_tokens=max_tokens,
+        stream=stream,
+        incremental=incremental,
+        since=since,
+        diff=diff,
+        context_lines=context_lines,
+        related=related,
+        format=format,
+    )
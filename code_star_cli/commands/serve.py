@@ -0,0 +1,53 @@
+""" Keep the CLI warm in a local daemon """
+
+import importlib
+from pathlib import Path
+from typing import Annotated, Optional
+import typer
+from rich import print
+from code_star_cli.backends import get_backend
+from code_star_cli.commands import command_list
+from code_star_cli.config import settings
+from code_star_cli.daemon import FORWARDED_COMMANDS, serve as serve_forever
+from code_star_cli.daemon import socket_path
+
+
+def serve(
+    socket: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--socket",
+            help="Unix socket to listen on, defaults to $CODE_STAR_SOCKET or the runtime directory.",
+        ),
+    ] = None,
+) -> None:
+    """
+    Serve CodeStar commands from a local daemon, skipping the startup cost of each run.
+
+    While the daemon runs, non-interactive commands are forwarded to it transparently.
+
+    Examples:
+    ```shell
+    code-star serve --
+    code-star serve --socket /tmp/code-star.sock
+    ```
+    """
+
+    path = str(socket) if socket else socket_path()
+
+    try:
+        # Warm up the command modules and the backends before accepting requests
+        for name in FORWARDED_COMMANDS:
+            importlib.import_module(command_list[name][0])
+
+        get_backend(settings.chat_model)
+        get_backend(settings.completion_model)
+
+        print(f"CodeStar daemon [bold green]listening[/bold green] on {path}")
+        serve_forever(path)
+
+    except KeyboardInterrupt:
+        print("CodeStar daemon [bold green]stopped[/bold green].")
+
+    except Exception as error:
+        print(f"[bold red]Error[/bold red]: {error}")
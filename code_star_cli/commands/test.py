@@ -1,34 +1,27 @@
 """ Generate tests for code """
 
-from typing import Annotated, Optional
+from typing import Annotated, List
 import typer
-from huggingface_hub import InferenceClient
-from rich import print
-from code_star_cli import CHAT_LLM, SYSTEM_MESSAGE, create_panel
+from code_star_cli import instructions
+from code_star_cli.analysis import analyse
+from code_star_cli.commands import options
 
 
 def test(
     code: Annotated[
-        typer.FileText,
-        typer.Argument(help="File containing code to generate tests for."),
-    ],
-    output: Annotated[
-        Optional[typer.FileTextWrite],
-        typer.Option(
-            "--output",
-            "-o",
-            help="Output file to write the response to.",
-            encoding="utf-8",
-        ),
-    ] = None,
-    max_tokens: Annotated[
-        Optional[int],
-        typer.Option(
-            "--max-tokens",
-            "-t",
-            help="Maximum number of tokens allowed in the response.",
+        List[str],
+        typer.Argument(
+            help="Files, directories or glob patterns containing code to generate tests for."
         ),
-    ] = 2048,
+    ],
+    output: options.Output = None,
+    output_dir: options.OutputDir = None,
+    concurrency: options.Concurrency = 4,
+    token_budget: options.TokenBudget = None,
+    max_requests: options.MaxRequests = None,
+    priority: options.Priority = None,
+    max_tokens: options.MaxTokens = 2048,
+    stream: options.Stream = False,
 ) -> None:
     """
     Generate tests for the provided code.
@@ -37,37 +30,22 @@ def test(
     ```shell
     code-star test code.py
     code-star test code.py -o code-tests.md
+    code-star test code.py -s
+    code-star test src/ -j 8 -o code-tests.md
+    code-star test src/ --token-budget 500000 -P 'src/core/*' -o code-tests.md
+    code-star test 'src/**/*.py' -d reports/
     ```
     """
 
-    client = InferenceClient(CHAT_LLM)
-
-    try:
-        response = client.chat_completion(
-            messages=[
-                SYSTEM_MESSAGE,
-                {
-                    "role": "user",
-                    "content": "As a an expert software engineer and quality assurance engineer "
-                    "that puts code into production in large scale systems. Your job is to ensure "
-                    "that code runs effectively, quickly, at scale, and securely. Please generate tests "
-                    "for the provided code, including any potential issues or improvements that could be made, "
-                    "and provide the updated code with the tests included. The tests should cover edge cases, "
-                    "error handling, and any other relevant information that could help with the code's functionality:"
-                    f"{code.read()}",
-                },
-            ],
-            max_tokens=max_tokens,
-        )
-
-        if output:
-            with output as file:
-                file.write(str(response.choices[0].message.content))
-
-            print(f"Output [bold green]saved[/bold green] to {output.name}.")
-
-        else:
-            print(create_panel("CodeStar", str(response.choices[0].message.content)))
-
-    except Exception as error:
-        print(f"[bold red]Error[/bold red]: {error}")
+    analyse(
+        instructions.template("test"),
+        code,
+        output=output,
+        output_dir=output_dir,
+        concurrency=concurrency,
+        token_budget=token_budget,
+        max_requests=max_requests,
+        priorities=priority or (),
+        max_tokens=max_tokens,
+        stream=stream,
+    )
@@ -0,0 +1,237 @@
+""" CodeStar CLI settings """
+
+import os
+import sys
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, Optional
+from code_star_cli import CHAT_LLM, COMPLETION_LLM
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+
+def user_cache_dir() -> Path:
+    """
+    Resolve the platform's user cache directory for CodeStar.
+
+    Returns:
+        Path
+    """
+
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return Path(os.environ["LOCALAPPDATA"]) / "code-star" / "Cache"
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+
+    return Path(base).expanduser() / "code-star"
+
+
+def user_data_dir() -> Path:
+    """
+    Resolve the platform's user data directory for CodeStar.
+
+    Returns:
+        Path
+    """
+
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return Path(os.environ["LOCALAPPDATA"]) / "code-star" / "Data"
+
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join("~", ".local", "share")
+
+    return Path(base).expanduser() / "code-star"
+
+
+def user_config_file() -> Path:
+    """
+    Resolve the configuration file.
+
+    `CODE_STAR_CONFIG` takes precedence, then `config.toml` in the platform's user
+    configuration directory.
+
+    Returns:
+        Path
+    """
+
+    if os.environ.get("CODE_STAR_CONFIG"):
+        return Path(os.environ["CODE_STAR_CONFIG"])
+
+    if os.name == "nt" and os.environ.get("APPDATA"):
+        return Path(os.environ["APPDATA"]) / "code-star" / "config.toml"
+
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join("~", ".config")
+
+    return Path(base).expanduser() / "code-star" / "config.toml"
+
+
+# Environment variables that override the settings
+ENVIRONMENT = {
+    "backend": "CODE_STAR_BACKEND",
+    "chat_model": "CODE_STAR_CHAT_MODEL",
+    "completion_model": "CODE_STAR_COMPLETION_MODEL",
+    "endpoint": "CODE_STAR_ENDPOINT",
+    "timeout": "CODE_STAR_TIMEOUT",
+    "max_retries": "CODE_STAR_MAX_RETRIES",
+    "max_retry_wait": "CODE_STAR_MAX_RETRY_WAIT",
+    "rate_limit": "CODE_STAR_RATE_LIMIT",
+    "pool_size": "CODE_STAR_POOL_SIZE",
+    "context_tokens": "CODE_STAR_CONTEXT_TOKENS",
+    "cache_dir": "CODE_STAR_CACHE_DIR",
+    "cache_max_size": "CODE_STAR_CACHE_MAX_SIZE",
+    "cache_ttl": "CODE_STAR_CACHE_TTL",
+    "sessions_dir": "CODE_STAR_SESSIONS_DIR",
+    "index_tokens": "CODE_STAR_INDEX_TOKENS",
+}
+
+
+@dataclass
+class Settings:
+    """
+    Runtime settings shared by all commands.
+
+    Defaults are overridden by the configuration file, then by the environment,
+    then by the global CLI options. The `[commands.<name>]` tables of the configuration
+    file override the backend settings for single commands.
+    """
+
+    # Model backend, "hf", "openai" or "local", and the models it serves
+    backend: str = "hf"
+    chat_model: str = CHAT_LLM
+    completion_model: str = COMPLETION_LLM
+    # Threads of the local backend, 0 uses every core
+    local_threads: int = 0
+
+    # Per-command overrides, e.g. {"completions": {"backend": "local"}}
+    commands: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Command being run, set by the CLI
+    command: Optional[str] = None
+
+    # Inference client
+    endpoint: Optional[str] = None
+    timeout: Optional[float] = None
+    pool_size: int = 16
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    # Retries and rate limiting
+    max_retries: int = 3
+    max_retry_wait: float = 60.0
+    retry_backoff: float = 1.0
+    rate_limit: float = 0.0
+
+    context_tokens: int = 16384
+
+    # Response cache
+    cache_enabled: bool = True
+    cache_refresh: bool = False
+    cache_dir: Path = field(default_factory=user_cache_dir)
+    cache_max_size: int = 256 * 1024 * 1024
+    cache_ttl: float = 7 * 24 * 60 * 60
+
+    # Chat sessions
+    sessions_dir: Path = field(default_factory=lambda: user_data_dir() / "sessions")
+
+    # Repository context retrieved from the code index
+    index_tokens: int = 2048
+
+    # Prompt templates by name, e.g. {"review": "..."}, see `instructions.TEMPLATES`
+    templates: Dict[str, str] = field(default_factory=dict)
+
+    def update(self, values: Dict[str, Any]) -> None:
+        """
+        Override settings, converting the values to the type of the defaults.
+
+        Args:
+            values (Dict[str, Any]): Setting names and values, unknown names are ignored.
+
+        Raises:
+            ValueError: If a value cannot be converted to the type of its setting.
+        """
+
+        for setting in fields(self):
+            if setting.name not in values:
+                continue
+
+            value = values[setting.name]
+            default = getattr(self, setting.name)
+
+            try:
+                if isinstance(default, bool) and not isinstance(value, bool):
+                    value = str(value).lower() in ("1", "true", "yes", "on")
+
+                elif isinstance(default, Path):
+                    value = Path(value).expanduser()
+
+                elif isinstance(default, (int, float)):
+                    value = type(default)(value)
+
+                elif setting.name == "timeout" and value is not None:
+                    value = float(value)
+
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid {setting.name} {value!r}") from None
+
+            setattr(self, setting.name, value)
+
+    def option(self, name: str) -> Any:
+        """
+        Get a setting for the running command, its overrides take precedence.
+
+        Args:
+            name (str): Setting name, e.g. `backend` or `completion_model`.
+
+        Returns:
+            Any
+        """
+
+        overrides = self.commands.get(self.command or "") or {}
+
+        return overrides.get(name, getattr(self, name))
+
+    @classmethod
+    def load(cls) -> "Settings":
+        """
+        Load the settings from the configuration file and the environment.
+
+        Returns:
+            Settings
+
+        Raises:
+            ValueError: If the configuration file is not valid TOML, or a setting has an
+                invalid value, the message names the file or the environment variable.
+        """
+
+        loaded = cls()
+        path = user_config_file()
+
+        if path.is_file():
+            try:
+                with open(path, "rb") as file:
+                    loaded.update(tomllib.load(file))
+
+            except (tomllib.TOMLDecodeError, ValueError) as error:
+                raise ValueError(f"{path}: {error}") from None
+
+        for name, variable in ENVIRONMENT.items():
+            if not os.environ.get(variable):
+                continue
+
+            try:
+                loaded.update({name: os.environ[variable]})
+
+            except ValueError as error:
+                raise ValueError(f"{variable}: {error}") from None
+
+        return loaded
+
+
+# Invalid settings fall back to the defaults, the CLI reports them and stops
+try:
+    settings = Settings.load()
+    load_error: Optional[str] = None
+
+except ValueError as error:
+    settings = Settings()
+    load_error = str(error)
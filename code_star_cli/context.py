@@ -0,0 +1,172 @@
+""" Context-window management for chat sessions """
+
+from typing import Dict, List
+from code_star_cli.chunking import CHARS_PER_TOKEN, estimate_tokens
+from code_star_cli.inference import chat
+from code_star_cli.instructions import system_message
+
+
+# Per-message overhead of the chat template, e.g. role markers
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_INSTRUCTION = (
+    "Summarise the following conversation between a user and CodeStar into a compact "
+    "memory. Keep names, decisions, requirements, code identifiers and open questions, "
+    "drop pleasantries. Reply with the summary only."
+)
+
+
+class ContextWindow:
+    """
+    Chat history that sends a sliding window of the most recent messages.
+
+    The system message is always pinned, older messages are evicted once the window
+    exceeds the token budget. Evicted turns can optionally be summarised into a
+    compact memory that is appended to the system message.
+    """
+
+    def __init__(
+        self,
+        messages: List[Dict[str, str]],
+        budget: int,
+        summarize: bool = False,
+        summary_tokens: int = 256,
+    ) -> None:
+        """
+        Args:
+            messages (List[Dict[str, str]]): Previous messages, e.g. from an imported history.
+            budget (int): Maximum number of tokens of the messages sent to the model.
+            summarize (bool): Summarise evicted turns into a memory.
+            summary_tokens (int): Maximum number of tokens of the memory.
+        """
+
+        has_system = bool(messages) and messages[0]["role"] == "system"
+
+        self.system = messages[0] if has_system else system_message()
+        self.history: List[Dict[str, str]] = list(
+            messages[1:] if has_system else messages
+        )
+        self.tokens = [self.count(message) for message in self.history]
+        self.budget = budget
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.summarized = 0
+
+    @staticmethod
+    def count(message: Dict[str, str]) -> int:
+        """
+        Estimate the number of tokens of a message.
+
+        Args:
+            message (Dict[str, str]): Chat message.
+
+        Returns:
+            int
+        """
+
+        return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """The full history, including evicted messages."""
+
+        return [self.system, *self.history]
+
+    def append(self, message: Dict[str, str]) -> None:
+        """
+        Add a message to the history.
+
+        Args:
+            message (Dict[str, str]): Chat message.
+        """
+
+        self.history.append(message)
+        self.tokens.append(self.count(message))
+
+    def pop(self) -> Dict[str, str]:
+        """
+        Remove the last message from the history.
+
+        Returns:
+            Dict[str, str]
+        """
+
+        self.tokens.pop()
+
+        return self.history.pop()
+
+    def window(self) -> List[Dict[str, str]]:
+        """
+        Select the messages to send to the model.
+
+        Returns:
+            List[Dict[str, str]]: The pinned system message and the most recent messages
+            that fit into the budget, at least the last one.
+        """
+
+        available = self.budget - self.count(self.system)
+
+        if self.summarize:
+            available -= self.summary_tokens
+
+        start, used = len(self.history), 0
+
+        while start > 0 and used + self.tokens[start - 1] <= available:
+            start -= 1
+            used += self.tokens[start]
+
+        start = min(start, max(0, len(self.history) - 1))
+
+        # The window starts with a user message
+        while start < len(self.history) - 1 and self.history[start]["role"] != "user":
+            start += 1
+
+        if self.summarize and start > self.summarized:
+            self.remember(self.history[self.summarized : start])
+            self.summarized = start
+
+        system = self.system
+
+        if self.summary:
+            system = {
+                "role": "system",
+                "content": f"{self.system['content']}\n\n"
+                f"Summary of the earlier conversation:\n{self.summary}",
+            }
+
+        return [system, *self.history[start:]]
+
+    def remember(self, evicted: List[Dict[str, str]]) -> None:
+        """
+        Fold evicted messages into the memory.
+
+        Summarising is best effort, the window fits the budget without it.
+
+        Args:
+            evicted (List[Dict[str, str]]): Messages that left the window.
+        """
+
+        transcript = "\n\n".join(
+            f"{message['role']}: {message['content']}" for message in evicted
+        )
+
+        if self.summary:
+            transcript = f"Earlier summary:\n{self.summary}\n\n{transcript}"
+
+        # Keep the most recent part of very long transcripts, e.g. imported histories
+        transcript = transcript[-self.budget * CHARS_PER_TOKEN :]
+
+        try:
+            self.summary = chat(
+                [
+                    {
+                        "role": "user",
+                        "content": f"{SUMMARY_INSTRUCTION}\n\n{transcript}",
+                    }
+                ],
+                self.summary_tokens,
+            )
+
+        except Exception:
+            pass
@@ -0,0 +1,347 @@
+""" Local daemon that keeps the CLI warm for editor integrations """
+
+import io
+import json
+import os
+import shutil
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+
+# Commands that are forwarded to a running daemon, interactive ones run locally
+FORWARDED_COMMANDS = {
+    "ai",
+    "analyze",
+    "cache",
+    "completions",
+    "document",
+    "enhance",
+    "index",
+    "review",
+    "scan",
+    "test",
+}
+
+# Whether this process is a daemon, background work outlives the invocations
+serving = False
+
+# Global options that take a value, the value is not the command name
+VALUE_OPTIONS = {"--endpoint", "--metrics", "--metrics-format"}
+
+# Environment variables of the client that apply to its invocation
+ENVIRONMENT_PREFIXES = ("CODE_STAR_", "HF_", "HUGGING_FACE_")
+
+# Threads started by the running invocation, they finish before the next one starts
+background: List[threading.Thread] = []
+
+
+def socket_path() -> str:
+    """
+    Resolve the path of the daemon's Unix socket.
+
+    `CODE_STAR_SOCKET` takes precedence, then the user's runtime directory,
+    then a per-user file in the temporary directory.
+
+    Returns:
+        str
+    """
+
+    if os.environ.get("CODE_STAR_SOCKET"):
+        return os.environ["CODE_STAR_SOCKET"]
+
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "code-star.sock")
+
+    uid = os.getuid() if hasattr(os, "getuid") else "user"
+
+    return os.path.join(tempfile.gettempdir(), f"code-star-{uid}.sock")
+
+
+def trusted(path: str) -> bool:
+    """
+    Check that a socket belongs to the user and is private to them, so that the
+    invocation, and the credentials in its environment, go to their own daemon and
+    not to a socket another user bound first.
+
+    Args:
+        path (str): Socket path.
+
+    Returns:
+        bool
+    """
+
+    if not hasattr(os, "getuid"):
+        return False
+
+    try:
+        info = os.lstat(path)
+
+    except OSError:
+        return False
+
+    return (
+        stat.S_ISSOCK(info.st_mode)
+        and info.st_uid == os.getuid()
+        and not info.st_mode & 0o077
+    )
+
+
+def should_forward(argv: List[str]) -> bool:
+    """
+    Decide whether an invocation can be served by the daemon.
+
+    Args:
+        argv (List[str]): CLI arguments, without the program name.
+
+    Returns:
+        bool
+    """
+
+    if not hasattr(socket, "AF_UNIX") or os.environ.get("CODE_STAR_NO_DAEMON"):
+        return False
+
+    if "--help" in argv or "--install-completion" in argv:
+        return False
+
+    # Reads stdin, which is not forwarded
+    if "-" in argv:
+        return False
+
+    for index, arg in enumerate(argv):
+        if not arg.startswith("-") and (
+            index == 0 or argv[index - 1] not in VALUE_OPTIONS
+        ):
+            return arg in FORWARDED_COMMANDS
+
+    return False
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """
+    Run an invocation on the daemon if it is running, streaming its output.
+
+    Args:
+        argv (List[str]): CLI arguments, without the program name.
+
+    Returns:
+        Optional[int]: The exit code, None if the invocation has to run locally.
+    """
+
+    if not should_forward(argv):
+        return None
+
+    path = socket_path()
+
+    if not trusted(path):
+        return None
+
+    try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+
+    except OSError:
+        return None
+
+    request = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "env": client_environment(),
+        "columns": shutil.get_terminal_size().columns,
+        "tty": sys.stdout.isatty(),
+    }
+
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+
+        for line in stream:
+            frame = json.loads(line)
+
+            if "exit" in frame:
+                return int(frame["exit"])
+
+            target = sys.stderr if "err" in frame else sys.stdout
+            target.write(frame.get("out", frame.get("err", "")))
+            target.flush()
+
+    # The daemon went away mid-request
+    return 1
+
+
+def client_environment() -> Dict[str, str]:
+    """
+    Collect the environment variables that configure an invocation.
+
+    Returns:
+        Dict[str, str]
+    """
+
+    return {
+        name: value
+        for name, value in os.environ.items()
+        if name.startswith(ENVIRONMENT_PREFIXES)
+    }
+
+
+def apply_environment(environment: Dict[str, str]) -> None:
+    """
+    Replace the environment variables that configure an invocation.
+
+    Args:
+        environment (Dict[str, str]): Variables, see `client_environment`.
+    """
+
+    for name in client_environment():
+        if name not in environment:
+            del os.environ[name]
+
+    os.environ.update(environment)
+
+
+class FrameWriter(io.TextIOBase):
+    """Text stream that sends what is written to the client as frames"""
+
+    def __init__(self, stream: Any, kind: str, tty: bool) -> None:
+        """
+        Args:
+            stream (Any): Binary file of the client connection.
+            kind (str): Frame kind, `out` or `err`.
+            tty (bool): Whether the client's terminal is interactive.
+        """
+
+        self.stream = stream
+        self.kind = kind
+        self.tty = tty
+
+    @property
+    def encoding(self) -> str:  # type: ignore[override]
+        return "utf-8"
+
+    def isatty(self) -> bool:
+        return self.tty
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            self.stream.write(json.dumps({self.kind: text}).encode("utf-8") + b"\n")
+            self.stream.flush()
+
+        return len(text)
+
+
+def serve(path: Optional[str] = None) -> None:
+    """
+    Serve CLI invocations on a Unix socket until interrupted.
+
+    The CLI, its imports, clients, connections and caches stay warm between invocations.
+    Invocations run one at a time, in the working directory of the client.
+
+    Args:
+        path (str, optional): Socket path, defaults to `socket_path()`.
+    """
+
+    from click.exceptions import Exit
+    from code_star_cli.config import Settings, settings
+    from code_star_cli.main import code_star
+
+    global serving
+
+    serving = True
+    path = path or socket_path()
+    lock = threading.Lock()
+
+    def handle(connection: socket.socket) -> None:
+        with connection, connection.makefile("rwb") as stream:
+            request: Dict[str, Any] = json.loads(stream.readline())
+            code = 0
+
+            with lock:
+                saved = (sys.stdout, sys.stderr, os.getcwd(), dict(vars(settings)))
+                environment = client_environment()
+                columns = os.environ.get("COLUMNS")
+
+                try:
+                    os.chdir(request["cwd"])
+                    os.environ["COLUMNS"] = str(request.get("columns", 80))
+
+                    # Run with the settings the client would load itself
+                    if "env" in request:
+                        apply_environment(request["env"])
+                        vars(settings).update(vars(Settings.load()))
+
+                    sys.stdout = FrameWriter(stream, "out", request.get("tty", False))
+                    sys.stderr = FrameWriter(stream, "err", request.get("tty", False))
+
+                    code_star(args=request["argv"], prog_name="code-star")
+
+                except SystemExit as error:
+                    code = error.code if isinstance(error.code, int) else 1
+
+                except Exit as error:
+                    code = error.exit_code
+
+                except Exception as error:
+                    sys.stderr.write(f"Error: {error}\n")
+                    code = 1
+
+                finally:
+                    sys.stdout, sys.stderr = saved[0], saved[1]
+
+                    # The client does not wait for the background work
+                    try:
+                        stream.write(json.dumps({"exit": code}).encode("utf-8") + b"\n")
+                        stream.flush()
+
+                    except OSError:
+                        pass
+
+                    # It reads the settings of the invocation, restored once it is done
+                    while background:
+                        background.pop().join()
+
+                    os.chdir(saved[2])
+                    apply_environment(environment)
+                    vars(settings).update(saved[3])
+
+                    if columns is None:
+                        os.environ.pop("COLUMNS", None)
+
+                    else:
+                        os.environ["COLUMNS"] = columns
+
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    # Created private, there is no window in which another user can connect
+    umask = os.umask(0o077)
+
+    try:
+        server.bind(path)
+
+    finally:
+        os.umask(umask)
+
+    server.listen()
+
+    # Remove the socket when stopped by the service manager too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+    finally:
+        server.close()
+
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,231 @@
+""" Changed lines of unified diffs, to analyse only what changed """
+
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from code_star_cli.chunking import estimate_tokens
+from code_star_cli.manifest import git
+
+
+DIFF_INSTRUCTION = (
+    "Only the changed parts of the file are shown, as excerpts separated by `...`. "
+    "Each line starts with its line number, preceded by + if the line changed. Focus "
+    "on the changed lines, the other lines are context."
+)
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class Excerpt(NamedTuple):
+    """Changed lines of a file with their context, numbered, sent in one request"""
+
+    text: str
+    start: int
+    end: int
+
+
+def parse_diff(text: str) -> Dict[str, Set[int]]:
+    """
+    Map the files of a unified diff to their changed lines.
+
+    Lines are numbered in the new version of the file. Removed lines count as a change
+    of the line that now takes their place. Deleted files are left out.
+
+    Args:
+        text (str): Unified diff, e.g. of `git diff`.
+
+    Returns:
+        Dict[str, Set[int]]: Changed lines by path, as written in the diff.
+    """
+
+    changes: Dict[str, Set[int]] = {}
+    lines: Optional[Set[int]] = None
+    number, old, new = 0, 0, 0
+
+    for line in text.splitlines():
+        if old > 0 or new > 0:
+            marker = line[:1]
+
+            if marker in "+-" and lines is not None:
+                lines.add(max(number, 1))
+
+            if marker == "+":
+                number += 1
+                new -= 1
+
+            elif marker == "-":
+                old -= 1
+
+            elif marker != "\\":
+                number += 1
+                old -= 1
+                new -= 1
+
+            continue
+
+        header = HUNK_HEADER.match(line)
+
+        if header:
+            old = int(header.group(1) or 1)
+            new = int(header.group(3) or 1)
+            # An empty range starts after the line it is numbered with
+            number = int(header.group(2)) + (new == 0)
+
+        elif line.startswith("+++ "):
+            name = line[4:].split("\t")[0].strip()
+            lines = None
+
+            if name != "/dev/null":
+                lines = changes.setdefault(
+                    name[2:] if name[:2] == "b/" else name, set()
+                )
+
+    return {name: lines for name, lines in changes.items() if lines}
+
+
+def diff_changes(source: str) -> Dict[Path, Optional[Set[int]]]:
+    """
+    Find the changed lines of the files, in git or in a diff read from stdin.
+
+    Args:
+        source (str): Git ref to diff the working tree against, e.g. `HEAD` for the
+            uncommitted changes or `origin/main` for a pull request, or `-` to read a
+            unified diff from stdin.
+
+    Returns:
+        Dict[Path, Optional[Set[int]]]: Changed lines by resolved path, None for new
+        files that are not tracked by git yet, which changed as a whole.
+
+    Raises:
+        RuntimeError: If git fails, e.g. outside of a repository or for an unknown ref.
+    """
+
+    if source == "-":
+        root: Optional[Path] = None
+
+        def resolve(name: str) -> Path:
+            nonlocal root
+            path = Path(name)
+
+            # Diffs name files relative to the root of their repository
+            if not path.exists():
+                try:
+                    root = root or Path(git("rev-parse", "--show-toplevel").strip())
+                    path = root / name
+
+                except RuntimeError:
+                    pass
+
+            return path.resolve()
+
+        return {
+            resolve(name): lines for name, lines in parse_diff(sys.stdin.read()).items()
+        }
+
+    root = Path(git("rev-parse", "--show-toplevel").strip())
+    diff = git(
+        "diff",
+        "--unified=0",
+        "--no-color",
+        "--no-ext-diff",
+        "--no-renames",
+        source,
+        "--",
+    )
+    changes: Dict[Path, Optional[Set[int]]] = {
+        (root / name).resolve(): lines for name, lines in parse_diff(diff).items()
+    }
+
+    for name in git("ls-files", "--others", "--exclude-standard", "--full-name").split(
+        "\n"
+    ):
+        if name:
+            changes[(root / name).resolve()] = None
+
+    return changes
+
+
+def regions(changed: Set[int], context: int, total: int) -> List[Tuple[int, int]]:
+    """
+    Merge the changed lines and their context into line ranges.
+
+    Args:
+        changed (Set[int]): Changed lines.
+        context (int): Number of lines of context around each changed line.
+        total (int): Number of lines of the file.
+
+    Returns:
+        List[Tuple[int, int]]: First and last line of each range, in order.
+    """
+
+    ranges: List[Tuple[int, int]] = []
+
+    for line in sorted(min(line, total) for line in changed):
+        start, end = max(1, line - context), min(total, line + context)
+
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+
+        else:
+            ranges.append((start, end))
+
+    return ranges
+
+
+def excerpts(code: str, changed: Set[int], context: int, budget: int) -> List[Excerpt]:
+    """
+    Cut the changed parts of a file into excerpts that fit into a request.
+
+    Nearby changes are merged, and ranges are packed into an excerpt until it reaches
+    the budget, so a small diff takes a single request however large the file is.
+
+    Args:
+        code (str): Code of the file, in its new version.
+        changed (Set[int]): Changed lines.
+        context (int): Number of lines of context around each changed line.
+        budget (int): Maximum number of tokens of an excerpt.
+
+    Returns:
+        List[Excerpt]
+    """
+
+    lines = code.splitlines()
+    parts: List[Excerpt] = []
+    rendered: List[str] = []
+    start, tokens = 0, 0
+
+    def flush(end: int) -> None:
+        nonlocal rendered, tokens
+
+        if rendered and rendered[-1] == "...":
+            rendered.pop()
+
+        if rendered:
+            parts.append(Excerpt("\n".join(rendered), start, end))
+
+        rendered, tokens = [], 0
+
+    last = 0
+
+    for first, end in regions(changed, context, len(lines)):
+        if rendered:
+            rendered.append("...")
+
+        for number in range(first, end + 1):
+            line = f"{'+' if number in changed else ' '}{number}| {lines[number - 1]}"
+            cost = estimate_tokens(line)
+
+            if rendered and tokens + cost > budget:
+                flush(last)
+
+            if not rendered:
+                start = number
+
+            rendered.append(line)
+            tokens += cost
+            last = number
+
+    flush(last)
+
+    return parts
@@ -0,0 +1,292 @@
+""" Structured findings of the analysis commands, as JSON or SARIF """
+
+import json
+import re
+from enum import Enum
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple
+
+
+class OutputFormat(str, Enum):
+    """Formats of the analysis reports"""
+
+    MARKDOWN = "markdown"
+    JSON = "json"
+    SARIF = "sarif"
+
+
+FINDINGS_INSTRUCTION = (
+    "Each line of the code starts with its line number. Respond only with a JSON array "
+    "of findings, without any other text. Each finding is an object with the keys "
+    '"line" (first line of the finding), "end_line" (last line), "severity" ("error", '
+    '"warning" or "note"), "rule" (short kebab-case identifier of the kind of issue), '
+    '"message" (the issue) and "suggestion" (how to fix it). Respond with [] if there '
+    "are no findings."
+)
+
+REPAIR_INSTRUCTION = (
+    "Your response is not a valid JSON array of findings ({error}). Respond again with "
+    "only the JSON array, without any other text."
+)
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+# Severities used by models, mapped to SARIF levels
+SEVERITIES = {
+    "critical": "error",
+    "high": "error",
+    "error": "error",
+    "medium": "warning",
+    "moderate": "warning",
+    "warning": "warning",
+    "low": "note",
+    "info": "note",
+    "note": "note",
+}
+
+FENCE = re.compile(r"```[\w-]*\n?")
+TRAILING_COMMA = re.compile(r",\s*([\]}])")
+
+
+class Finding(NamedTuple):
+    """An issue found in a file"""
+
+    path: str
+    line: int
+    end_line: int
+    severity: str
+    rule: str
+    message: str
+    suggestion: str
+
+
+def number_lines(code: str, start: int = 1) -> str:
+    """
+    Prefix every line of code with its line number, so findings can point at lines.
+
+    Args:
+        code (str): Code, e.g. a chunk of a file.
+        start (int): Line number of the first line.
+
+    Returns:
+        str
+    """
+
+    return "\n".join(
+        f"{number}| {line}" for number, line in enumerate(code.splitlines(), start)
+    )
+
+
+def load_array(text: str) -> List[Any]:
+    """
+    Extract the JSON array of a response, repairing the usual defects: Markdown
+    fences, surrounding prose, trailing commas and truncation.
+
+    Args:
+        text (str): Model response.
+
+    Returns:
+        List[Any]
+
+    Raises:
+        ValueError: If no array can be recovered.
+    """
+
+    text = FENCE.sub("", text)
+    starts = [index for index in (text.find("["), text.find("{")) if index >= 0]
+
+    if not starts:
+        raise ValueError("no JSON array found")
+
+    text = TRAILING_COMMA.sub(r"\1", text[min(starts) :].strip())
+    candidates = [text, text[: text.rfind("]") + 1], text[: text.rfind("}") + 1]]
+
+    # A truncated response keeps its complete findings
+    if text.startswith("["):
+        candidates.append(text[: text.rfind("}") + 1] + "]")
+
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+
+        except ValueError:
+            continue
+
+        if isinstance(value, dict):
+            value = value.get("findings", [value])
+
+        if isinstance(value, list):
+            return value
+
+    raise ValueError("malformed JSON")
+
+
+def parse_findings(text: str, path: str, first: int, last: int) -> List[Finding]:
+    """
+    Validate the findings of a response.
+
+    Findings without a message are dropped, line numbers are clamped to the analysed
+    lines and severities are normalised to the SARIF levels.
+
+    Args:
+        text (str): Model response.
+        path (str): Analysed file.
+        first (int): First analysed line.
+        last (int): Last analysed line.
+
+    Returns:
+        List[Finding]
+
+    Raises:
+        ValueError: If the response does not contain an array of findings.
+    """
+
+    findings = []
+
+    for item in load_array(text):
+        if not isinstance(item, dict) or not str(item.get("message") or "").strip():
+            continue
+
+        def line(key: str, default: int) -> int:
+            try:
+                return min(max(int(item.get(key) or default), first), last)
+
+            except (TypeError, ValueError):
+                return default
+
+        start = line("line", first)
+        rule = re.sub(r"[^a-z0-9]+", "-", str(item.get("rule") or "").lower())
+
+        findings.append(
+            Finding(
+                path,
+                start,
+                max(line("end_line", start), start),
+                SEVERITIES.get(str(item.get("severity", "")).lower(), "warning"),
+                rule.strip("-") or "finding",
+                str(item["message"]).strip(),
+                str(item.get("suggestion") or "").strip(),
+            )
+        )
+
+    return findings
+
+
+def dump_findings(findings: Iterable[Finding]) -> str:
+    """
+    Serialise findings, e.g. to store them in a manifest.
+
+    Args:
+        findings (Iterable[Finding]): Findings.
+
+    Returns:
+        str
+    """
+
+    return json.dumps([finding._asdict() for finding in findings])
+
+
+def load_findings(text: str) -> List[Finding]:
+    """
+    Deserialise findings written by `dump_findings`.
+
+    Args:
+        text (str): Serialised findings.
+
+    Returns:
+        List[Finding]
+    """
+
+    return [Finding(**finding) for finding in json.loads(text)]
+
+
+def to_sarif(findings: List[Finding]) -> Dict[str, Any]:
+    """
+    Convert findings to a SARIF 2.1.0 log.
+
+    Args:
+        findings (List[Finding]): Findings.
+
+    Returns:
+        Dict[str, Any]
+    """
+
+    rules = sorted({finding.rule for finding in findings})
+    indices = {rule: index for index, rule in enumerate(rules)}
+
+    try:
+        version = metadata.version("code-star-cli")
+
+    except metadata.PackageNotFoundError:
+        version = "0.0.0"
+
+    def uri(path: str) -> str:
+        return (
+            Path(path).as_uri() if Path(path).is_absolute() else Path(path).as_posix()
+        )
+
+    return {
+        "$schema": SARIF_SCHEMA,
+        "version": "2.1.0",
+        "runs": [
+            {
+                "tool": {
+                    "driver": {
+                        "name": "CodeStar",
+                        "version": version,
+                        "informationUri": "https://github.com/youzarsiph/code-star-cli",
+                        "rules": [{"id": rule} for rule in rules],
+                    }
+                },
+                "results": [
+                    {
+                        "ruleId": finding.rule,
+                        "ruleIndex": indices[finding.rule],
+                        "level": finding.severity,
+                        "message": {
+                            "text": (
+                                f"{finding.message}\n\n{finding.suggestion}"
+                                if finding.suggestion
+                                else finding.message
+                            )
+                        },
+                        "locations": [
+                            {
+                                "physicalLocation": {
+                                    "artifactLocation": {"uri": uri(finding.path)},
+                                    "region": {
+                                        "startLine": finding.line,
+                                        "endLine": finding.end_line,
+                                    },
+                                }
+                            }
+                        ],
+                    }
+                    for finding in findings
+                ],
+            }
+        ],
+    }
+
+
+def format_findings(findings: List[Finding], format: OutputFormat) -> str:
+    """
+    Render findings as a JSON document or a SARIF log.
+
+    Args:
+        findings (List[Finding]): Findings.
+        format (OutputFormat): `json` or `sarif`.
+
+    Returns:
+        str
+    """
+
+    findings = sorted(findings, key=lambda finding: (finding.path, finding.line))
+
+    if format == OutputFormat.SARIF:
+        return json.dumps(to_sarif(findings), indent=2)
+
+    return json.dumps(
+        {"findings": [finding._asdict() for finding in findings]}, indent=2
+    )
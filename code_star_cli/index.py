@@ -0,0 +1,522 @@
+""" Local lexical index of a repository, for retrieving related code """
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from code_star_cli.batch import iter_files
+from code_star_cli.chunking import (
+    Chunk,
+    estimate_tokens,
+    python_boundaries,
+    split_lines,
+)
+from code_star_cli.config import settings
+
+
+# Maximum number of tokens of an indexed snippet
+SNIPPET_TOKENS = 384
+
+# Files larger than this are not indexed, they are usually generated or data
+MAX_FILE_SIZE = 1024 * 1024
+
+# Query terms scored per search, the rarest ones are kept
+QUERY_TERMS = 64
+
+# Maximum number of variables of a SQLite statement
+BATCH_SIZE = 500
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+DEFINITION = re.compile(
+    r"\b(?:def|class|function|func|fn|struct|interface|trait|enum|type)\s+"
+    r"([A-Za-z_][A-Za-z0-9_]*)"
+)
+
+# Terms too common in code to tell snippets apart
+STOPWORDS = {
+    "and",
+    "as",
+    "class",
+    "const",
+    "def",
+    "else",
+    "for",
+    "from",
+    "function",
+    "if",
+    "import",
+    "in",
+    "is",
+    "let",
+    "none",
+    "not",
+    "null",
+    "or",
+    "return",
+    "self",
+    "the",
+    "this",
+    "var",
+}
+
+
+class Snippet(NamedTuple):
+    """A retrieved snippet of an indexed file"""
+
+    path: str
+    name: str
+    start: int
+    end: int
+    text: str
+    score: float
+
+
+class IndexStats(NamedTuple):
+    """Outcome of an index update"""
+
+    indexed: int
+    unchanged: int
+    removed: int
+    snippets: int
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """
+    Split code into search terms.
+
+    Identifiers are kept whole and also split into their snake_case and camelCase
+    parts, so `parse_tokens` matches `parseTokens` and `tokens`.
+
+    Args:
+        text (str): Code or a natural language query.
+
+    Yields:
+        str: Lowercase terms.
+    """
+
+    for identifier in IDENTIFIER.findall(text):
+        term = identifier.lower()
+
+        if len(term) > 1 and term not in STOPWORDS:
+            yield term
+
+        parts = SUBWORD.findall(identifier)
+
+        if len(parts) > 1:
+            for part in parts:
+                part = part.lower()
+
+                if len(part) > 1 and part != term and part not in STOPWORDS:
+                    yield part
+
+
+def split_snippets(code: str, filename: str) -> List[Chunk]:
+    """
+    Split a file into snippets, one per top-level definition where possible.
+
+    Args:
+        code (str): File content.
+        filename (str): Name of the file, used to detect the language.
+
+    Returns:
+        List[Chunk]
+    """
+
+    lines = code.splitlines(keepends=True)
+    boundaries = python_boundaries(code) if filename.endswith((".py", ".pyi")) else None
+
+    if not boundaries:
+        return split_lines(lines, 0, SNIPPET_TOKENS)
+
+    starts = sorted({0, *boundaries})
+    snippets: List[Chunk] = []
+
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        if start < end:
+            snippets.extend(split_lines(lines[start:end], start, SNIPPET_TOKENS))
+
+    return snippets
+
+
+def index_path(root: Path) -> Path:
+    """
+    Locate the index database of a repository.
+
+    Args:
+        root (Path): Resolved root directory of the repository.
+
+    Returns:
+        Path
+    """
+
+    digest = hashlib.sha256(str(root).encode("utf-8")).hexdigest()
+
+    return settings.cache_dir / "indexes" / f"{digest[:16]}.sqlite"
+
+
+class CodeIndex:
+    """
+    BM25 index of the snippets of a repository, persisted in a SQLite database.
+
+    Updates are incremental: files whose modification time and size did not change
+    are skipped without being read, files whose content hash did not change are not
+    re-tokenized.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """
+        Args:
+            root (Path): Root directory of the repository.
+        """
+
+        self.root = root.resolve()
+        self.path = index_path(self.root)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def find(cls, start: Path) -> Optional["CodeIndex"]:
+        """
+        Find the index of the directory, or of the closest parent directory, that has one.
+
+        Args:
+            start (Path): Directory to start from, e.g. the working directory.
+
+        Returns:
+            Optional[CodeIndex]
+        """
+
+        start = start.resolve()
+
+        for directory in [start, *start.parents]:
+            if index_path(directory).is_file():
+                return cls(directory)
+
+        return None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Open the database on first use."""
+
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            self._connection.executescript(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL, "
+                "digest TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS snippets ("
+                "id INTEGER PRIMARY KEY, path TEXT NOT NULL, name TEXT NOT NULL, "
+                "start INTEGER NOT NULL, end INTEGER NOT NULL, "
+                "length INTEGER NOT NULL, text TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS snippets_path ON snippets (path);"
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, snippet INTEGER NOT NULL, count INTEGER NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS postings_term ON postings (term);"
+                "CREATE INDEX IF NOT EXISTS postings_snippet ON postings (snippet);"
+            )
+            self._connection.commit()
+
+        return self._connection
+
+    def relative(self, path: Path) -> Optional[str]:
+        """
+        Express a file path relative to the root of the repository.
+
+        Args:
+            path (Path): File path.
+
+        Returns:
+            Optional[str]: POSIX path, None for files outside of the repository.
+        """
+
+        try:
+            return path.resolve().relative_to(self.root).as_posix()
+
+        except ValueError:
+            return None
+
+    def _remove(self, path: str) -> None:
+        db = self.connection
+        db.execute(
+            "DELETE FROM postings WHERE snippet IN "
+            "(SELECT id FROM snippets WHERE path = ?)",
+            (path,),
+        )
+        db.execute("DELETE FROM snippets WHERE path = ?", (path,))
+        db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _add(self, path: str, code: str) -> None:
+        db = self.connection
+
+        for chunk in split_snippets(code, path):
+            counts = Counter(tokenize(chunk.text))
+
+            if not counts:
+                continue
+
+            match = DEFINITION.search(chunk.text)
+            name = match.group(1) if match else chunk.text.strip().splitlines()[0][:60]
+            cursor = db.execute(
+                "INSERT INTO snippets (path, name, start, end, length, text) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    name,
+                    chunk.start,
+                    chunk.end,
+                    sum(counts.values()),
+                    chunk.text,
+                ),
+            )
+            db.executemany(
+                "INSERT INTO postings (term, snippet, count) VALUES (?, ?, ?)",
+                [(term, cursor.lastrowid, count) for term, count in counts.items()],
+            )
+
+    def update(self, rebuild: bool = False) -> IndexStats:
+        """
+        Bring the index up to date with the files of the repository.
+
+        Args:
+            rebuild (bool): Re-index every file, e.g. after the index format changed.
+
+        Returns:
+            IndexStats
+        """
+
+        indexed, unchanged = 0, 0
+
+        with self._lock:
+            db = self.connection
+
+            if rebuild:
+                db.executescript(
+                    "DELETE FROM postings; DELETE FROM snippets; DELETE FROM files;"
+                )
+
+            known = {
+                path: (mtime, size, digest)
+                for path, mtime, size, digest in db.execute(
+                    "SELECT path, mtime, size, digest FROM files"
+                )
+            }
+            seen = set()
+
+            for file in iter_files([str(self.root)]):
+                # Removed since it was listed, or a broken symbolic link
+                try:
+                    stat = file.stat()
+
+                except OSError:
+                    continue
+
+                path = self.relative(file)
+
+                if path is None or stat.st_size > MAX_FILE_SIZE:
+                    continue
+
+                seen.add(path)
+                entry = known.get(path)
+
+                if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                    unchanged += 1
+                    continue
+
+                try:
+                    content = file.read_bytes()
+
+                except OSError:
+                    continue
+
+                digest = hashlib.sha256(content).hexdigest()
+
+                if entry and entry[2] == digest:
+                    # Touched but not modified, only record the new mtime
+                    db.execute(
+                        "UPDATE files SET mtime = ? WHERE path = ?",
+                        (stat.st_mtime_ns, path),
+                    )
+                    unchanged += 1
+                    continue
+
+                self._remove(path)
+
+                # Binary files are recorded without snippets, so they are not read again
+                if b"\0" not in content:
+                    self._add(path, content.decode("utf-8", errors="replace"))
+
+                db.execute(
+                    "INSERT INTO files (path, mtime, size, digest) VALUES (?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, digest),
+                )
+                indexed += 1
+
+            removed = [path for path in known if path not in seen]
+
+            for path in removed:
+                self._remove(path)
+
+            db.commit()
+            (snippets,) = db.execute("SELECT COUNT(*) FROM snippets").fetchone()
+
+        return IndexStats(indexed, unchanged, len(removed), snippets)
+
+    def search(
+        self, query: str, k: int = 8, exclude: Optional[str] = None
+    ) -> List[Snippet]:
+        """
+        Rank the snippets by their BM25 score for the query.
+
+        Args:
+            query (str): Code or natural language.
+            k (int): Maximum number of snippets.
+            exclude (str, optional): Relative path of a file to leave out, e.g. the
+                file being analysed.
+
+        Returns:
+            List[Snippet]: The best matches, best first.
+        """
+
+        terms = set(tokenize(query))
+
+        if not terms:
+            return []
+
+        with self._lock:
+            db = self.connection
+            count, average = db.execute(
+                "SELECT COUNT(*), AVG(length) FROM snippets"
+            ).fetchone()
+
+            if not count:
+                return []
+
+            frequencies: Dict[str, int] = {}
+            ordered = sorted(terms)
+
+            for offset in range(0, len(ordered), BATCH_SIZE):
+                batch = ordered[offset : offset + BATCH_SIZE]
+                frequencies.update(
+                    db.execute(
+                        "SELECT term, COUNT(*) FROM postings "
+                        f"WHERE term IN ({','.join('?' * len(batch))}) GROUP BY term",
+                        batch,
+                    ).fetchall()
+                )
+
+            # The rarest terms carry the signal, and keep large queries cheap
+            idf = {
+                term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+                for term, frequency in sorted(
+                    frequencies.items(), key=lambda item: item[1]
+                )[:QUERY_TERMS]
+            }
+
+            if not idf:
+                return []
+
+            scores: Dict[int, float] = {}
+            rows = db.execute(
+                "SELECT postings.term, postings.snippet, postings.count, snippets.length "
+                "FROM postings JOIN snippets ON snippets.id = postings.snippet "
+                f"WHERE postings.term IN ({','.join('?' * len(idf))})",
+                list(idf),
+            )
+
+            for term, snippet, frequency, length in rows:
+                scores[snippet] = scores.get(snippet, 0.0) + idf[term] * (
+                    frequency
+                    * (K1 + 1)
+                    / (frequency + K1 * (1 - B + B * length / average))
+                )
+
+            results: List[Snippet] = []
+
+            for snippet, score in sorted(
+                scores.items(), key=lambda item: item[1], reverse=True
+            ):
+                row = db.execute(
+                    "SELECT path, name, start, end, text FROM snippets WHERE id = ?",
+                    (snippet,),
+                ).fetchone()
+
+                if row[0] != exclude:
+                    results.append(Snippet(*row, score))
+
+                if len(results) >= k:
+                    break
+
+        return results
+
+    def context(
+        self, query: str, k: int, budget: int, exclude: Optional[Path] = None
+    ) -> str:
+        """
+        Format the snippets most relevant to a query for a prompt.
+
+        Args:
+            query (str): Code or natural language.
+            k (int): Maximum number of snippets.
+            budget (int): Maximum number of tokens of the context.
+            exclude (Path, optional): File to leave out, e.g. the file being analysed.
+
+        Returns:
+            str: The context, empty if nothing relevant fits into the budget.
+        """
+
+        parts = []
+
+        for snippet in self.search(
+            query, k, self.relative(exclude) if exclude else None
+        ):
+            part = (
+                f"{snippet.path}, lines {snippet.start}-{snippet.end}:\n"
+                f"```\n{snippet.text.rstrip()}\n```"
+            )
+            tokens = estimate_tokens(part)
+
+            if tokens <= budget:
+                parts.append(part)
+                budget -= tokens
+
+        if not parts:
+            return ""
+
+        return "Related code from the repository:\n\n" + "\n\n".join(parts)
+
+
+def open_index() -> CodeIndex:
+    """
+    Open the index of the working directory, or of its closest indexed parent, and
+    bring it up to date, which only costs a `stat` per unchanged file.
+
+    Returns:
+        CodeIndex
+
+    Raises:
+        FileNotFoundError: If neither the working directory nor its parents are indexed.
+    """
+
+    index = CodeIndex.find(Path(os.getcwd()))
+
+    if index is None:
+        raise FileNotFoundError(
+            "No code index found, build one with: code-star index ."
+        )
+
+    index.update()
+
+    return index
@@ -0,0 +1,442 @@
+""" Model requests shared by all commands """
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from code_star_cli.backends import Candidate, capabilities, get_backend
+from code_star_cli.budget import charge
+from code_star_cli.cache import cache_key, get_cache
+from code_star_cli.coalesce import coalesce
+from code_star_cli.config import settings
+from code_star_cli.metrics import metrics
+from code_star_cli.retry import error_response, with_retry
+
+
+# Sampling temperature of alternative completions
+CANDIDATE_TEMPERATURE = 0.8
+
+
+def chat_model(model: Optional[str] = None) -> str:
+    """
+    Resolve the chat model of the running command.
+
+    Args:
+        model (str, optional): Model requested by the caller.
+
+    Returns:
+        str
+    """
+
+    return model or settings.option("chat_model")
+
+
+def completion_model(model: Optional[str] = None) -> str:
+    """
+    Resolve the completion model of the running command.
+
+    Args:
+        model (str, optional): Model requested by the caller.
+
+    Returns:
+        str
+    """
+
+    return model or settings.option("completion_model")
+
+
+def request_key(**params: Any) -> str:
+    """
+    Hash the request parameters into a cache key, along with where the request is sent.
+
+    Args:
+        **params: Everything else that determines the response, e.g. model and messages.
+
+    Returns:
+        str
+    """
+
+    return cache_key(
+        backend=settings.option("backend"),
+        endpoint=settings.option("endpoint"),
+        **params,
+    )
+
+
+def cached(key: str, use_cache: bool) -> Optional[str]:
+    """
+    Look up a response in the cache, honouring the cache settings.
+
+    Args:
+        key (str): Cache key.
+        use_cache (bool): Whether the caller allows caching.
+
+    Returns:
+        Optional[str]
+    """
+
+    if not use_cache or not settings.cache_enabled or settings.cache_refresh:
+        return None
+
+    return get_cache().get(key)
+
+
+def store(key: str, value: str, use_cache: bool) -> None:
+    """
+    Store a response in the cache, honouring the cache settings.
+
+    Args:
+        key (str): Cache key.
+        value (str): Response.
+        use_cache (bool): Whether the caller allows caching.
+    """
+
+    if use_cache and settings.cache_enabled:
+        get_cache().set(key, value)
+
+
+def continuation(prompt: str, model: str, use_cache: bool) -> Optional[str]:
+    """
+    Look up a cached completion that the prompt extends, honouring the cache settings.
+
+    Args:
+        prompt (str): Prompt to complete.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Whether the caller allows caching.
+
+    Returns:
+        Optional[str]
+    """
+
+    if not use_cache or not settings.cache_enabled or settings.cache_refresh:
+        return None
+
+    return get_cache().continuation(request_key(model=model), prompt)
+
+
+def remember(prompt: str, completion: str, model: str, use_cache: bool) -> None:
+    """
+    Store a completion for prefix lookups, honouring the cache settings.
+
+    Args:
+        prompt (str): Prompt.
+        completion (str): Generated text.
+        model (str): Model used.
+        use_cache (bool): Whether the caller allows caching.
+    """
+
+    if use_cache and settings.cache_enabled:
+        get_cache().add_completion(request_key(model=model), prompt, completion)
+
+
+def chat(
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = 2048,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    Request a chat completion.
+
+    Args:
+        messages (List[Dict[str, Any]]): Chat messages.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the response in the response cache.
+
+    Returns:
+        str: The response.
+    """
+
+    model = chat_model(model)
+    started = time.perf_counter()
+    key = request_key(model=model, messages=messages, max_tokens=max_tokens)
+    content = cached(key, use_cache)
+
+    if content is not None:
+        metrics.request("chat", model, started, messages, content, cached=True)
+        return content
+
+    # Identical prompts of a batch run share one request
+    reply, shared = coalesce(
+        key,
+        lambda: with_retry(lambda: get_backend(model).chat(messages, max_tokens)),
+    )
+
+    if shared:
+        metrics.request("chat", model, started, messages, reply.text, cached=True)
+        return reply.text
+
+    metrics.request("chat", model, started, messages, reply.text, reply.usage)
+    charge(messages, reply.text, reply.usage)
+    store(key, reply.text, use_cache)
+
+    return reply.text
+
+
+def chat_stream(
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = 2048,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> Iterator[str]:
+    """
+    Request a streamed chat completion.
+
+    Args:
+        messages (List[Dict[str, Any]]): Chat messages.
+        max_tokens (int, optional): Maximum number of tokens allowed in the response.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the response in the response cache.
+
+    Yields:
+        str: Text deltas, a cached response is yielded at once.
+    """
+
+    if not capabilities().streaming:
+        yield chat(messages, max_tokens, model, use_cache)
+        return
+
+    model = chat_model(model)
+    started = time.perf_counter()
+    key = request_key(model=model, messages=messages, max_tokens=max_tokens)
+    content = cached(key, use_cache)
+
+    if content is not None:
+        metrics.request("chat", model, started, messages, content, cached=True)
+        yield content
+        return
+
+    content = ""
+    first_token = None
+
+    # The request is sent eagerly, so only failures before the first chunk are retried
+    stream = with_retry(lambda: get_backend(model).chat_stream(messages, max_tokens))
+
+    for chunk in stream:
+        first_token = first_token or time.perf_counter()
+        content += chunk
+        yield chunk
+
+    metrics.request("chat", model, started, messages, content, first_token=first_token)
+    charge(messages, content)
+
+    # Only complete responses are cached
+    store(key, content, use_cache)
+
+
+def generate(
+    prompt: str,
+    max_new_tokens: Optional[int] = 128,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    Request a text generation.
+
+    When the prompt extends an earlier prompt and the text typed since then matches
+    its completion, the rest of that completion is served without a request.
+
+    Args:
+        prompt (str): Prompt to complete.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the response in the response cache.
+
+    Returns:
+        str: The generated text.
+    """
+
+    model = completion_model(model)
+    started = time.perf_counter()
+    key = request_key(model=model, prompt=prompt, max_new_tokens=max_new_tokens)
+    content = cached(key, use_cache)
+
+    # An empty response is a hit too
+    if content is None:
+        content = continuation(prompt, model, use_cache)
+
+    if content is not None:
+        metrics.request("generate", model, started, prompt, content, cached=True)
+        return content
+
+    content = with_retry(lambda: get_backend(model).generate(prompt, max_new_tokens))
+    metrics.request("generate", model, started, prompt, content)
+    store(key, content, use_cache)
+    remember(prompt, content, model, use_cache)
+
+    return content
+
+
+def generate_stream(
+    prompt: str,
+    max_new_tokens: Optional[int] = 128,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> Iterator[str]:
+    """
+    Request a streamed text generation, served like `generate` from earlier completions.
+
+    Args:
+        prompt (str): Prompt to complete.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the response in the response cache.
+
+    Yields:
+        str: Generated tokens, a cached response is yielded at once.
+    """
+
+    if not capabilities().streaming:
+        yield generate(prompt, max_new_tokens, model, use_cache)
+        return
+
+    model = completion_model(model)
+    started = time.perf_counter()
+    key = request_key(model=model, prompt=prompt, max_new_tokens=max_new_tokens)
+    content = cached(key, use_cache)
+
+    # An empty response is a hit too
+    if content is None:
+        content = continuation(prompt, model, use_cache)
+
+    if content is not None:
+        metrics.request("generate", model, started, prompt, content, cached=True)
+        yield content
+        return
+
+    content = ""
+    first_token = None
+
+    stream = with_retry(
+        lambda: get_backend(model).generate_stream(prompt, max_new_tokens)
+    )
+
+    for token in stream:
+        first_token = first_token or time.perf_counter()
+        content += token
+        yield token
+
+    metrics.request(
+        "generate", model, started, prompt, content, first_token=first_token
+    )
+
+    store(key, content, use_cache)
+    remember(prompt, content, model, use_cache)
+
+
+def rank_candidates(candidates: Iterable[Candidate]) -> List[Candidate]:
+    """
+    Drop empty and duplicate candidates, then sort them from best to worst.
+
+    Candidates that differ only in whitespace are duplicates, the best scored is kept.
+
+    Args:
+        candidates (Iterable[Candidate]): Candidates.
+
+    Returns:
+        List[Candidate]
+    """
+
+    unique: Dict[str, Candidate] = {}
+
+    for candidate in candidates:
+        normalised = "\n".join(
+            line.rstrip() for line in candidate.text.strip().splitlines()
+        )
+
+        if normalised and (
+            normalised not in unique or candidate.score > unique[normalised].score
+        ):
+            unique[normalised] = candidate
+
+    return sorted(unique.values(), key=lambda candidate: candidate.score, reverse=True)
+
+
+def generate_candidates(
+    prompt: str,
+    n: int = 3,
+    max_new_tokens: Optional[int] = 128,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> List[Candidate]:
+    """
+    Sample alternative completions in one request, ranked and deduplicated.
+
+    Backends with batching sample the sequences in one request, e.g. with `best_of` on
+    TGI. Backends without it, and servers that reject the request, e.g. above their
+    `max_best_of`, are sent concurrent requests instead.
+
+    Args:
+        prompt (str): Prompt to complete.
+        n (int): Number of sampled sequences.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+        use_cache (bool): Serve and store the candidates in the response cache.
+
+    Returns:
+        List[Candidate]: At most n candidates, best first.
+    """
+
+    model = completion_model(model)
+    started = time.perf_counter()
+    key = request_key(
+        model=model, prompt=prompt, max_new_tokens=max_new_tokens, candidates=n
+    )
+    content = cached(key, use_cache)
+
+    if content is not None:
+        candidates = [Candidate(*candidate) for candidate in json.loads(content)]
+        metrics.request(
+            "generate",
+            model,
+            started,
+            prompt,
+            "".join(candidate.text for candidate in candidates),
+            cached=True,
+        )
+        return candidates
+
+    backend = get_backend(model)
+
+    def sample(n: int, seed: Optional[int] = None) -> List[Candidate]:
+        return with_retry(
+            lambda: backend.sample(
+                prompt, n, max_new_tokens, CANDIDATE_TEMPERATURE, seed
+            )
+        )
+
+    def concurrently() -> List[Candidate]:
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            return [
+                candidate
+                for sampled in executor.map(lambda seed: sample(1, seed), range(n))
+                for candidate in sampled
+            ]
+
+    if n == 1 or backend.capabilities.batching:
+        try:
+            sampled = sample(n)
+
+        except Exception as error:
+            response = error_response(error)
+
+            if response is None or response.status_code not in (400, 422):
+                raise
+
+            sampled = concurrently()
+
+    else:
+        sampled = concurrently()
+
+    candidates = rank_candidates(sampled)
+    metrics.request(
+        "generate",
+        model,
+        started,
+        prompt,
+        "".join(candidate.text for candidate in candidates),
+    )
+    store(key, json.dumps(candidates), use_cache)
+
+    return candidates
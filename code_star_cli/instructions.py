@@ -0,0 +1,92 @@
+""" Instructions of the analysis commands """
+
+from typing import Dict
+from code_star_cli import SYSTEM_MESSAGE
+from code_star_cli.config import settings
+
+DOCUMENT = (
+    "As a an expert software engineer and site reliability engineer that puts code "
+    "into production in large scale systems. Your job is to ensure that code runs "
+    "effectively, quickly, at scale, and securely. Please document the provided code, "
+    "including any potential issues or improvements that could be made, and provide "
+    "the updated code with the documentation included. The documentation should "
+    "include docstrings, comments, and any other relevant information that could help "
+    "developers better understand the code's purpose, functionality, and behavior:"
+)
+
+ENHANCE = (
+    "As a an expert software engineer and site reliability engineer that puts code "
+    "into production in large scale systems. Your job is to ensure that code runs "
+    "effectively, quickly, at scale, and securely. Please profile it, and find any "
+    "issues that need to be fixed or updated. Also apply best practices, "
+    "enhancements, and industry standards to the provided code to make it more "
+    "efficient, secure, and maintainable:"
+)
+
+REVIEW = (
+    "As a an expert software engineer and site reliability engineer that puts code "
+    "into production in large scale systems. Your job is to ensure that code runs "
+    "effectively, quickly, at scale, and securely. Please review and analyze code "
+    "quality and adherence to best practices, providing developers with suggestions "
+    "for improvement:"
+)
+
+SCAN = (
+    "As a an expert software engineer and cybersecurity engineer that puts code into "
+    "production in large scale systems. Your job is to ensure that code runs "
+    "effectively, quickly, at scale, and securely. Please perform a code scan to "
+    "identify potential security vulnerabilities in the provided code:"
+)
+
+TEST = (
+    "As a an expert software engineer and quality assurance engineer that puts code "
+    "into production in large scale systems. Your job is to ensure that code runs "
+    "effectively, quickly, at scale, and securely. Please generate tests for the "
+    "provided code, including any potential issues or improvements that could be "
+    "made, and provide the updated code with the tests included. The tests should "
+    "cover edge cases, error handling, and any other relevant information that could "
+    "help with the code's functionality:"
+)
+
+# Templates by name, overridden by the `[templates]` table of the configuration file
+TEMPLATES = {
+    "system": SYSTEM_MESSAGE["content"],
+    "document": DOCUMENT,
+    "enhance": ENHANCE,
+    "review": REVIEW,
+    "scan": SCAN,
+    "test": TEST,
+}
+
+
+def template(name: str) -> str:
+    """
+    Get a template, the configured one if it is overridden.
+
+    Args:
+        name (str): Template name, e.g. `review` or `system`.
+
+    Returns:
+        str
+
+    Raises:
+        ValueError: If there is no template of that name.
+    """
+
+    if name not in TEMPLATES:
+        raise ValueError(
+            f"Unknown template {name!r}, expected one of: {', '.join(TEMPLATES)}"
+        )
+
+    return settings.templates.get(name) or TEMPLATES[name]
+
+
+def system_message() -> Dict[str, str]:
+    """
+    Build the system message that starts every conversation.
+
+    Returns:
+        Dict[str, str]
+    """
+
+    return {"role": "system", "content": template("system")}
@@ -1,11 +1,76 @@
 """ CodeStar CLI """
 
+import importlib
+import time
+from pathlib import Path
+from typing import Annotated, Any, List, Optional
+import click
 import typer
+from typer.core import TyperGroup
+from typer.main import get_command_from_info
+from typer.models import CommandInfo
 from code_star_cli.commands import command_list
+from code_star_cli.config import settings
+from code_star_cli.metrics import MetricsFormat, metrics
+
+
+class LazyGroup(TyperGroup):
+    """
+    Command group that imports the module of a command only when the command is used.
+
+    Listing the commands, in the help or in shell completion, only needs their short
+    help, so `code-star --help` does not pay for the imports of every command.
+    """
+
+    listing = False
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted(command_list)
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name not in command_list:
+            return None
+
+        module, short_help = command_list[cmd_name]
+
+        if self.listing:
+            return click.Command(cmd_name, help=short_help)
+
+        if cmd_name not in self.commands:
+            self.commands[cmd_name] = get_command_from_info(
+                CommandInfo(
+                    name=cmd_name,
+                    callback=getattr(importlib.import_module(module), cmd_name),
+                    no_args_is_help=True,
+                ),
+                pretty_exceptions_short=True,
+                rich_markup_mode="rich",
+            )
+
+        return self.commands[cmd_name]
+
+    def format_help(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        self.listing = True
+
+        try:
+            return super().format_help(ctx, formatter)
+
+        finally:
+            self.listing = False
+
+    def shell_complete(self, ctx: click.Context, incomplete: str) -> List[Any]:
+        self.listing = True
+
+        try:
+            return super().shell_complete(ctx, incomplete)
+
+        finally:
+            self.listing = False
 
 
 # CodeStar CLI
 code_star = typer.Typer(
+    cls=LazyGroup,
     name="code-star",
     no_args_is_help=True,
     rich_markup_mode="rich",
@@ -13,9 +78,94 @@ code_star = typer.Typer(
 )
 
 
-# Add the commands
-for command in command_list:
-    code_star.command(no_args_is_help=True)(command)
+@code_star.callback()
+def options(
+    ctx: typer.Context,
+    endpoint: Annotated[
+        Optional[str],
+        typer.Option(
+            "--endpoint",
+            envvar="CODE_STAR_ENDPOINT",
+            help="Inference endpoint to use instead of the Inference API, e.g. a local TGI server.",
+        ),
+    ] = None,
+    no_cache: Annotated[
+        bool,
+        typer.Option(
+            "--no-cache",
+            envvar="CODE_STAR_NO_CACHE",
+            help="Neither read nor write the response cache.",
+        ),
+    ] = False,
+    refresh: Annotated[
+        bool,
+        typer.Option(
+            "--refresh",
+            help="Ignore cached responses and replace them with fresh ones.",
+        ),
+    ] = False,
+    profile: Annotated[
+        bool,
+        typer.Option(
+            "--profile",
+            help="Print a summary of the latencies and token counts of the run.",
+        ),
+    ] = False,
+    metrics_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--metrics",
+            envvar="CODE_STAR_METRICS",
+            help="Export the latencies and token counts of the run to a file.",
+        ),
+    ] = None,
+    metrics_format: Annotated[
+        MetricsFormat,
+        typer.Option(
+            "--metrics-format",
+            help="Format of the metrics file, JSON lines are appended to it.",
+        ),
+    ] = MetricsFormat.JSONL,
+) -> None:
+    """CodeStar CLI, an advanced AI-powered coding assistant."""
+
+    settings.command = ctx.invoked_subcommand
+    settings.endpoint = endpoint or settings.endpoint
+    settings.cache_enabled = not no_cache
+    settings.cache_refresh = refresh
+
+    metrics.reset(profile or metrics_file is not None)
+
+    if not metrics.enabled:
+        return
+
+    started = time.perf_counter()
+
+    def report() -> None:
+        from rich import print
+
+        metrics.add(
+            {
+                "type": "span",
+                "name": "command",
+                "command": ctx.invoked_subcommand,
+                "seconds": time.perf_counter() - started,
+            }
+        )
+
+        if metrics_file:
+            try:
+                metrics.export(metrics_file, metrics_format)
+
+            except OSError as error:
+                print(f"[bold red]Error[/bold red]: {error}")
+
+        if profile:
+            from code_star_cli import create_panel
+
+            print(create_panel("Profile", metrics.summary()))
+
+    ctx.call_on_close(report)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+""" Manifest of analysed files for incremental batch runs """
+
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional, Set
+from code_star_cli.config import settings
+
+
+def content_digest(content: str) -> str:
+    """
+    Hash the content of a file.
+
+    Args:
+        content (str): File content.
+
+    Returns:
+        str
+    """
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def git(*args: str) -> str:
+    """
+    Run a git command.
+
+    Args:
+        *args (str): Arguments of git.
+
+    Returns:
+        str: Its output.
+
+    Raises:
+        RuntimeError: If git fails, e.g. outside of a repository or for an unknown ref.
+    """
+
+    result = subprocess.run(["git", *args], capture_output=True, text=True, check=False)
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"git {args[0]} failed")
+
+    return result.stdout
+
+
+def git_changed_files(ref: str) -> Set[Path]:
+    """
+    List the files that changed since a git ref, including uncommitted and untracked files.
+
+    Args:
+        ref (str): Commit, branch or tag to diff against.
+
+    Returns:
+        Set[Path]: Resolved paths of the changed files.
+
+    Raises:
+        RuntimeError: If git fails, e.g. outside of a repository or for an unknown ref.
+    """
+
+    root = Path(git("rev-parse", "--show-toplevel").strip())
+    names = git("diff", "--name-only", "--diff-filter=d", ref, "--").splitlines()
+    names += git(
+        "ls-files", "--others", "--exclude-standard", "--full-name"
+    ).splitlines()
+
+    return {(root / name).resolve() for name in names if name}
+
+
+class Manifest:
+    """
+    Index of file path -> content hash -> last report.
+
+    A manifest belongs to one analysis, identified by a fingerprint of the model,
+    instruction and parameters, so changing any of them starts from scratch.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Args:
+            path (Path): JSON file the manifest is stored in.
+        """
+
+        self.path = path
+        self.entries: Dict[str, Dict[str, str]] = {}
+
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.entries = json.load(file).get("files", {})
+
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def for_analysis(cls, fingerprint: str) -> "Manifest":
+        """
+        Load the manifest of an analysis run from the current directory.
+
+        Args:
+            fingerprint (str): Hash of the model, instruction and parameters.
+
+        Returns:
+            Manifest
+        """
+
+        cwd = hashlib.sha256(os.getcwd().encode("utf-8")).hexdigest()
+
+        return cls(
+            settings.cache_dir / "manifests" / f"{cwd[:16]}-{fingerprint[:16]}.json"
+        )
+
+    def lookup(self, path: Path, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Get the stored report of a file.
+
+        Args:
+            path (Path): Analysed file.
+            digest (str, optional): Current content hash, the report must match it.
+
+        Returns:
+            Optional[str]
+        """
+
+        entry = self.entries.get(str(path.resolve()))
+
+        if entry is None or (digest is not None and entry["digest"] != digest):
+            return None
+
+        return entry["report"]
+
+    def update(self, path: Path, digest: str, report: str) -> None:
+        """
+        Record the report of a file.
+
+        Args:
+            path (Path): Analysed file.
+            digest (str): Content hash of the analysed file.
+            report (str): Report of the file.
+        """
+
+        self.entries[str(path.resolve())] = {"digest": digest, "report": report}
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(".tmp")
+
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"files": self.entries}, file)
+
+        os.replace(temporary, self.path)
@@ -0,0 +1,322 @@
+""" Latency and token instrumentation """
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+from code_star_cli.chunking import estimate_tokens
+
+
+class MetricsFormat(str, Enum):
+    """Formats the metrics can be exported to"""
+
+    JSONL = "jsonl"
+    PROMETHEUS = "prometheus"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Compute a percentile with the nearest-rank method.
+
+    Args:
+        values (List[float]): Samples.
+        fraction (float): Percentile, between 0 and 1.
+
+    Returns:
+        float: The percentile, 0 without samples.
+    """
+
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def count_tokens(content: Union[str, List[Dict[str, Any]]]) -> int:
+    """
+    Estimate the number of tokens of a prompt or of chat messages.
+
+    Args:
+        content (Union[str, List[Dict[str, Any]]]): Prompt or chat messages.
+
+    Returns:
+        int
+    """
+
+    if isinstance(content, str):
+        return estimate_tokens(content)
+
+    return sum(estimate_tokens(str(message["content"])) for message in content)
+
+
+class Metrics:
+    """
+    Timing spans and model requests recorded during a run.
+
+    Recording is disabled by default and costs nothing until `--profile` or
+    `--metrics` enable it.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def reset(self, enabled: bool) -> None:
+        """
+        Drop the recorded events and enable or disable recording.
+
+        Args:
+            enabled (bool): Whether to record events.
+        """
+
+        with self._lock:
+            self.enabled = enabled
+            self.events = []
+
+    def add(self, event: Dict[str, Any]) -> None:
+        """
+        Record an event.
+
+        Args:
+            event (Dict[str, Any]): Event, with at least a `type` and a `seconds` field.
+        """
+
+        if self.enabled:
+            with self._lock:
+                self.events.append({"timestamp": time.time(), **event})
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[None]:
+        """
+        Time a block of code.
+
+        Args:
+            name (str): Span name, e.g. `build` or `render`.
+            **labels (Any): Extra fields of the event.
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.add(
+                {
+                    "type": "span",
+                    "name": name,
+                    "seconds": time.perf_counter() - start,
+                    **labels,
+                }
+            )
+
+    def request(
+        self,
+        kind: str,
+        model: str,
+        started: float,
+        prompt: Union[str, List[Dict[str, Any]]],
+        completion: str,
+        usage: Any = None,
+        first_token: Optional[float] = None,
+        cached: bool = False,
+    ) -> None:
+        """
+        Record a model request that just completed.
+
+        Token counts are read from the usage reported by the server, and estimated
+        from the text when it does not report them, e.g. for streamed responses.
+
+        Args:
+            kind (str): `chat` or `generate`.
+            model (str): Model ID.
+            started (float): `time.perf_counter()` when the request was sent.
+            prompt (Union[str, List[Dict[str, Any]]]): Prompt or chat messages.
+            completion (str): Response.
+            usage (Any, optional): Usage reported by the server.
+            first_token (float, optional): `time.perf_counter()` of the first streamed token.
+            cached (bool): Whether the response was served from the cache.
+        """
+
+        if not self.enabled:
+            return
+
+        seconds = time.perf_counter() - started
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or count_tokens(prompt)
+        completion_tokens = getattr(usage, "completion_tokens", None) or count_tokens(
+            completion
+        )
+        ttft = first_token - started if first_token is not None else None
+        generation = seconds - (ttft or 0.0)
+
+        self.add(
+            {
+                "type": "request",
+                "name": kind,
+                "model": model,
+                "cached": cached,
+                "seconds": seconds,
+                "ttft": ttft,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "tokens_per_second": (
+                    completion_tokens / generation if generation > 0 else None
+                ),
+            }
+        )
+
+    def timings(self) -> Dict[str, List[float]]:
+        """
+        Group the recorded durations by phase.
+
+        Returns:
+            Dict[str, List[float]]: Seconds per phase, cached responses excluded.
+        """
+
+        phases: Dict[str, List[float]] = {}
+
+        for event in list(self.events):
+            if event["type"] == "span":
+                phases.setdefault(event["name"], []).append(event["seconds"])
+
+            elif not event["cached"]:
+                phases.setdefault("request", []).append(event["seconds"])
+
+                if event["ttft"] is not None:
+                    phases.setdefault("time to first token", []).append(event["ttft"])
+                    phases.setdefault("generation", []).append(
+                        event["seconds"] - event["ttft"]
+                    )
+
+        return phases
+
+    def totals(self) -> Dict[str, float]:
+        """
+        Aggregate the recorded requests.
+
+        Returns:
+            Dict[str, float]: Requests, cached requests, token counts and throughput.
+        """
+
+        requests = [event for event in list(self.events) if event["type"] == "request"]
+        sent = [event for event in requests if not event["cached"]]
+        generation = sum(event["seconds"] - (event["ttft"] or 0.0) for event in sent)
+        completion_tokens = sum(event["completion_tokens"] for event in sent)
+
+        return {
+            "requests": len(requests),
+            "cached": len(requests) - len(sent),
+            "prompt_tokens": sum(event["prompt_tokens"] for event in sent),
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": (
+                completion_tokens / generation if generation > 0 else 0.0
+            ),
+        }
+
+    def summary(self) -> str:
+        """
+        Summarise the run as Markdown tables.
+
+        Returns:
+            str
+        """
+
+        rows = [
+            f"| {phase} | {len(values)} | {sum(values) * 1000:.0f} ms "
+            f"| {percentile(values, 0.5) * 1000:.0f} ms "
+            f"| {percentile(values, 0.95) * 1000:.0f} ms "
+            f"| {max(values) * 1000:.0f} ms |"
+            for phase, values in self.timings().items()
+        ]
+        totals = self.totals()
+
+        return (
+            "| Phase | Count | Total | p50 | p95 | Max |\n"
+            "| --- | --- | --- | --- | --- | --- |\n"
+            + "\n".join(rows)
+            + "\n\n| Requests | Cached | Prompt tokens | Completion tokens | Tokens/s |\n"
+            "| --- | --- | --- | --- | --- |\n"
+            f"| {totals['requests']} | {totals['cached']} | {totals['prompt_tokens']} "
+            f"| {totals['completion_tokens']} | {totals['tokens_per_second']:.1f} |"
+        )
+
+    def prometheus(self) -> str:
+        """
+        Export the run in the Prometheus text format, e.g. for the node exporter
+        textfile collector.
+
+        Returns:
+            str
+        """
+
+        lines = [
+            "# HELP code_star_phase_seconds Time spent per phase of a run.",
+            "# TYPE code_star_phase_seconds summary",
+        ]
+
+        for phase, values in self.timings().items():
+            label = f'phase="{phase}"'
+
+            for quantile in (0.5, 0.95, 0.99):
+                lines.append(
+                    f'code_star_phase_seconds{{{label},quantile="{quantile}"}} '
+                    f"{percentile(values, quantile):.6f}"
+                )
+
+            lines.append(f"code_star_phase_seconds_sum{{{label}}} {sum(values):.6f}")
+            lines.append(f"code_star_phase_seconds_count{{{label}}} {len(values)}")
+
+        totals = self.totals()
+        lines += [
+            "# HELP code_star_requests_total Model requests, by cache status.",
+            "# TYPE code_star_requests_total counter",
+            f'code_star_requests_total{{cached="false"}} '
+            f"{totals['requests'] - totals['cached']}",
+            f'code_star_requests_total{{cached="true"}} {totals["cached"]}',
+            "# HELP code_star_tokens_total Tokens sent and generated.",
+            "# TYPE code_star_tokens_total counter",
+            f'code_star_tokens_total{{type="prompt"}} {totals["prompt_tokens"]}',
+            f'code_star_tokens_total{{type="completion"}} {totals["completion_tokens"]}',
+            "# HELP code_star_tokens_per_second Generation throughput.",
+            "# TYPE code_star_tokens_per_second gauge",
+            f"code_star_tokens_per_second {totals['tokens_per_second']:.3f}",
+        ]
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: Path, format: MetricsFormat) -> None:
+        """
+        Write the run to a file.
+
+        JSON lines are appended, one event per line, so that runs accumulate.
+        The Prometheus file is replaced atomically.
+
+        Args:
+            path (Path): Output file.
+            format (MetricsFormat): Output format.
+        """
+
+        if format == MetricsFormat.JSONL:
+            with open(path, "a", encoding="utf-8") as file:
+                for event in list(self.events):
+                    file.write(json.dumps(event) + "\n")
+
+            return
+
+        temporary = path.with_name(f".{path.name}.tmp")
+        temporary.write_text(self.prometheus(), encoding="utf-8")
+        temporary.replace(path)
+
+
+# Metrics of the current run
+metrics = Metrics()
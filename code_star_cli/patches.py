@@ -0,0 +1,272 @@
+""" Edits proposed by the model as search/replace blocks or unified diffs """
+
+import difflib
+import re
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+
+PATCH_INSTRUCTION = (
+    "Do not repeat the whole code. Respond only with the changes, as search/replace "
+    "blocks in this format:\n\n"
+    "<<<<<<< SEARCH\n"
+    "lines of the original code\n"
+    "=======\n"
+    "lines that replace them\n"
+    ">>>>>>> REPLACE\n\n"
+    "The SEARCH lines must match the original code exactly, including indentation, "
+    "and be enough to be unique. Use one block per change, in the order of the code, "
+    "and no blocks if nothing needs to change."
+)
+
+REPAIR_INSTRUCTION = (
+    "The SEARCH lines of these blocks do not match the code:\n\n{blocks}\n\n"
+    "Respond again with corrected blocks only, copying the SEARCH lines from the code."
+)
+
+BLOCK = re.compile(
+    r"^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$",
+    re.MULTILINE | re.DOTALL,
+)
+HUNK = re.compile(r"^@@[^\n]*@@[^\n]*\n((?:[ +\-\\][^\n]*\n?|\n)*)", re.MULTILINE)
+FENCED = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+
+
+class Edit(NamedTuple):
+    """A change of the code: the lines to find and the lines to put instead"""
+
+    search: str
+    replace: str
+
+
+class Patch(NamedTuple):
+    """Edits applied to a file"""
+
+    code: str
+    diff: str
+    applied: int
+    failed: List[Edit]
+
+
+def format_edit(edit: Edit) -> str:
+    """
+    Render an edit as a search/replace block.
+
+    Args:
+        edit (Edit): Edit.
+
+    Returns:
+        str
+    """
+
+    search = edit.search.rstrip("\n") + "\n"
+    replace = edit.replace.rstrip("\n") + "\n" if edit.replace.strip() else ""
+
+    return f"<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE"
+
+
+def parse_edits(text: str) -> List[Edit]:
+    """
+    Extract the edits of a response, as search/replace blocks or unified diff hunks.
+
+    Args:
+        text (str): Model response.
+
+    Returns:
+        List[Edit]: The edits, in order.
+    """
+
+    edits = [Edit(search, replace) for search, replace in BLOCK.findall(text)]
+
+    if edits:
+        return edits
+
+    for hunk in HUNK.findall(text):
+        search, replace = [], []
+
+        for line in hunk.rstrip("\n").splitlines():
+            # An empty line of a diff is an unchanged empty line
+            marker, content = (line[:1], line[1:]) if line else (" ", "")
+
+            if marker in " -":
+                search.append(content)
+
+            if marker in " +":
+                replace.append(content)
+
+        edits.append(Edit("\n".join(search) + "\n", "\n".join(replace) + "\n"))
+
+    return edits
+
+
+def full_code(text: str, original: str) -> Optional[str]:
+    """
+    Find the updated code in a response that repeats the whole file despite the
+    instruction, so that it can still be turned into a diff.
+
+    Only a block that clearly covers the original code counts, an example or a
+    snippet of it must not replace the file: the block needs at least three quarters
+    of the lines of the original, and has to keep most of its non-blank lines.
+
+    Args:
+        text (str): Model response.
+        original (str): Original code.
+
+    Returns:
+        Optional[str]: The largest code block, None if it does not cover the original
+        code.
+    """
+
+    blocks = FENCED.findall(text)
+
+    if not blocks:
+        return None
+
+    code = max(blocks, key=len)
+    lines = {line.strip() for line in code.splitlines()}
+    kept = [line.strip() for line in original.splitlines() if line.strip()]
+
+    if len(code.splitlines()) * 4 < len(original.splitlines()) * 3:
+        return None
+
+    if sum(line in lines for line in kept) * 2 <= len(kept):
+        return None
+
+    return code
+
+
+def locate(
+    lines: List[str], search: List[str], normalise: Callable[[str], str]
+) -> List[int]:
+    """
+    Find the occurrences of lines in the code, comparing normalised lines.
+
+    Args:
+        lines (List[str]): Lines of the code.
+        search (List[str]): Lines to find.
+        normalise (Callable[[str], str]): Normalisation of a line.
+
+    Returns:
+        List[int]: Index of the first line of each occurrence.
+    """
+
+    target = [normalise(line) for line in search]
+    normalised = [normalise(line) for line in lines]
+
+    return [
+        index
+        for index in range(len(lines) - len(search) + 1)
+        if normalised[index : index + len(search)] == target
+    ]
+
+
+def apply_edit(code: str, edit: Edit) -> Optional[str]:
+    """
+    Apply an edit, tolerating differences in trailing whitespace and indentation.
+
+    The search lines are matched as whole lines, first exactly, then ignoring
+    trailing whitespace, then ignoring indentation. They have to match exactly once,
+    an edit that matches several places is as unusable as one that matches none.
+
+    Args:
+        code (str): Code.
+        edit (Edit): Edit.
+
+    Returns:
+        Optional[str]: The edited code, None if the search lines are empty, not found
+        or found more than once.
+    """
+
+    search = edit.search.splitlines()
+
+    # Blank lines around the search lines are often added or dropped
+    while search and not search[0].strip():
+        search.pop(0)
+
+    while search and not search[-1].strip():
+        search.pop()
+
+    if not search:
+        return None
+
+    lines = code.splitlines()
+    replace = edit.replace.splitlines()
+
+    normalisers: Tuple[Callable[[str], str], ...] = (str, str.rstrip, str.strip)
+
+    for normalise in normalisers:
+        found = locate(lines, search, normalise)
+
+        if found:
+            break
+
+    if len(found) != 1:
+        return None
+
+    index = found[0]
+
+    if normalise is str.strip:
+        # Re-indent the replacement like the code it replaces
+        indent = lines[index][: len(lines[index]) - len(lines[index].lstrip())]
+        given = search[0][: len(search[0]) - len(search[0].lstrip())]
+
+        replace = [
+            indent + line[len(given) :] if line.startswith(given) else line
+            for line in replace
+        ]
+
+    lines[index : index + len(search)] = replace
+
+    return "\n".join(lines) + ("\n" if code.endswith("\n") else "")
+
+
+def apply_edits(code: str, edits: List[Edit]) -> Tuple[str, List[Edit]]:
+    """
+    Apply edits in order, skipping those that do not apply.
+
+    Args:
+        code (str): Code.
+        edits (List[Edit]): Edits.
+
+    Returns:
+        Tuple[str, List[Edit]]: The edited code, and the edits that did not apply.
+    """
+
+    failed = []
+
+    for edit in edits:
+        edited = apply_edit(code, edit)
+
+        if edited is None:
+            failed.append(edit)
+
+        else:
+            code = edited
+
+    return code, failed
+
+
+def unified_diff(original: str, updated: str, path: str) -> str:
+    """
+    Render the changes of a file as a unified diff, applicable with `git apply`.
+
+    Args:
+        original (str): Original code.
+        updated (str): Updated code.
+        path (str): Path of the file.
+
+    Returns:
+        str: The diff, empty if nothing changed.
+    """
+
+    path = path.lstrip("/")
+    diff = difflib.unified_diff(
+        original.splitlines(keepends=True),
+        updated.splitlines(keepends=True),
+        f"a/{path}",
+        f"b/{path}",
+    )
+
+    return "".join(
+        line if line.endswith("\n") else f"{line}\n\\ No newline at end of file\n"
+        for line in diff
+    )
@@ -0,0 +1,92 @@
+""" Speculative prefetch of the next code completion """
+
+import os
+import subprocess
+import sys
+import threading
+from typing import Optional
+from code_star_cli import daemon
+from code_star_cli.config import settings
+
+
+def prefetch(
+    prompt: str, max_new_tokens: Optional[int], model: Optional[str] = None
+) -> None:
+    """
+    Complete a prompt in the background, so that its completion is cached by the time
+    it is requested, e.g. the prompt followed by the completion the user just accepted.
+
+    In the daemon, the completion is requested by a thread. Otherwise it is requested
+    by a detached process, so that the CLI exits without waiting for it.
+
+    Args:
+        prompt (str): Prompt to complete.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str, optional): Model to use, defaults to the configured model.
+    """
+
+    if not settings.cache_enabled:
+        return
+
+    model = model or settings.option("completion_model")
+
+    if daemon.serving:
+        thread = threading.Thread(
+            target=complete, args=(prompt, max_new_tokens, model), daemon=True
+        )
+        daemon.background.append(thread)
+        thread.start()
+        return
+
+    env = dict(os.environ)
+
+    # Forward the settings of the CLI options and of the command
+    env["CODE_STAR_BACKEND"] = settings.option("backend")
+
+    if settings.option("endpoint"):
+        env["CODE_STAR_ENDPOINT"] = settings.option("endpoint")
+
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "code_star_cli.prefetch",
+            str(max_new_tokens or ""),
+            model,
+        ],
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    with process.stdin as stdin:  # type: ignore[union-attr]
+        stdin.write(prompt.encode("utf-8"))
+
+
+def complete(prompt: str, max_new_tokens: Optional[int], model: str) -> None:
+    """
+    Request a completion to cache it, failures are ignored.
+
+    Args:
+        prompt (str): Prompt to complete.
+        max_new_tokens (int, optional): Maximum number of generated tokens.
+        model (str): Model to use.
+    """
+
+    from code_star_cli.inference import generate
+
+    try:
+        generate(prompt, max_new_tokens, model)
+
+    except Exception:
+        pass
+
+
+if __name__ == "__main__":
+    complete(
+        sys.stdin.buffer.read().decode("utf-8"),
+        int(sys.argv[1]) if sys.argv[1] else None,
+        sys.argv[2],
+    )
@@ -0,0 +1,212 @@
+""" Retries with exponential backoff and client-side rate limiting """
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+from code_star_cli.config import settings
+
+
+T = TypeVar("T")
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request of the process.
+
+    When the server asks to back off, e.g. with a 429 and a `Retry-After` header,
+    the bucket is paused so that all workers of a batch run wait together instead
+    of hammering the server.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        """
+        Args:
+            rate (float): Requests per second, 0 disables the limit.
+            burst (float, optional): Bucket capacity, defaults to one second worth of requests.
+        """
+
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+
+                if wait <= 0 and self.rate <= 0:
+                    return
+
+                if wait <= 0:
+                    self.tokens = min(
+                        self.capacity, self.tokens + (now - self.updated) * self.rate
+                    )
+                    self.updated = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold back every request for a while.
+
+        Args:
+            seconds (float): Number of seconds to wait.
+        """
+
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+# Limiters by rate, a daemon serves invocations with different settings
+_limiters: Dict[float, RateLimiter] = {}
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the process-wide rate limiter of the rate of the settings.
+
+    Returns:
+        RateLimiter
+    """
+
+    if settings.rate_limit not in _limiters:
+        _limiters[settings.rate_limit] = RateLimiter(settings.rate_limit)
+
+    return _limiters[settings.rate_limit]
+
+
+def error_response(error: BaseException) -> Any:
+    """
+    Find the HTTP response of a failed request.
+
+    huggingface_hub re-raises text generation errors of TGI as its own exceptions,
+    the HTTP error they were raised from carries the response.
+
+    Args:
+        error (BaseException): Failed request.
+
+    Returns:
+        Any: The response, None if the request failed before getting one.
+    """
+
+    response = getattr(error, "response", None)
+
+    if response is None and error.__cause__ is not None:
+        response = getattr(error.__cause__, "response", None)
+
+    return response
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Read the delay requested by the server in the `Retry-After` header.
+
+    Args:
+        error (BaseException): Failed request.
+
+    Returns:
+        Optional[float]: Number of seconds to wait, None if the server did not say.
+    """
+
+    response = error_response(error)
+    value = response.headers.get("Retry-After") if response is not None else None
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether a failed request is transient.
+
+    Args:
+        error (BaseException): Failed request.
+
+    Returns:
+        bool
+    """
+
+    import requests
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError)):
+        return True
+
+    response = error_response(error)
+
+    return response is not None and response.status_code in RETRYABLE_STATUS
+
+
+def with_retry(request: Callable[[], T]) -> T:
+    """
+    Send a request, retrying transient failures with exponential backoff and full jitter.
+
+    The `Retry-After` header takes precedence over the backoff, and the total time
+    spent waiting is capped by the `max_retry_wait` setting.
+
+    Args:
+        request (Callable[[], T]): Function that sends the request.
+
+    Returns:
+        T: The response.
+
+    Raises:
+        Exception: The last error, if it is not transient or the retries are exhausted.
+    """
+
+    limiter = get_rate_limiter()
+    waited = 0.0
+    attempt = 0
+
+    while True:
+        limiter.acquire()
+
+        try:
+            return request()
+
+        except Exception as error:
+            if not is_retryable(error) or attempt >= settings.max_retries:
+                raise
+
+            delay = retry_after(error)
+            throttled = delay is not None
+
+            if delay is None:
+                delay = random.uniform(0, settings.retry_backoff * 2**attempt)
+
+            # A request that gives up does not hold back the others
+            if waited + delay > settings.max_retry_wait:
+                raise
+
+            if throttled:
+                limiter.pause(delay)
+
+            time.sleep(delay)
+            waited += delay
+            attempt += 1
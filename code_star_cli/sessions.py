@@ -0,0 +1,286 @@
+""" Append-only store of chat sessions """
+
+import json
+import os
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+
+# Bytes read at a time when loading the tail of a session
+BLOCK_SIZE = 64 * 1024
+
+# Session IDs are file stems, anything else could name a file outside the directory
+SESSION_ID = re.compile(r"[\w-]+")
+
+
+class SessionInfo(NamedTuple):
+    """Summary of a stored session"""
+
+    id: str
+    updated: float
+    size: int
+    title: str
+
+
+def parse(line: bytes) -> Optional[Dict[str, str]]:
+    """
+    Parse a stored message.
+
+    Args:
+        line (bytes): Line of a session file.
+
+    Returns:
+        Optional[Dict[str, str]]: The message, None for blank or truncated lines,
+        e.g. the last line after a crash.
+    """
+
+    try:
+        message = json.loads(line)
+
+    except ValueError:
+        return None
+
+    return message if isinstance(message, dict) and "role" in message else None
+
+
+class Session:
+    """
+    Chat session stored as JSON lines, one message per line.
+
+    Messages are appended and synced as they are exchanged, so a crash loses at most
+    the turn in flight. Resuming a session only reads its first message and as much
+    of its end as fits into the context window.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        Args:
+            path (Path): Session file.
+        """
+
+        self.path = path
+        self.pending: List[Dict[str, str]] = []
+        self._file: Optional[IO[bytes]] = None
+
+    @property
+    def id(self) -> str:
+        """Session ID, the name of the session file."""
+
+        return self.path.stem
+
+    @property
+    def saved(self) -> bool:
+        """Whether the session has been written, i.e. it has at least one turn."""
+
+        return self.path.exists()
+
+    @classmethod
+    def create(cls, directory: Path, messages: List[Dict[str, str]]) -> "Session":
+        """
+        Start a new session, written once its first turn is appended.
+
+        Args:
+            directory (Path): Sessions directory.
+            messages (List[Dict[str, str]]): Initial messages, e.g. the system message.
+
+        Returns:
+            Session
+        """
+
+        session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(2)}"
+        session = cls(directory / f"{session_id}.jsonl")
+        session.pending = list(messages)
+
+        return session
+
+    @classmethod
+    def open(cls, directory: Path, session_id: str) -> "Session":
+        """
+        Open a stored session.
+
+        Args:
+            directory (Path): Sessions directory.
+            session_id (str): Session ID, `last` for the most recently updated session.
+
+        Returns:
+            Session
+
+        Raises:
+            FileNotFoundError: If there is no such session.
+            ValueError: If the ID is not a session ID.
+        """
+
+        if session_id == "last":
+            sessions = list_sessions(directory)
+
+            if not sessions:
+                raise FileNotFoundError("There are no sessions to resume.")
+
+            session_id = sessions[0].id
+
+        if not SESSION_ID.fullmatch(session_id):
+            raise ValueError(f"{session_id!r} is not a session ID.")
+
+        path = directory / f"{session_id}.jsonl"
+
+        if not path.is_file():
+            raise FileNotFoundError(f"Session {session_id} does not exist.")
+
+        return cls(path)
+
+    def append(self, *messages: Dict[str, str]) -> None:
+        """
+        Store messages durably.
+
+        Args:
+            *messages (Dict[str, str]): Chat messages.
+        """
+
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "ab+")
+
+            # Terminate a line truncated by a crash, it is skipped when reading
+            if self._file.seek(0, os.SEEK_END) > 0:
+                self._file.seek(-1, os.SEEK_END)
+
+                if self._file.read(1) != b"\n":
+                    self._file.write(b"\n")
+
+        self._file.write(
+            b"".join(
+                json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+                for message in [*self.pending, *messages]
+            )
+        )
+        self.pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Close the session file."""
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def messages(self) -> Iterator[Dict[str, str]]:
+        """
+        Read every message of the session.
+
+        Yields:
+            Dict[str, str]
+        """
+
+        if self.saved:
+            with open(self.path, "rb") as file:
+                for line in file:
+                    message = parse(line)
+
+                    if message is not None:
+                        yield message
+
+        yield from self.pending
+
+    def head(self) -> Optional[Dict[str, str]]:
+        """
+        Read the first message of the session, usually the system message.
+
+        Returns:
+            Optional[Dict[str, str]]
+        """
+
+        return next(self.messages(), None)
+
+    def tail(
+        self, budget: int, count: Callable[[Dict[str, str]], int]
+    ) -> List[Dict[str, str]]:
+        """
+        Read the most recent messages, backwards, until they exceed a token budget.
+
+        The cost depends on the budget, not on the length of the session.
+
+        Args:
+            budget (int): Number of tokens to read.
+            count (Callable[[Dict[str, str]], int]): Estimates the tokens of a message.
+
+        Returns:
+            List[Dict[str, str]]: The most recent messages, oldest first, without the
+            system message.
+        """
+
+        messages: List[Dict[str, str]] = []
+        used = 0
+
+        with open(self.path, "rb") as file:
+            position = file.seek(0, os.SEEK_END)
+            remainder = b""
+
+            while position > 0 and used <= budget:
+                size = min(BLOCK_SIZE, position)
+                position -= size
+                file.seek(position)
+                lines = (file.read(size) + remainder).split(b"\n")
+
+                # The first line is incomplete until the start of the file is read
+                remainder = lines.pop(0) if position > 0 else b""
+
+                for line in reversed(lines):
+                    message = parse(line)
+
+                    if message is None or message["role"] == "system":
+                        continue
+
+                    messages.append(message)
+                    used += count(message)
+
+                    if used > budget:
+                        break
+
+        messages.reverse()
+
+        return messages
+
+    def title(self) -> str:
+        """
+        Describe the session by its first user message.
+
+        Returns:
+            str
+        """
+
+        for message in self.messages():
+            lines = str(message["content"]).strip().splitlines()
+
+            if message["role"] == "user" and lines:
+                return lines[0][:60] + ("..." if len(lines[0]) > 60 else "")
+
+        return ""
+
+
+def list_sessions(directory: Path) -> List[SessionInfo]:
+    """
+    List the stored sessions, most recently updated first.
+
+    Args:
+        directory (Path): Sessions directory.
+
+    Returns:
+        List[SessionInfo]
+    """
+
+    if not directory.is_dir():
+        return []
+
+    sessions = []
+
+    for path in directory.glob("*.jsonl"):
+        stat = path.stat()
+        sessions.append(
+            SessionInfo(path.stem, stat.st_mtime, stat.st_size, Session(path).title())
+        )
+
+    return sorted(sessions, key=lambda session: session.updated, reverse=True)
@@ -0,0 +1,111 @@
+""" Incremental rendering of streamed LLM responses """
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, AsyncGenerator, Iterable, Iterator, Optional, TextIO
+from code_star_cli import create_panel
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
+
+# Minimum number of seconds between two Markdown re-renders of the live panel
+REFRESH_INTERVAL = 0.1
+
+
+def chat_chunks(stream: Iterable) -> Iterator[str]:
+    """
+    Extract the text deltas from a streamed chat completion.
+
+    Args:
+        stream (Iterable): Output of `InferenceClient.chat_completion(..., stream=True)`.
+
+    Yields:
+        str: Text deltas.
+    """
+
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def sync_chunks(chunks: AsyncGenerator[str, None]) -> Iterator[str]:
+    """
+    Consume streamed text of the async API from synchronous code, e.g. to render it.
+
+    Args:
+        chunks (AsyncGenerator[str, None]): Text chunks, e.g. of `api.chat_stream`.
+
+    Yields:
+        str: Text chunks.
+    """
+
+    loop = asyncio.new_event_loop()
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(chunks.__anext__())
+
+            except StopAsyncIteration:
+                return
+
+    finally:
+        loop.run_until_complete(chunks.aclose())
+        loop.close()
+
+
+def stream_response(
+    chunks: Iterable[str],
+    output: Optional[TextIO] = None,
+    title: str = "CodeStar",
+    prefix: str = "",
+    console: Optional["Console"] = None,
+) -> str:
+    """
+    Render streamed text in a live panel, or write it incrementally to a file.
+
+    Args:
+        chunks (Iterable[str]): Text chunks as they are generated.
+        output (TextIO, optional): File to write the chunks to instead of the terminal.
+        title (str): Panel title.
+        prefix (str): Text that precedes the generated chunks, e.g. the completed code.
+        console (Console, optional): Console to render the live panel on.
+
+    Returns:
+        str: The full response, including the prefix.
+    """
+
+    content = prefix
+
+    if output:
+        output.write(prefix)
+
+        for chunk in chunks:
+            content += chunk
+            output.write(chunk)
+            output.flush()
+
+        return content
+
+    from rich.live import Live
+
+    with Live(
+        create_panel(title, content),
+        console=console,
+        auto_refresh=False,
+        vertical_overflow="visible",
+    ) as live:
+        last_render = time.monotonic()
+
+        for chunk in chunks:
+            content += chunk
+
+            # Parsing Markdown on every token is quadratic, render at most every interval
+            if time.monotonic() - last_render >= REFRESH_INTERVAL:
+                live.update(create_panel(title, content), refresh=True)
+                last_render = time.monotonic()
+
+        live.update(create_panel(title, content), refresh=True)
+
+    return content
@@ -0,0 +1,55 @@
+""" Tests of the response cache """
+
+from pathlib import Path
+import pytest
+from code_star_cli import inference
+from code_star_cli.cache import ResponseCache
+from code_star_cli.config import settings
+
+
+def test_roundtrip(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path / "responses.sqlite3", 1024, 60)
+    cache.set("key", "value")
+
+    assert cache.get("key") == "value"
+    assert cache.get("other") is None
+
+
+def test_unusable_directory_turns_the_cache_off(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "cache_enabled", True)
+    blocked = tmp_path / "file"
+    blocked.write_text("not a directory")
+    cache = ResponseCache(blocked / "responses.sqlite3", 1024, 60)
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert settings.cache_enabled is False
+
+
+def test_empty_cached_response_is_a_hit(monkeypatch: pytest.MonkeyPatch) -> None:
+    def unexpected(*args: object) -> None:
+        raise AssertionError("The cached response was not served")
+
+    monkeypatch.setattr(inference, "cached", lambda key, use_cache: "")
+    monkeypatch.setattr(inference, "continuation", unexpected)
+    monkeypatch.setattr(inference, "get_backend", unexpected)
+
+    assert inference.generate("def f():", model="model") == ""
+    assert list(inference.generate_stream("def f():", model="model")) == [""]
+
+
+def test_responses_are_cached_per_backend_and_endpoint(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "backend", "hf")
+    monkeypatch.setattr(settings, "endpoint", None)
+    key = inference.request_key(model="model", prompt="def")
+
+    monkeypatch.setattr(settings, "endpoint", "http://localhost:8080")
+    assert inference.request_key(model="model", prompt="def") != key
+
+    monkeypatch.setattr(settings, "endpoint", None)
+    monkeypatch.setattr(settings, "backend", "local")
+    assert inference.request_key(model="model", prompt="def") != key
@@ -0,0 +1,70 @@
+""" Tests of the splitting of code into chunks """
+
+from typing import List
+import pytest
+from code_star_cli.chunking import Chunk, split_code
+
+
+PYTHON = "".join(
+    f"# Function {index}\n"
+    f"def function_{index}(value):\n"
+    f"    total = value * {index}\n"
+    f"    return total + {index}\n\n\n"
+    for index in range(20)
+)
+
+TEXT = "".join(
+    f"line {index} of the document\n" + ("\n" if index % 7 == 6 else "")
+    for index in range(60)
+)
+
+
+def check_offsets(code: str, chunks: List[Chunk]) -> None:
+    lines = code.splitlines(keepends=True)
+
+    for chunk in chunks:
+        assert chunk.text == "".join(lines[chunk.start - 1 : chunk.end])
+
+    assert [chunk.start for chunk in chunks[1:]] == [
+        chunk.end + 1 for chunk in chunks[:-1]
+    ]
+    assert chunks[0].start == 1
+    assert chunks[-1].end == len(lines)
+
+
+def test_small_code_is_one_chunk() -> None:
+    assert split_code("x = 1\n", 100) == [Chunk("x = 1\n", 1, 1)]
+
+
+@pytest.mark.parametrize(
+    "code, filename",
+    [(PYTHON, "module.py"), (TEXT, "notes.txt"), (PYTHON, "module.js")],
+)
+@pytest.mark.parametrize("budget", [20, 50, 200])
+def test_split_is_lossless(code: str, filename: str, budget: int) -> None:
+    chunks = split_code(code, budget, filename)
+
+    assert len(chunks) > 1
+    assert "".join(chunk.text for chunk in chunks) == code
+    check_offsets(code, chunks)
+
+
+def test_python_is_split_at_definitions() -> None:
+    for chunk in split_code(PYTHON, 50, "module.py"):
+        assert chunk.text.startswith("# Function")
+
+
+def test_code_without_trailing_newline() -> None:
+    code = PYTHON.rstrip("\n")
+    chunks = split_code(code, 50, "module.py")
+
+    assert "".join(chunk.text for chunk in chunks) == code
+    check_offsets(code, chunks)
+
+
+def test_invalid_python_falls_back_to_lines() -> None:
+    code = PYTHON.replace("def function_3(value):", "def function_3(value")
+    chunks = split_code(code, 50, "module.py")
+
+    assert "".join(chunk.text for chunk in chunks) == code
+    check_offsets(code, chunks)
@@ -0,0 +1,70 @@
+""" Tests of the coalescing of identical requests """
+
+import threading
+import time
+from typing import List, Union
+import pytest
+from code_star_cli.coalesce import Coalescer
+
+
+def share(coalescer: Coalescer, outcome: Union[BaseException, str]) -> List[object]:
+    """Run a request and a duplicate that joins while it is in flight"""
+
+    release = threading.Event()
+    results: List[object] = []
+
+    def call() -> str:
+        release.wait(5)
+
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+        return outcome
+
+    def run() -> None:
+        try:
+            results.append(coalescer.run("key", call))
+
+        except Exception as error:
+            results.append(error)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+
+    release.set()
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def test_shared_success_is_saved() -> None:
+    coalescer = Coalescer()
+
+    assert sorted(share(coalescer, "reply"), key=str) == [
+        ("reply", False),
+        ("reply", True),
+    ]
+    assert (coalescer.sent, coalescer.saved) == (1, 1)
+
+
+def test_shared_failure_is_not_saved() -> None:
+    coalescer = Coalescer()
+    error = RuntimeError("overloaded")
+
+    assert share(coalescer, error) == [error, error]
+    assert (coalescer.sent, coalescer.saved) == (1, 0)
+
+
+def test_failed_request_is_sent_again() -> None:
+    coalescer = Coalescer()
+
+    with pytest.raises(RuntimeError):
+        coalescer.run("key", lambda: (_ for _ in ()).throw(RuntimeError("down")))
+
+    assert coalescer.run("key", lambda: "reply") == ("reply", False)
+    assert coalescer.sent == 2
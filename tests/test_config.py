@@ -0,0 +1,32 @@
+""" Tests of the loading of the settings """
+
+from pathlib import Path
+import pytest
+from code_star_cli.config import Settings
+
+
+def test_environment_overrides_are_converted(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CODE_STAR_TIMEOUT", "2.5")
+
+    assert Settings.load().timeout == 2.5
+
+
+def test_invalid_environment_value_names_the_variable(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("CODE_STAR_TIMEOUT", "abc")
+
+    with pytest.raises(ValueError, match="CODE_STAR_TIMEOUT: invalid timeout"):
+        Settings.load()
+
+
+@pytest.mark.parametrize("text", ["timeout = [\n", 'pool_size = "many"\n'])
+def test_invalid_configuration_file_names_the_file(
+    text: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "config.toml"
+    path.write_text(text)
+    monkeypatch.setenv("CODE_STAR_CONFIG", str(path))
+
+    with pytest.raises(ValueError, match=str(path)):
+        Settings.load()
@@ -0,0 +1,89 @@
+""" Tests of the forwarding of invocations to the daemon """
+
+import os
+import socket
+from pathlib import Path
+import click
+import pytest
+import typer
+from code_star_cli import daemon
+from code_star_cli.main import code_star
+
+
+@pytest.fixture(autouse=True)
+def allow_forwarding(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("CODE_STAR_NO_DAEMON", raising=False)
+
+
+def test_value_options_match_the_global_options() -> None:
+    group = typer.main.get_command(code_star)
+    options = {
+        name
+        for param in group.params
+        if isinstance(param, click.Option) and not param.is_flag
+        for name in param.opts
+    }
+
+    assert daemon.VALUE_OPTIONS == options
+
+
+@pytest.mark.parametrize(
+    "argv, forwarded",
+    [
+        (["review", "src/"], True),
+        (["--endpoint", "http://localhost:8080", "completions", "x"], True),
+        (["--metrics", "out.json", "completions", "x"], True),
+        (["--metrics-format", "prometheus", "scan", "x"], True),
+        (["chat"], False),
+        (["review", "--help"], False),
+        (["scan", ".", "--diff", "-"], False),
+    ],
+)
+def test_should_forward(argv: list, forwarded: bool) -> None:
+    assert daemon.should_forward(argv) == forwarded
+
+
+def test_apply_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CODE_STAR_ENDPOINT", "http://daemon")
+    monkeypatch.setenv("CODE_STAR_NO_CACHE", "1")
+    monkeypatch.delenv("CODE_STAR_BACKEND", raising=False)
+    saved = daemon.client_environment()
+
+    daemon.apply_environment({"CODE_STAR_BACKEND": "openai"})
+
+    assert daemon.client_environment() == {"CODE_STAR_BACKEND": "openai"}
+
+    daemon.apply_environment(saved)
+
+    assert daemon.client_environment() == saved
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets only")
+def test_only_private_sockets_of_the_user_are_trusted(tmp_path: Path) -> None:
+    path = str(tmp_path / "code-star.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+
+    try:
+        os.chmod(path, 0o666)
+        assert not daemon.trusted(path)
+
+        os.chmod(path, 0o600)
+        assert daemon.trusted(path)
+
+    finally:
+        server.close()
+
+    (tmp_path / "file").write_text("")
+
+    assert not daemon.trusted(str(tmp_path / "file"))
+    assert not daemon.trusted(str(tmp_path / "missing.sock"))
+
+
+def test_untrusted_socket_is_not_forwarded_to(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("CODE_STAR_SOCKET", str(tmp_path / "file"))
+    (tmp_path / "file").write_text("")
+
+    assert daemon.forward(["review", "src/"]) is None
@@ -0,0 +1,90 @@
+""" Tests of the changed lines of unified diffs """
+
+import difflib
+from typing import List, Set
+import pytest
+from code_star_cli.diffs import Excerpt, excerpts, parse_diff, regions
+
+
+OLD = [f"line {number}\n" for number in range(1, 21)]
+
+
+def diff(old: List[str], new: List[str], context: int) -> str:
+    return "".join(difflib.unified_diff(old, new, "a/app.py", "b/app.py", n=context))
+
+
+@pytest.mark.parametrize("context", [0, 3])
+@pytest.mark.parametrize(
+    "new, changed",
+    [
+        (OLD[:4] + ["changed\n"] + OLD[5:], {5}),
+        (OLD[:4] + ["inserted\n", "inserted\n"] + OLD[4:], {5, 6}),
+        (OLD[:6] + OLD[9:], {7}),
+        (OLD[1:], {1}),
+        (OLD + ["appended\n"], {21}),
+        (["prepended\n"] + OLD, {1}),
+        (OLD[:2] + ["changed\n"] + OLD[3:15] + ["inserted\n"] + OLD[15:], {3, 16}),
+    ],
+    ids=[
+        "changed",
+        "inserted",
+        "deleted",
+        "deleted-first",
+        "appended",
+        "prepended",
+        "two-hunks",
+    ],
+)
+def test_changed_lines(new: List[str], changed: Set[int], context: int) -> None:
+    assert parse_diff(diff(OLD, new, context)) == {"app.py": changed}
+
+
+def test_git_headers_and_files() -> None:
+    text = (
+        "diff --git a/new.py b/new.py\n"
+        "new file mode 100644\n"
+        "--- /dev/null\n"
+        "+++ b/new.py\n"
+        "@@ -0,0 +1,2 @@\n"
+        "+first\n"
+        "+second\n"
+        "diff --git a/old.py b/old.py\n"
+        "deleted file mode 100644\n"
+        "--- a/old.py\n"
+        "+++ /dev/null\n"
+        "@@ -1 +0,0 @@\n"
+        "-gone\n"
+        "diff --git a/app.py b/app.py\n"
+        "--- a/app.py\n"
+        "+++ b/app.py\n"
+        "@@ -1 +1 @@\n"
+        "-old\n"
+        "+new\n"
+        "\\ No newline at end of file\n"
+    )
+
+    assert parse_diff(text) == {"new.py": {1, 2}, "app.py": {1}}
+
+
+def test_regions_merge_nearby_changes() -> None:
+    assert regions({2, 5, 20}, 2, 21) == [(1, 7), (18, 21)]
+    assert regions({30}, 3, 21) == [(18, 21)]
+
+
+def test_excerpts_number_and_mark_changed_lines() -> None:
+    code = "".join(OLD)
+
+    assert excerpts(code, {3, 18}, 1, 1000) == [
+        Excerpt(
+            " 2| line 2\n+3| line 3\n 4| line 4\n...\n"
+            " 17| line 17\n+18| line 18\n 19| line 19",
+            2,
+            19,
+        )
+    ]
+
+
+def test_excerpts_split_at_the_budget() -> None:
+    parts = excerpts("".join(OLD), {3, 18}, 1, 15)
+
+    assert [(part.start, part.end) for part in parts] == [(2, 4), (17, 19)]
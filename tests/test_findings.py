@@ -0,0 +1,91 @@
+""" Tests of the parsing and rendering of structured findings """
+
+import json
+import pytest
+from code_star_cli.findings import (
+    Finding,
+    OutputFormat,
+    format_findings,
+    load_array,
+    parse_findings,
+)
+
+
+ITEM = {"line": 3, "severity": "high", "rule": "SQL Injection", "message": "Bad"}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        json.dumps([ITEM]),
+        f"```json\n{json.dumps([ITEM])}\n```",
+        f"Here are the findings:\n{json.dumps([ITEM])}\nHope this helps.",
+        json.dumps([ITEM])[:-1] + ",]",
+        json.dumps({"findings": [ITEM]}),
+        json.dumps(ITEM),
+    ],
+    ids=["plain", "fenced", "prose", "trailing-comma", "object", "single"],
+)
+def test_load_array_repairs_responses(text: str) -> None:
+    assert load_array(text) == [ITEM]
+
+
+def test_load_array_keeps_complete_findings_of_a_truncated_response() -> None:
+    text = json.dumps([ITEM, ITEM])[:-1] + ', {"line": 9, "mess'
+
+    assert load_array(text) == [ITEM, ITEM]
+
+
+@pytest.mark.parametrize("text", ["No issues found.", "[{'line': 1,"])
+def test_load_array_rejects_responses_without_an_array(text: str) -> None:
+    with pytest.raises(ValueError):
+        load_array(text)
+
+
+def test_parse_findings_normalises_items() -> None:
+    items = [
+        {**ITEM, "line": 1, "end_line": 99},
+        {"line": "x", "message": " Unclear ", "severity": "unknown"},
+        {"line": 5, "message": ""},
+        "not a finding",
+    ]
+
+    assert parse_findings(json.dumps(items), "app.py", 2, 10) == [
+        Finding("app.py", 2, 10, "error", "sql-injection", "Bad", ""),
+        Finding("app.py", 2, 2, "warning", "finding", "Unclear", ""),
+    ]
+
+
+def test_sarif_output() -> None:
+    findings = [
+        Finding("src/b.py", 4, 4, "note", "style", "Long line", ""),
+        Finding("src/a.py", 2, 3, "error", "sql-injection", "Bad", "Use parameters"),
+    ]
+    log = json.loads(format_findings(findings, OutputFormat.SARIF))
+    run = log["runs"][0]
+
+    assert log["version"] == "2.1.0"
+    assert run["tool"]["driver"]["rules"] == [{"id": "sql-injection"}, {"id": "style"}]
+
+    first, second = run["results"]
+
+    assert first["ruleId"] == "sql-injection"
+    assert first["ruleIndex"] == 0
+    assert first["level"] == "error"
+    assert first["message"]["text"] == "Bad\n\nUse parameters"
+    assert first["locations"][0]["physicalLocation"] == {
+        "artifactLocation": {"uri": "src/a.py"},
+        "region": {"startLine": 2, "endLine": 3},
+    }
+    assert second["ruleIndex"] == 1
+    assert second["message"]["text"] == "Long line"
+
+
+def test_json_output_is_sorted() -> None:
+    findings = [
+        Finding("b.py", 1, 1, "note", "style", "Second", ""),
+        Finding("a.py", 7, 7, "note", "style", "First", ""),
+    ]
+    document = json.loads(format_findings(findings, OutputFormat.JSON))
+
+    assert [item["message"] for item in document["findings"]] == ["First", "Second"]
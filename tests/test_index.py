@@ -0,0 +1,21 @@
+""" Tests of the code index """
+
+from pathlib import Path
+import pytest
+from code_star_cli.config import settings
+from code_star_cli.index import CodeIndex
+
+
+def test_files_that_cannot_be_stat_are_skipped(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "cache_dir", tmp_path / "cache")
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "app.py").write_text("def handler(request):\n    return request\n")
+    (root / "broken.py").symlink_to(root / "missing.py")
+    index = CodeIndex(root)
+    stats = index.update()
+
+    assert stats.indexed == 1
+    assert [snippet.path for snippet in index.search("handler")] == ["app.py"]
@@ -0,0 +1,102 @@
+""" Tests of the parsing and application of edits """
+
+from code_star_cli.patches import Edit, apply_edit, apply_edits, full_code, parse_edits
+
+
+CODE = "def f():\n    return 1\n\n\ndef g():\n    return 2\n"
+
+
+def test_parse_search_replace_blocks() -> None:
+    text = (
+        "Here are the changes:\n"
+        "<<<<<<< SEARCH\n    return 1\n=======\n    return 10\n>>>>>>> REPLACE\n\n"
+        "<<<<<<< SEARCH\n    return 2\n=======\n>>>>>>> REPLACE\n"
+    )
+
+    assert parse_edits(text) == [
+        Edit("    return 1\n", "    return 10\n"),
+        Edit("    return 2\n", ""),
+    ]
+
+
+def test_parse_unified_diff_hunks() -> None:
+    text = "```diff\n@@ -1,2 +1,2 @@\n def f():\n-    return 1\n+    return 10\n```"
+
+    assert parse_edits(text) == [
+        Edit("def f():\n    return 1\n", "def f():\n    return 10\n")
+    ]
+
+
+def test_parse_without_edits() -> None:
+    assert parse_edits("Nothing needs to change.") == []
+
+
+def test_apply_unique_search() -> None:
+    edit = Edit("    return 2\n", "    return 20\n")
+
+    assert apply_edit(CODE, edit) == CODE.replace("return 2", "return 20")
+
+
+def test_apply_tolerates_whitespace_and_indentation() -> None:
+    trailing = Edit("    return 1   \n", "    return 10\n")
+    indented = Edit("return 1\n", "return 10\n")
+
+    assert apply_edit(CODE, trailing) == CODE.replace("return 1", "return 10")
+    assert apply_edit(CODE, indented) == CODE.replace("return 1", "return 10")
+
+
+def test_apply_rejects_ambiguous_search() -> None:
+    code = "def f():\n    return 1\n\n\ndef g():\n    return 1\n"
+
+    assert apply_edit(code, Edit("    return 1\n", "    return 10\n")) is None
+    assert apply_edit(code, Edit("return 1", "return 10")) is None
+
+
+def test_apply_matches_whole_lines_only() -> None:
+    code = "def f():\n    max = 0\n    return max\n"
+
+    assert apply_edit(code, Edit("x = 0", "y = 5")) is None
+    assert apply_edit(code, Edit("max = 0\n", "max = 5\n")) == code.replace("0", "5")
+
+
+def test_apply_ignores_suffixes_of_other_lines() -> None:
+    code = "max = 0\nx = 0\n"
+
+    assert apply_edit(code, Edit("x = 0\n", "y = 5\n")) == "max = 0\ny = 5\n"
+
+
+def test_apply_rejects_missing_search() -> None:
+    assert apply_edit(CODE, Edit("    return 3\n", "    return 30\n")) is None
+
+
+def test_apply_rejects_empty_search() -> None:
+    assert apply_edit(CODE, Edit("", "import os\n")) is None
+    assert apply_edit(CODE, Edit("\n\n", "import os\n")) is None
+
+
+def test_apply_edits_reports_failed() -> None:
+    edits = [Edit("    return 1\n", "    return 10\n"), Edit("missing\n", "")]
+    updated, failed = apply_edits(CODE, edits)
+
+    assert updated == CODE.replace("return 1", "return 10")
+    assert failed == [edits[1]]
+
+
+def test_full_code_of_a_repeated_file() -> None:
+    updated = CODE.replace("return 1", "return 10")
+
+    assert full_code(f"Updated code:\n```python\n{updated}```", CODE) == updated
+
+
+def test_full_code_ignores_short_snippets() -> None:
+    assert full_code("```python\nreturn 10\n```", CODE) is None
+    assert full_code("No code here.", CODE) is None
+
+
+def test_full_code_ignores_examples() -> None:
+    code = "from x import z\nz()\n"
+    function = "def f():\n    a = 1\n    b = 2\n    return a + b\n"
+    example = "Example usage:\n```python\nf()\nprint(1)\n```"
+
+    assert full_code("You could write:\n```python\nfrom x import y\n```", code) is None
+    assert full_code(example, function) is None
@@ -0,0 +1,50 @@
+""" Tests of the retries of failed requests """
+
+import types
+import pytest
+from code_star_cli import retry
+from code_star_cli.config import settings
+
+
+class Throttled(Exception):
+    """A 429 response that asks to wait"""
+
+    def __init__(self, seconds: str) -> None:
+        super().__init__("Too Many Requests")
+        self.response = types.SimpleNamespace(
+            status_code=429, headers={"Retry-After": seconds}
+        )
+
+
+def test_retry_after_the_requested_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "max_retries", 3)
+    monkeypatch.setattr(settings, "max_retry_wait", 60.0)
+    monkeypatch.setattr(settings, "rate_limit", 0.0)
+    monkeypatch.setattr(retry.time, "sleep", lambda seconds: None)
+    replies = iter([Throttled("0"), "reply"])
+
+    def request() -> str:
+        reply = next(replies)
+
+        if isinstance(reply, Exception):
+            raise reply
+
+        return reply
+
+    assert retry.with_retry(request) == "reply"
+
+
+def test_giving_up_does_not_pause_the_others(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "max_retries", 3)
+    monkeypatch.setattr(settings, "max_retry_wait", 5.0)
+    monkeypatch.setattr(settings, "rate_limit", 0.0)
+    limiter = retry.get_rate_limiter()
+    paused = limiter.paused_until
+
+    def request() -> str:
+        raise Throttled("30")
+
+    with pytest.raises(Throttled):
+        retry.with_retry(request)
+
+    assert limiter.paused_until == paused
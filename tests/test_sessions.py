@@ -0,0 +1,28 @@
+""" Tests of the chat session store """
+
+from pathlib import Path
+import pytest
+from code_star_cli.sessions import Session
+
+
+def test_stored_session_is_opened(tmp_path: Path) -> None:
+    session = Session.create(tmp_path, [{"role": "system", "content": "Hi"}])
+    session.append({"role": "user", "content": "Hello"})
+    session.close()
+
+    assert Session.open(tmp_path, session.id).path == session.path
+    assert Session.open(tmp_path, "last").path == session.path
+
+
+@pytest.mark.parametrize(
+    "session_id", ["../secret", "/etc/passwd", "sub/session", "..", "a.b", ""]
+)
+def test_ids_outside_the_directory_are_rejected(
+    session_id: str, tmp_path: Path
+) -> None:
+    sessions = tmp_path / "sessions"
+    sessions.mkdir()
+    (tmp_path / "secret.jsonl").write_text("{}\n")
+
+    with pytest.raises(ValueError):
+        Session.open(sessions, session_id)